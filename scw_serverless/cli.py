@@ -1,14 +1,23 @@
 import logging
+import os
 from pathlib import Path
-from typing import Optional, cast
+from typing import TYPE_CHECKING, Optional, cast
 
 import click
-from scaleway import ScalewayException
 
-import scw_serverless
-from scw_serverless import app, deployment, loader, local_app, logger
-from scw_serverless.dependencies_manager import DependenciesManager
-from scw_serverless.gateway import GatewayManager, ServerlessGateway
+from scw_serverless import logger
+from scw_serverless.deployment.defaults import (
+    DEFAULT_MAX_UPLOADS,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_REQUESTS_PER_SECOND,
+)
+from scw_serverless.utils.archive import DEFAULT_COMPRESSION_LEVEL, CompressionPolicy
+
+# The Scaleway SDK, the gateways and Flask are slow to import.
+# They are imported by the subcommands which use them.
+if TYPE_CHECKING:
+    from scw_serverless.deployment.package_optimizer import PackageOptimizer
+    from scw_serverless.gateway.gateway_manager import Gateway
 
 CLICK_ARG_FILE = click.argument(
     "file",
@@ -22,6 +31,129 @@ CLICK_ARG_FILE = click.argument(
     ),
 )
 
+CLICK_OPTION_RUNTIME = click.option(
+    "--runtime",
+    default=None,
+    help="Python runtime to deploy with. Uses your Python version by default.",
+)
+
+CLICK_OPTION_SINGLE_SOURCE = click.option(
+    "--single-source",
+    is_flag=True,
+    default=True,
+    help="Remove functions not present in the code being deployed",
+)
+
+CLICK_OPTION_PER_FUNCTION_ARCHIVES = click.option(
+    "--per-function-archives",
+    is_flag=True,
+    default=False,
+    help="Only package the modules and dependencies imported by each function.",
+)
+
+CLICK_OPTION_COMPRESSION_LEVEL = click.option(
+    "--compression-level",
+    type=click.IntRange(0, 9),
+    default=DEFAULT_COMPRESSION_LEVEL,
+    show_default=True,
+    help="Compression level of the deployment archive, from 0 (none) to 9 (best).",
+)
+
+CLICK_OPTION_OPTIMIZE_DEPENDENCIES = click.option(
+    "--optimize-dependencies",
+    is_flag=True,
+    default=False,
+    help="Prune the files of the dependencies not needed at runtime "
+    + "and precompile them for the runtime.",
+)
+
+CLICK_OPTION_PRUNE = click.option(
+    "--prune",
+    multiple=True,
+    metavar="PATTERN",
+    help="Pattern of the files to prune from the dependencies, "
+    + "relative to the package folder. Can be repeated.",
+)
+
+CLICK_OPTION_KEEP = click.option(
+    "--keep",
+    multiple=True,
+    metavar="PATTERN",
+    help="Pattern of the files of the dependencies never pruned. Can be repeated.",
+)
+
+CLICK_OPTION_PRUNE_ROUTES = click.option(
+    "--prune-routes",
+    is_flag=True,
+    default=False,
+    help="Remove the gateway routes not configured by the app. "
+    + "Only use it if the gateway is dedicated to the app.",
+)
+
+CLICK_OPTION_STATIC_DISCOVERY = click.option(
+    "--static-discovery/--no-static-discovery",
+    default=True,
+    show_default=True,
+    help="Read the functions from the source of FILE and reuse the recorded "
+    + "functions while it does not change, instead of running FILE.",
+)
+
+CLICK_OPTION_PROFILE = click.option(
+    "--profile",
+    "-p",
+    default=None,
+    help="Scaleway profile to use when loading credentials.",
+)
+
+CLICK_OPTION_PROJECT_ID = click.option(
+    "--project-id",
+    default=None,
+    help="""API Project ID used for the deployment.
+WARNING: Please use environment variables instead""",
+)
+
+CLICK_OPTION_REGION = click.option(
+    "--region",
+    default=None,
+    help="Region to deploy to.",
+)
+
+
+def get_optimizer(
+    runtime: str, optimize: bool, prune: tuple[str, ...], keep: tuple[str, ...]
+) -> Optional["PackageOptimizer"]:
+    """Get the optimizer of the dependencies, if enabled."""
+    if not optimize:
+        return None
+    from scw_serverless.deployment.package_optimizer import (
+        DEFAULT_PRUNE_PATTERNS,
+        PackageOptimizer,
+        PruneRules,
+    )
+
+    rules = PruneRules(patterns=DEFAULT_PRUNE_PATTERNS + prune, keep=keep)
+    return PackageOptimizer(runtime=runtime, rules=rules)
+
+
+def get_gateway(prune_routes: bool = False) -> "Gateway":
+    """Get the Gateway to apply the routes to.
+
+    The admin API of the gateway is used when scwgw saved its configuration.
+    """
+    from scw_serverless.gateway import KongGateway, ServerlessGateway
+    from scw_serverless.gateway.kong_gateway import GATEWAY_CONFIG_FILE
+
+    if os.path.exists(GATEWAY_CONFIG_FILE):
+        return KongGateway.from_config(GATEWAY_CONFIG_FILE)
+    if prune_routes:
+        # The routes cannot be listed with scwgw
+        raise click.UsageError(
+            "--prune-routes requires the admin API of the gateway, "
+            + "deploy it with: scwgw infra deploy"
+        )
+    logging.debug("Checking for Gateway CLI")
+    return ServerlessGateway()
+
 
 @click.group()
 @click.option("--verbose", is_flag=True, help="Enables verbose mode.")
@@ -43,39 +175,68 @@ def cli(verbose: bool, log_level: str) -> None:
 
 @cli.command()
 @CLICK_ARG_FILE
+@CLICK_OPTION_RUNTIME
+@CLICK_OPTION_SINGLE_SOURCE
+@CLICK_OPTION_PER_FUNCTION_ARCHIVES
+@CLICK_OPTION_COMPRESSION_LEVEL
+@CLICK_OPTION_OPTIMIZE_DEPENDENCIES
+@CLICK_OPTION_PRUNE
+@CLICK_OPTION_KEEP
 @click.option(
-    "--runtime",
-    default=None,
-    help="Python runtime to deploy with. Uses your Python version by default.",
+    "--stream",
+    is_flag=True,
+    default=False,
+    help="Assemble the archive while uploading it, without writing it to disk.",
 )
 @click.option(
-    "--single-source",
-    is_flag=True,
-    default=True,
-    help="Remove functions not present in the code being deployed",
+    "--max-workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_WORKERS,
+    show_default=True,
+    help="Maximum number of functions deployed at the same time.",
 )
 @click.option(
-    "--profile",
-    "-p",
-    default=None,
-    help="Scaleway profile to use when loading credentials.",
+    "--max-uploads",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_UPLOADS,
+    show_default=True,
+    help="Maximum number of archives uploaded at the same time.",
 )
 @click.option(
-    "--project-id",
+    "--max-upload-rate",
+    type=click.FloatRange(min=0, min_open=True),
     default=None,
-    help="""API Project ID used for the deployment.
-WARNING: Please use environment variables instead""",
+    help="Bandwidth shared by the uploads, in MB/s. Unlimited by default.",
 )
 @click.option(
-    "--region",
-    default=None,
-    help="Region to deploy to.",
+    "--max-requests-per-second",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_REQUESTS_PER_SECOND,
+    show_default=True,
+    help="Rate limit of the requests sent to the Scaleway API.",
 )
-# pylint: disable=too-many-arguments
+@CLICK_OPTION_PRUNE_ROUTES
+@CLICK_OPTION_STATIC_DISCOVERY
+@CLICK_OPTION_PROFILE
+@CLICK_OPTION_PROJECT_ID
+@CLICK_OPTION_REGION
+# pylint: disable=too-many-arguments,too-many-locals
 def deploy(
     file: Path,
     runtime: Optional[str],
     single_source: bool,
+    per_function_archives: bool,
+    compression_level: int,
+    optimize_dependencies: bool,
+    prune: tuple[str, ...],
+    keep: tuple[str, ...],
+    stream: bool,
+    max_workers: int,
+    max_uploads: int,
+    max_upload_rate: Optional[float],
+    max_requests_per_second: float,
+    prune_routes: bool,
+    static_discovery: bool,
     profile: Optional[str] = None,
     secret_key: Optional[str] = None,
     project_id: Optional[str] = None,
@@ -88,15 +249,25 @@ def deploy(
     If the credentials are not provided, the credentials will
     be pulled from your Scaleway configuration.
     """
+    from scaleway import ScalewayException
+
+    from scw_serverless import deployment, loader
+    from scw_serverless.dependencies_manager import DependenciesManager
+    from scw_serverless.gateway import GatewayManager
+    from scw_serverless.manifest import MANIFEST_FILE
+
     # Get the serverless App instance
-    app_instance = loader.load_app_instance(file.resolve())
+    app_instance = loader.load_app_instance(
+        file.resolve(),
+        static=static_discovery,
+        manifest_file=MANIFEST_FILE if static_discovery else None,
+    )
 
     # Check if the application requires a Gateway
     needs_gateway = any(function.gateway_route for function in app_instance.functions)
-    gateway = None
+    gateway: Optional["Gateway"] = None
     if needs_gateway:
-        logging.debug("Checking for Gateway CLI")
-        gateway = ServerlessGateway()
+        gateway = get_gateway(prune_routes)
 
     client = deployment.get_scw_client(profile, secret_key, project_id, region)
 
@@ -104,7 +275,7 @@ def deploy(
         runtime = deployment.get_current_runtime()
 
     logging.info("Packaging dependencies...")
-    deps = DependenciesManager(file.parent, Path.cwd())
+    deps = DependenciesManager(file.parent, Path.cwd(), runtime=runtime)
     deps.generate_package_folder()
 
     try:
@@ -113,6 +284,14 @@ def deploy(
             sdk_client=client,
             runtime=runtime,
             single_source=single_source,
+            per_function_archives=per_function_archives,
+            compression=CompressionPolicy(level=compression_level),
+            optimizer=get_optimizer(runtime, optimize_dependencies, prune, keep),
+            stream=stream,
+            max_workers=max_workers,
+            max_uploads=max_uploads,
+            max_upload_rate=max_upload_rate * 1e6 if max_upload_rate else None,
+            max_requests_per_second=max_requests_per_second,
         ).deploy()
     except ScalewayException as e:
         logging.debug(e, exc_info=True)
@@ -126,7 +305,83 @@ def deploy(
             gateway=gateway,
             sdk_client=client,
         )
-        manager.update_routes()
+        manager.update_routes(prune=prune_routes)
+
+
+@cli.command()
+@CLICK_ARG_FILE
+@CLICK_OPTION_RUNTIME
+@CLICK_OPTION_SINGLE_SOURCE
+@CLICK_OPTION_PER_FUNCTION_ARCHIVES
+@CLICK_OPTION_COMPRESSION_LEVEL
+@CLICK_OPTION_OPTIMIZE_DEPENDENCIES
+@CLICK_OPTION_PRUNE
+@CLICK_OPTION_KEEP
+@CLICK_OPTION_PRUNE_ROUTES
+@CLICK_OPTION_STATIC_DISCOVERY
+@CLICK_OPTION_PROFILE
+@CLICK_OPTION_PROJECT_ID
+@CLICK_OPTION_REGION
+# pylint: disable=too-many-arguments,too-many-locals
+def plan(
+    file: Path,
+    runtime: Optional[str],
+    single_source: bool,
+    per_function_archives: bool,
+    compression_level: int,
+    optimize_dependencies: bool,
+    prune: tuple[str, ...],
+    keep: tuple[str, ...],
+    prune_routes: bool,
+    static_discovery: bool,
+    profile: Optional[str] = None,
+    secret_key: Optional[str] = None,
+    project_id: Optional[str] = None,
+    region: Optional[str] = None,
+) -> None:
+    """Show the changes a deployment would make, without deploying.
+
+    FILE is the file containing your functions handlers
+    """
+    from scaleway import ScalewayException
+
+    from scw_serverless import deployment, loader
+    from scw_serverless.dependencies_manager import DependenciesManager
+    from scw_serverless.manifest import MANIFEST_FILE
+
+    app_instance = loader.load_app_instance(
+        file.resolve(),
+        static=static_discovery,
+        manifest_file=MANIFEST_FILE if static_discovery else None,
+    )
+    gateway: Optional["Gateway"] = None
+    if any(function.gateway_route for function in app_instance.functions):
+        # The routes are compared with the routes of the gateway
+        gateway = get_gateway(prune_routes)
+
+    client = deployment.get_scw_client(profile, secret_key, project_id, region)
+
+    if not runtime:
+        runtime = deployment.get_current_runtime()
+
+    # The dependencies are part of the archives which are compared
+    logging.info("Packaging dependencies...")
+    deps = DependenciesManager(file.parent, Path.cwd(), runtime=runtime)
+    deps.generate_package_folder()
+
+    try:
+        deployment.DeploymentManager(
+            app_instance=app_instance,
+            sdk_client=client,
+            runtime=runtime,
+            single_source=single_source,
+            per_function_archives=per_function_archives,
+            compression=CompressionPolicy(level=compression_level),
+            optimizer=get_optimizer(runtime, optimize_dependencies, prune, keep),
+        ).plan(gateway=gateway, prune_routes=prune_routes).echo()
+    except ScalewayException as e:
+        logging.debug(e, exc_info=True)
+        deployment.log_scaleway_exception(e)
 
 
 @cli.command()
@@ -148,6 +403,9 @@ def deploy(
 )
 def dev(file: Path, port: int, debug: bool) -> None:
     """Run functions locally with Serverless Local Testing."""
+    import scw_serverless
+    from scw_serverless import app, loader, local_app
+
     app.Serverless = local_app.ServerlessLocal
     scw_serverless.Serverless = local_app.ServerlessLocal
     app_instance = cast(
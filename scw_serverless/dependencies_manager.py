@@ -1,12 +1,31 @@
+import hashlib
+import json
 import logging
 import os
 import pathlib
+import platform
+import re
+import shutil
 import subprocess
 import sys
-from importlib.metadata import version
-from typing import Optional
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from importlib.metadata import Distribution, distributions, version
+from typing import Any, Optional
+
+from scw_serverless.import_graph import normalize_distribution_name
 
 REQUIREMENTS_NAME = "requirements.txt"
+PACKAGE_FOLDER = "package"
+# Relative to the output path, next to the other build files
+VENDOR_CACHE_FILE = ".scw/dependencies.json"
+WHEELHOUSE_DIR = ".scw/wheelhouse"
+DOWNLOAD_MAX_WORKERS = 8
+# Functions run on x86_64 Linux with glibc 2.28 or later.
+# pip does not expand the PEP 600 tags to the older glibc versions.
+TARGET_PLATFORMS = [f"manylinux_2_{minor}_x86_64" for minor in range(28, 16, -1)] + [
+    "manylinux2014_x86_64"
+]
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +36,16 @@ class DependenciesManager:
     This class looks for a requirements file in a given input path and
     vendors the pip dependencies in a package folder within the provided output path.
 
-    It does not currently handles native dependencies.
+    Wheels are resolved for the runtime of the functions and the platform
+    they run on, instead of the local interpreter. They are downloaded
+    in parallel to a wheelhouse, which is used first on the next runs.
+    If a requirement has no compatible wheel, the requirements are
+    installed for the local interpreter instead.
+
+    The package folder is reused as long as the requirements, the runtime and
+    the platform are unchanged. Otherwise, only the distributions which were
+    added, removed or changed version are installed or uninstalled. When the
+    runtime or the platform change, the package folder is installed again.
 
     .. seealso::
 
@@ -25,14 +53,44 @@ class DependenciesManager:
         <https://developers.scaleway.com/en/products/functions/api/#python-additional-dependencies>
     """
 
-    def __init__(self, in_path: pathlib.Path, out_path: pathlib.Path) -> None:
+    def __init__(
+        self,
+        in_path: pathlib.Path,
+        out_path: pathlib.Path,
+        runtime: Optional[str] = None,
+    ) -> None:
         self.in_path = in_path
         self.out_path = out_path
+        self.runtime = runtime or f"python{sys.version_info[0]}{sys.version_info[1]}"
 
     @property
     def pkg_path(self) -> pathlib.Path:
         """Path to the package directory to vendor the deps into."""
-        return self.out_path.joinpath("package")
+        return self.out_path.joinpath(PACKAGE_FOLDER)
+
+    @property
+    def python_version(self) -> str:
+        """Python version of the runtime, e.g. 3.11 for python311."""
+        match = re.fullmatch(r"python(\d)(\d+)", self.runtime)
+        if not match:
+            raise ValueError(f"Runtime {self.runtime} is not a Python runtime")
+        return f"{match[1]}.{match[2]}"
+
+    @property
+    def wheelhouse_path(self) -> pathlib.Path:
+        """Path to the wheels downloaded for the runtime."""
+        return self.out_path.joinpath(WHEELHOUSE_DIR, self.runtime)
+
+    @property
+    def target_platform(self) -> str:
+        """Platform the dependencies are installed for."""
+        platforms = ",".join(TARGET_PLATFORMS)
+        return f"{platforms}:{sys.platform}:{platform.machine()}"
+
+    @property
+    def cache_path(self) -> pathlib.Path:
+        """Path to the file recording the key of the vendored dependencies."""
+        return self.out_path.joinpath(VENDOR_CACHE_FILE)
 
     def generate_package_folder(self) -> None:
         """Generates a package folder with vendored pip dependencies."""
@@ -64,8 +122,227 @@ class DependenciesManager:
     def _install_requirements(self, requirements_path: pathlib.Path):
         if not self.out_path.is_dir():
             raise ValueError(f"Out_path: {self.out_path.absolute} is not a directory")
-        logging.debug("Install dependencies from requirements to %s", self.pkg_path)
-        self._run_pip_install("-r", str(requirements_path.resolve()))
+        key = self._get_cache_key(requirements_path)
+        state = self._load_cache()
+        if self.pkg_path.is_dir() and state.get("key") == key:
+            logging.debug("Dependencies in %s are up to date", self.pkg_path)
+            return
+
+        # The key is only saved once the package folder is complete
+        self._save_cache(None, state.get("runtime"), state.get("platform"))
+        if self.pkg_path.is_dir() and (
+            state.get("runtime") != self.runtime
+            or state.get("platform") != self.target_platform
+        ):
+            # Native extensions are built for a single interpreter and platform
+            logging.debug(
+                "Dependencies in %s were installed for another runtime", self.pkg_path
+            )
+            shutil.rmtree(self.pkg_path)
+        if self.pkg_path.is_dir():
+            self._update_requirements(requirements_path)
+        else:
+            logging.debug("Install dependencies from requirements to %s", self.pkg_path)
+            self._install("-r", str(requirements_path.resolve()))
+        self._save_cache(key, self.runtime, self.target_platform)
+
+    def _get_cache_key(self, requirements_path: pathlib.Path) -> str:
+        """Hash what determines the vendored dependencies."""
+        digest = hashlib.sha256(requirements_path.read_bytes())
+        digest.update(f"{self.runtime}:{self.target_platform}".encode())
+        return digest.hexdigest()
+
+    def _load_cache(self) -> dict[str, Any]:
+        """Load the key, the runtime and the platform of the package folder."""
+        try:
+            with open(self.cache_path, mode="r", encoding="utf-8") as fp:
+                state = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def _save_cache(
+        self,
+        key: Optional[str],
+        runtime: Optional[str],
+        target_platform: Optional[str],
+    ) -> None:
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_path, mode="w", encoding="utf-8") as fp:
+            json.dump({"key": key, "runtime": runtime, "platform": target_platform}, fp)
+
+    def _update_requirements(self, requirements_path: pathlib.Path) -> None:
+        """Install and uninstall only the distributions which changed."""
+        resolved = self._resolve_requirements("-r", str(requirements_path.resolve()))
+        if (
+            resolved is not None
+            and normalize_distribution_name(__package__) not in resolved
+        ):
+            # The framework is installed separately by _check_for_scw_serverless
+            framework = self._resolve_requirements(
+                f"{__package__}~={version(__package__)}"
+            )
+            resolved = framework | resolved if framework is not None else None
+        if resolved is None:
+            logging.debug("Could not resolve the requirements, reinstalling them")
+            shutil.rmtree(self.pkg_path)
+            self._install("-r", str(requirements_path.resolve()))
+            return
+
+        installed = self._list_installed()
+        for name, dists in list(installed.items()):
+            if [dist.version for dist in dists] == [resolved.get(name)]:
+                continue
+            # Several versions may share files, they are all reinstalled
+            for dist in dists:
+                logging.debug("Uninstalling %s %s", name, dist.version)
+                self._uninstall(dist)
+            del installed[name]
+
+        to_install = [
+            f"{name}=={dist_version}"
+            for name, dist_version in resolved.items()
+            if name not in installed
+        ]
+        if to_install:
+            logging.debug("Installing %s to %s", ", ".join(to_install), self.pkg_path)
+            # Installed aside then merged to preserve shared namespace packages
+            # Staged on the same filesystem, so that files can be renamed
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=self.cache_path.parent) as tmp_dir:
+                self._download_wheels(to_install)
+                self._install_wheels(to_install, target=pathlib.Path(tmp_dir))
+                _merge_tree(pathlib.Path(tmp_dir), self.pkg_path)
+
+    def _get_platform_args(self) -> list[str]:
+        """Get the pip arguments selecting the wheels for the runtime."""
+        args = ["--python-version", self.python_version, "--implementation", "cp"]
+        for target_platform in TARGET_PLATFORMS:
+            args += ["--platform", target_platform]
+        return args + ["--only-binary=:all:"]
+
+    def _get_wheelhouse_args(self) -> list[str]:
+        return ["--no-index", "--find-links", str(self.wheelhouse_path.resolve())]
+
+    def _resolve_requirements(self, *requirements: str) -> Optional[dict[str, str]]:
+        """Get the versions of the distributions to install, if pip can tell.
+
+        The wheelhouse is tried first to avoid querying the index.
+        """
+        for offline in (True, False):
+            if offline and not self.wheelhouse_path.is_dir():
+                continue
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                report_path = os.path.join(tmp_dir, "report.json")
+                try:
+                    self._run_pip_install(
+                        "--dry-run",
+                        "--ignore-installed",
+                        "--report",
+                        report_path,
+                        *(self._get_wheelhouse_args() if offline else []),
+                        *self._get_platform_args(),
+                        *requirements,
+                        target=pathlib.Path(tmp_dir),
+                        log_errors=False,
+                    )
+                    with open(report_path, mode="r", encoding="utf-8") as fp:
+                        report = json.load(fp)
+                except (RuntimeError, OSError, ValueError):
+                    # The report is only available since pip 22.2
+                    continue
+            return {
+                normalize_distribution_name(item["metadata"]["name"]): item["metadata"][
+                    "version"
+                ]
+                for item in report.get("install", [])
+            }
+        return None
+
+    def _list_wheels(self) -> set[str]:
+        """List the distributions in the wheelhouse as name==version."""
+        if not self.wheelhouse_path.is_dir():
+            return set()
+        wheels = set()
+        for wheel in self.wheelhouse_path.glob("*.whl"):
+            name, wheel_version = wheel.name.split("-")[:2]
+            wheels.add(f"{normalize_distribution_name(name)}=={wheel_version}")
+        return wheels
+
+    def _download_wheels(self, specs: list[str]) -> None:
+        """Download the wheels missing from the wheelhouse in parallel."""
+        missing = sorted(set(specs) - self._list_wheels())
+        if not missing:
+            return
+        logging.debug("Downloading %s to %s", ", ".join(missing), self.wheelhouse_path)
+        self.wheelhouse_path.mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_MAX_WORKERS) as executor:
+            for _ in executor.map(
+                lambda spec: self._run_pip(
+                    "download",
+                    "--no-deps",
+                    *self._get_platform_args(),
+                    "--dest",
+                    str(self.wheelhouse_path.resolve()),
+                    spec,
+                ),
+                missing,
+            ):
+                pass
+
+    def _install_wheels(self, specs: list[str], target: pathlib.Path) -> None:
+        """Install the wheels from the wheelhouse."""
+        self._run_pip_install(
+            "--no-deps",
+            *self._get_wheelhouse_args(),
+            *self._get_platform_args(),
+            *specs,
+            target=target,
+        )
+
+    def _install(self, *requirements: str) -> None:
+        """Install requirements and their dependencies in the package folder."""
+        resolved = self._resolve_requirements(*requirements)
+        if resolved is None:
+            logging.warning(
+                "Could not find wheels for %s, installing %s for the local Python",
+                self.runtime,
+                " ".join(requirements),
+            )
+            self._run_pip_install(*requirements)
+            return
+        specs = [f"{name}=={dist_version}" for name, dist_version in resolved.items()]
+        self._download_wheels(specs)
+        self._install_wheels(specs, target=self.pkg_path)
+
+    def _list_installed(self) -> dict[str, list[Distribution]]:
+        installed: dict[str, list[Distribution]] = {}
+        for dist in distributions(path=[str(self.pkg_path)]):
+            installed.setdefault(
+                normalize_distribution_name(dist.metadata["Name"]), []
+            ).append(dist)
+        return installed
+
+    def _uninstall(self, dist: Distribution) -> None:
+        """Remove the files of a distribution listed in its RECORD."""
+        directories = set()
+        for file in dist.files or []:
+            path = self.pkg_path.joinpath(file)
+            directories.add(path.parent)
+            if path.is_file() or path.is_symlink():
+                path.unlink()
+            if path.suffix == ".py":
+                # Bytecode compiled after the installation is not recorded
+                for compiled in path.parent.glob(f"__pycache__/{path.stem}.*.pyc"):
+                    directories.add(compiled.parent)
+                    compiled.unlink()
+        # Remove the directories left empty, deepest first
+        for directory in sorted(directories, key=lambda d: len(d.parts), reverse=True):
+            while directory != self.pkg_path and directory.is_dir():
+                if any(directory.iterdir()):
+                    break
+                directory.rmdir()
+                directory = directory.parent
 
     def _check_for_scw_serverless(self):
         """Checks for scw_serverless after vendoring the dependencies."""
@@ -75,19 +352,22 @@ class DependenciesManager:
         ):
             # Installs the current version with pip
             logging.debug("Installing %s from pip to %s", __package__, self.pkg_path)
-            self._run_pip_install(f"{__package__}~={version(__package__)}")
+            self._install(f"{__package__}~={version(__package__)}")
+
+    def _run_pip_install(
+        self,
+        *args: str,
+        target: Optional[pathlib.Path] = None,
+        log_errors: bool = True,
+    ):
+        target = target or self.pkg_path
+        self._run_pip(
+            "install", *args, "--target", str(target.resolve()), log_errors=log_errors
+        )
 
-    def _run_pip_install(self, *args: str):
+    def _run_pip(self, *args: str, log_errors: bool = True):
         python_path = sys.executable
-        command = [
-            python_path,
-            "-m",
-            "pip",
-            "install",
-            *args,
-            "--target",
-            str(self.pkg_path.resolve()),
-        ]
+        command = [python_path, "-m", "pip", *args]
 
         try:
             subprocess.run(
@@ -98,6 +378,20 @@ class DependenciesManager:
                 cwd=str(self.out_path.resolve()),
             )
         except subprocess.CalledProcessError as e:
-            logger.debug(e, exc_info=True)
-            logger.error("Error when running: %s", " ".join(command))
+            if log_errors:
+                logger.debug(e, exc_info=True)
+                logger.error("Error when running: %s", " ".join(command))
             raise RuntimeError(e.stderr) from e
+
+
+def _merge_tree(source: pathlib.Path, destination: pathlib.Path) -> None:
+    """Move the files of source into destination, replacing existing ones.
+
+    Files are copied when source is on another filesystem.
+    """
+    for path in source.rglob("*"):
+        if path.is_dir():
+            continue
+        target = destination.joinpath(path.relative_to(source))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(path, target)
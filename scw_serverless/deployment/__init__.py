@@ -1,4 +1,23 @@
-from .client import get_scw_client as get_scw_client
-from .deployment_manager import DeploymentManager as DeploymentManager
-from .exceptions import log_scaleway_exception as log_scaleway_exception
-from .runtime import get_current_runtime as get_current_runtime
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .client import get_scw_client as get_scw_client
+    from .deployment_manager import DeploymentManager as DeploymentManager
+    from .exceptions import log_scaleway_exception as log_scaleway_exception
+    from .runtime import get_current_runtime as get_current_runtime
+
+# The submodules import the Scaleway SDK, they are imported on first use
+_EXPORTS = {
+    "get_scw_client": "client",
+    "DeploymentManager": "deployment_manager",
+    "log_scaleway_exception": "exceptions",
+    "get_current_runtime": "runtime",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_EXPORTS[name]}", __name__)
+    return getattr(module, name)
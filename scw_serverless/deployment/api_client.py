@@ -0,0 +1,219 @@
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import requests
+import scaleway.function.v1beta1 as sdk
+from requests.adapters import HTTPAdapter
+from scaleway import Client
+from scaleway_core.api import Body, Params
+from urllib3 import BaseHTTPResponse
+from urllib3.util.retry import Retry
+
+from scw_serverless.deployment.defaults import DEFAULT_REQUESTS_PER_SECOND
+from scw_serverless.utils.rate_limit import TokenBucket
+
+DEFAULT_POOL_SIZE = 10
+# Methods which can be sent again without side effects
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Rejected requests were not processed and can always be sent again
+RETRY_ANY_METHOD_STATUSES = {429}
+RETRY_IDEMPOTENT_STATUSES = {500, 502, 503, 504}
+
+
+def create_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """Create a session keeping up to pool_size connections open per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@dataclass
+class APIStats:
+    """Counters of the requests sent to the API."""
+
+    calls: int = 0
+    retries: int = 0
+    throttled_seconds: float = 0.0
+    lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False
+    )
+
+    def add(self, calls: int = 0, retries: int = 0, throttled: float = 0.0) -> None:
+        """Increment the counters."""
+        with self.lock:
+            self.calls += calls
+            self.retries += retries
+            self.throttled_seconds += throttled
+
+
+class APIRetry(Retry):
+    """How failed requests to the API are retried.
+
+    Requests throttled by the API were not processed and are retried whatever
+    their method, the other failures only for idempotent methods.
+    The delay requested by the Retry-After header is honored, otherwise
+    the delay grows exponentially, with jitter.
+
+    :param rate_limit: rate limit the retries wait for, like the other requests
+    :param stats: counters updated with the retries
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        rate_limit: Optional[TokenBucket] = None,
+        stats: Optional[APIStats] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.rate_limit = rate_limit
+        self.stats = stats
+
+    def new(self, **kw: Any) -> "APIRetry":
+        kw.setdefault("rate_limit", self.rate_limit)
+        kw.setdefault("stats", self.stats)
+        return super().new(**kw)
+
+    def is_retry(
+        self, method: str, status_code: int, has_retry_after: bool = False
+    ) -> bool:
+        if status_code in RETRY_ANY_METHOD_STATUSES:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def increment(self, *args: Any, **kwargs: Any) -> "APIRetry":
+        # Raises when the request is not sent again
+        retry = super().increment(*args, **kwargs)
+        if self.stats:
+            self.stats.add(calls=1, retries=1)
+        method, url, error, status, _ = retry.history[-1]
+        logging.debug("Retrying %s %s (%s)", method, url, status or error)
+        return retry
+
+    def sleep(self, response: Optional[BaseHTTPResponse] = None) -> None:
+        started_at = time.monotonic()
+        super().sleep(response)
+        if self.rate_limit:
+            self.rate_limit.acquire()
+        if self.stats:
+            self.stats.add(throttled=time.monotonic() - started_at)
+
+
+DEFAULT_RETRY = APIRetry(
+    total=5,
+    allowed_methods=IDEMPOTENT_METHODS,
+    status_forcelist=RETRY_IDEMPOTENT_STATUSES,
+    backoff_factor=0.5,
+    backoff_max=30.0,
+    backoff_jitter=0.5,
+    # The SDK raises the error of the last response
+    raise_on_status=False,
+)
+
+
+class APIAdapter(HTTPAdapter):
+    """Adapter rate limiting and retrying the requests sent to the API.
+
+    :param rate_limit: rate limit shared by all the threads
+    :param stats: counters updated with the requests
+    :param retry: how failed requests are retried
+    """
+
+    def __init__(
+        self,
+        rate_limit: Optional[TokenBucket],
+        stats: APIStats,
+        retry: APIRetry = DEFAULT_RETRY,
+        pool_size: int = DEFAULT_POOL_SIZE,
+    ) -> None:
+        self.rate_limit = rate_limit
+        self.stats = stats
+        super().__init__(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry.new(rate_limit=rate_limit, stats=stats),
+        )
+
+    def send(  # type: ignore # pylint: disable=arguments-differ
+        self, request: requests.PreparedRequest, **kwargs: Any
+    ) -> requests.Response:
+        throttled = self.rate_limit.acquire() if self.rate_limit else 0.0
+        self.stats.add(calls=1, throttled=throttled)
+        return super().send(request, **kwargs)
+
+
+class SessionFunctionAPI(sdk.FunctionV1Beta1API):
+    """Functions API sending its requests through a shared session.
+
+    The SDK opens a new connection for every request,
+    this reuses the connections across requests and threads.
+    Requests are rate limited and retried by an APIAdapter,
+    mounted on the session for the URL of the API only.
+
+    :param requests_per_second: rate limit shared by all the threads
+    :param retry: how failed requests are retried
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        session: Optional[requests.Session] = None,
+        requests_per_second: Optional[float] = DEFAULT_REQUESTS_PER_SECOND,
+        retry: APIRetry = DEFAULT_RETRY,
+        pool_size: int = DEFAULT_POOL_SIZE,
+    ) -> None:
+        super().__init__(client)
+        self.session = session or create_session(pool_size)
+        self.stats = APIStats()
+        self.session.mount(
+            self.client.api_url,
+            APIAdapter(
+                TokenBucket(requests_per_second) if requests_per_second else None,
+                self.stats,
+                retry=retry,
+                pool_size=pool_size,
+            ),
+        )
+
+    # pylint: disable=dangerous-default-value # same signature as the SDK
+    def _request(
+        self,
+        method: str,
+        path: str,
+        params: Params = {},
+        headers: Dict[str, str] = {},
+        body: Optional[Body] = None,
+    ) -> requests.Response:
+        # Same request as the SDK, which test_api_client checks
+        method = method.upper()
+        additional_headers: Dict[str, str] = {}
+        if method in ("POST", "PUT", "PATCH"):
+            additional_headers["Content-Type"] = "application/json; charset=utf-8"
+            if body is None:
+                body = {}
+        raw_body = json.dumps(body) if body is not None else None
+
+        params = {k: str(v) for k, v in params.items() if v is not None}
+        headers = {
+            "accept": "application/json",
+            "x-auth-token": self.client.secret_key or "",
+            "user-agent": self.client.user_agent,
+            **additional_headers,
+            **headers,
+        }
+        url = f"{self.client.api_url}{path}"
+        logging.debug("%s %s", method, url)
+        return self.session.request(
+            method=method,
+            url=url,
+            params=params,
+            headers=headers,
+            data=raw_body,
+            verify=not self.client.api_allow_insecure,
+        )
@@ -1,47 +1,243 @@
+import json
 import logging
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Optional
 
-from scaleway import ScalewayException, WaitForOptions
+from scaleway import ScalewayException
 from scaleway.function import v1beta1 as sdk
+from scaleway.function.v1beta1.content import (
+    CRON_TRANSIENT_STATUSES,
+    FUNCTION_TRANSIENT_STATUSES,
+    NAMESPACE_TRANSIENT_STATUSES,
+)
 
 from scw_serverless.app import Serverless
 from scw_serverless.config import Function
 from scw_serverless.config.triggers import CronTrigger
+from scw_serverless.deployment.digest import (
+    DIGEST_ENV_VAR,
+    NAMESPACE_DIGEST_ENV_VAR,
+    salted_secrets_digest,
+    secrets_match_digest,
+)
+from scw_serverless.deployment.status_poller import PollingOptions, StatusPoller
 
 DEPLOY_TIMEOUT = 600
+INVENTORY_MAX_WORKERS = 10
+
+
+def _canonical_json(args: Optional[dict[str, Any]]) -> str:
+    """Serialize cron arguments so that equivalent arguments compare equal."""
+    return json.dumps(args or {}, sort_keys=True, separators=(",", ":"))
+
+
+@dataclass
+class NamespaceInventory:
+    """Snapshot of the functions and crons deployed in a namespace."""
+
+    namespace_id: str
+    functions: list[sdk.Function] = field(default_factory=list)
+    crons: list[sdk.Cron] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self.functions_by_name = {
+            function.name: function for function in self.functions
+        }
+        self.functions_by_id = {function.id: function for function in self.functions}
+        self.crons_by_id = {cron.id: cron for cron in self.crons}
+        self._crons_by_name = {
+            (cron.function_id, cron.name): cron for cron in self.crons
+        }
+
+    def find_function(self, name: str) -> Optional[sdk.Function]:
+        """Find a deployed function given its name."""
+        return self.functions_by_name.get(name)
+
+    def find_cron(self, function_id: str, name: str) -> Optional[sdk.Cron]:
+        """Find a deployed cron of a function given its name."""
+        return self._crons_by_name.get((function_id, name))
+
+    def get_stale_resources(
+        self, function_ids: Iterable[str], cron_ids: Iterable[str]
+    ) -> tuple[list[sdk.Function], list[sdk.Cron]]:
+        """Get the functions and crons to delete to only keep the given ones.
+
+        Crons of stale functions are left out, they are deleted with their function.
+        """
+        function_ids, cron_ids = set(function_ids), set(cron_ids)
+        stale_functions = [
+            function for function in self.functions if function.id not in function_ids
+        ]
+        stale_function_ids = {function.id for function in stale_functions}
+        stale_crons = [
+            cron
+            for cron in self.crons
+            if cron.id not in cron_ids and cron.function_id not in stale_function_ids
+        ]
+        return stale_functions, stale_crons
+
+
+@dataclass
+class CleanupSummary:
+    """Names of the resources removed from a namespace."""
+
+    functions: list[str] = field(default_factory=list)
+    crons: list[str] = field(default_factory=list)
+    already_deleted: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+
+    def add(self, name: str, kind: str, deleted: bool) -> None:
+        """Record the deletion of a resource."""
+        if not deleted:
+            self.already_deleted.append(name)
+        elif kind == "function":
+            self.functions.append(name)
+        else:
+            self.crons.append(name)
+
+    def __str__(self) -> str:
+        return (
+            f"Removed {len(self.functions)} functions and {len(self.crons)} crons"
+            + f" ({len(self.already_deleted)} already removed)"
+        )
 
 
 class FunctionAPIWrapper:
-    """Wraps the Scaleway Python SDK with the Framework types."""
+    """Wraps the Scaleway Python SDK with the Framework types.
+
+    Statuses are polled in batches: the functions of a namespace
+    and the crons of a function are listed once for all their waiters.
+    """
 
-    def __init__(self, api: sdk.FunctionV1Beta1API) -> None:
+    def __init__(
+        self,
+        api: sdk.FunctionV1Beta1API,
+        polling: PollingOptions = PollingOptions(timeout=DEPLOY_TIMEOUT),
+    ) -> None:
         self.api = api
+        self.polling = polling
+        self._pollers: dict[tuple[str, str], StatusPoller] = {}
+        self._pollers_lock = threading.Lock()
+
+    def _wait_for(
+        self,
+        key: tuple[str, str],
+        resource_id: str,
+        list_resources: Callable[[], Iterable[Any]],
+        is_final: Callable[[Any], bool],
+    ) -> Any:
+        with self._pollers_lock:
+            if key not in self._pollers:
+                self._pollers[key] = StatusPoller(
+                    list_resources, is_final, self.polling
+                )
+            poller = self._pollers[key]
+        return poller.wait(resource_id)
+
+    def wait_for_namespace(self, namespace_id: str) -> sdk.Namespace:
+        """Wait for a namespace to be in a final state."""
+        return self._wait_for(
+            ("namespace", namespace_id),
+            namespace_id,
+            lambda: [self.api.get_namespace(namespace_id=namespace_id)],
+            lambda namespace: namespace.status not in NAMESPACE_TRANSIENT_STATUSES,
+        )
+
+    def wait_for_function(self, namespace_id: str, function_id: str) -> sdk.Function:
+        """Wait for a function to be in a final state."""
+        return self._wait_for(
+            ("functions", namespace_id),
+            function_id,
+            lambda: self.api.list_functions_all(namespace_id=namespace_id),
+            lambda function: function.status not in FUNCTION_TRANSIENT_STATUSES,
+        )
+
+    def wait_for_cron(self, function_id: str, cron_id: str) -> sdk.Cron:
+        """Wait for a cron to be in a final state."""
+        return self._wait_for(
+            ("crons", function_id),
+            cron_id,
+            lambda: self.api.list_crons_all(function_id=function_id),
+            lambda cron: cron.status not in CRON_TRANSIENT_STATUSES,
+        )
 
     def find_deployed_namespace(
-        self, app_instance: Serverless
+        self, app_instance: Serverless, namespace_id: Optional[str] = None
     ) -> Optional[sdk.Namespace]:
-        """Find a deployed namespace given its name."""
+        """Find a deployed namespace given its name.
+
+        :param namespace_id: id of the namespace, if known. The namespace is
+            looked up by name if it no longer exists or was renamed.
+        """
+        if namespace_id:
+            try:
+                namespace = self.api.get_namespace(namespace_id=namespace_id)
+                if namespace.name == app_instance.service_name:
+                    return namespace
+            except ScalewayException as e:
+                if e.status_code != 404:
+                    raise e
+            logging.debug("Namespace %s not found, listing namespaces", namespace_id)
         candidates = self.api.list_namespaces_all(name=app_instance.service_name)
         return candidates[0] if candidates else None
 
-    def find_deployed_function(
-        self, namespace_id: str, function: Function
-    ) -> Optional[sdk.Function]:
-        """Find a deployed function given its name."""
-        candidates = self.api.list_functions_all(
-            namespace_id=namespace_id, name=function.name
+    def list_inventory(
+        self, namespace_id: str, with_crons: Optional[Iterable[str]] = None
+    ) -> NamespaceInventory:
+        """List the functions of a namespace and their crons.
+
+        Crons can only be listed by function, they are listed concurrently.
+
+        :param with_crons: names of the functions whose crons are listed.
+            The crons of all the functions are listed by default.
+        """
+        functions = self.api.list_functions_all(namespace_id=namespace_id)
+        if with_crons is not None:
+            names = set(with_crons)
+            with_crons_functions = [fn for fn in functions if fn.name in names]
+        else:
+            with_crons_functions = functions
+        with ThreadPoolExecutor(max_workers=INVENTORY_MAX_WORKERS) as executor:
+            crons_by_function = executor.map(
+                lambda function: self.api.list_crons_all(function_id=function.id),
+                with_crons_functions,
+            )
+            crons = [cron for crons in crons_by_function for cron in crons]
+        return NamespaceInventory(
+            namespace_id=namespace_id, functions=functions, crons=crons
         )
-        return candidates[0] if candidates else None
 
-    def find_deployed_cron_trigger(
-        self, function_id: str, trigger: CronTrigger
-    ) -> Optional[sdk.Cron]:
-        """Find a deployed trigger given its name."""
-        deployed_trigger = None
-        for cron in self.api.list_crons_all(function_id=function_id):
-            if cron.name == trigger.name:
-                deployed_trigger = cron
-        return deployed_trigger
+    def get_inventory(
+        self, namespace_id: str, function_ids: Iterable[str], cron_ids: Iterable[str]
+    ) -> Optional[NamespaceInventory]:
+        """Get known functions and crons of a namespace by id, concurrently.
+
+        :returns: None if one of them no longer exists in the namespace
+        """
+        with ThreadPoolExecutor(max_workers=INVENTORY_MAX_WORKERS) as executor:
+            functions_future = executor.map(
+                lambda function_id: self.api.get_function(function_id=function_id),
+                function_ids,
+            )
+            crons_future = executor.map(
+                lambda cron_id: self.api.get_cron(cron_id=cron_id), cron_ids
+            )
+            try:
+                functions, crons = list(functions_future), list(crons_future)
+            except ScalewayException as e:
+                if e.status_code != 404:
+                    raise e
+                return None
+        if any(function.namespace_id != namespace_id for function in functions):
+            return None
+        found_ids = {function.id for function in functions}
+        if any(cron.function_id not in found_ids for cron in crons):
+            return None
+        return NamespaceInventory(
+            namespace_id=namespace_id, functions=functions, crons=crons
+        )
 
     def _get_secrets_from_dict(
         self, secrets: Optional[dict[str, str]]
@@ -50,16 +246,42 @@ class FunctionAPIWrapper:
             return None
         return [sdk.Secret(key=key, value=val) for key, val in secrets.items()]
 
+    def _get_namespace_environment_variables(
+        self, app_instance: Serverless
+    ) -> dict[str, str]:
+        # The secrets are not returned by the API, their digest is stored instead
+        return (app_instance.env or {}) | {
+            NAMESPACE_DIGEST_ENV_VAR: salted_secrets_digest(app_instance.secret)
+        }
+
+    def is_namespace_up_to_date(
+        self, deployed_namespace: sdk.Namespace, app_instance: Serverless
+    ) -> bool:
+        """Check if the deployed namespace matches the app configuration."""
+        if deployed_namespace.status != sdk.NamespaceStatus.READY:
+            return False
+        environment_variables = dict(deployed_namespace.environment_variables or {})
+        digest = environment_variables.pop(NAMESPACE_DIGEST_ENV_VAR, "")
+        deployed_secrets = deployed_namespace.secret_environment_variables or []
+        return (
+            environment_variables == (app_instance.env or {})
+            and {secret.key for secret in deployed_secrets}
+            == set(app_instance.secret or {})
+            and secrets_match_digest(app_instance.secret, digest)
+        )
+
     def create_namespace(self, app_instance: Serverless) -> sdk.Namespace:
         """Create a namespace."""
         namespace = self.api.create_namespace(
             name=app_instance.service_name,
-            environment_variables=app_instance.env,
+            environment_variables=self._get_namespace_environment_variables(
+                app_instance
+            ),
             secret_environment_variables=self._get_secrets_from_dict(
                 app_instance.secret
             ),
         )
-        return self.api.wait_for_namespace(namespace_id=namespace.id)
+        return self.wait_for_namespace(namespace_id=namespace.id)
 
     def update_namespace(
         self, namespace_id: str, app_instance: Serverless
@@ -67,54 +289,106 @@ class FunctionAPIWrapper:
         """Update a namespace."""
         namespace = self.api.update_namespace(
             namespace_id=namespace_id,
-            environment_variables=app_instance.env,
+            environment_variables=self._get_namespace_environment_variables(
+                app_instance
+            ),
             secret_environment_variables=self._get_secrets_from_dict(
                 app_instance.secret
             ),
         )
-        return self.api.wait_for_namespace(namespace_id=namespace.id)
+        return self.wait_for_namespace(namespace_id=namespace.id)
+
+    def _get_function_payload(
+        self,
+        function: Function,
+        runtime: sdk.FunctionRuntime,
+        digest: Optional[str] = None,
+    ) -> dict[str, Any]:
+        environment_variables = function.environment_variables
+        if digest is not None:
+            environment_variables = (environment_variables or {}) | {
+                DIGEST_ENV_VAR: digest
+            }
+        return {
+            "runtime": runtime,
+            "privacy": sdk.FunctionPrivacy(function.privacy),
+            "http_option": sdk.FunctionHttpOption(function.http_option),
+            "environment_variables": environment_variables,
+            "min_scale": function.min_scale,
+            "max_scale": function.max_scale,
+            "memory_limit": function.memory_limit,
+            "timeout": function.timeout,
+            "handler": function.handler_path,
+            "description": function.description,
+            "secret_environment_variables": self._get_secrets_from_dict(
+                function.secret_environment_variables
+            ),
+        }
+
+    def is_function_up_to_date(
+        self,
+        deployed_function: sdk.Function,
+        function: Function,
+        runtime: sdk.FunctionRuntime,
+        digest: str,
+    ) -> bool:
+        """Check if the deployed function matches what would be deployed.
+
+        The digest covers the code and the secrets which cannot be compared.
+        """
+        if deployed_function.status != sdk.FunctionStatus.READY:
+            return False
+        payload = self._get_function_payload(function, runtime, digest)
+        secrets = payload.pop("secret_environment_variables") or []
+        deployed_secrets = deployed_function.secret_environment_variables or []
+        if {secret.key for secret in secrets} != {
+            secret.key for secret in deployed_secrets
+        }:
+            return False
+        return all(
+            # Unset parameters are left untouched by updates
+            value is None or getattr(deployed_function, key) == value
+            for key, value in payload.items()
+        )
+
+    def is_cron_up_to_date(self, deployed_cron: sdk.Cron, trigger: CronTrigger) -> bool:
+        """Check if the deployed cron matches the trigger."""
+        return (
+            deployed_cron.name == trigger.name
+            and deployed_cron.schedule == trigger.schedule
+            and _canonical_json(deployed_cron.args) == _canonical_json(trigger.args)
+        )
 
     def create_function(
-        self, namespace_id: str, function: Function, runtime: sdk.FunctionRuntime
+        self,
+        namespace_id: str,
+        function: Function,
+        runtime: sdk.FunctionRuntime,
+        digest: Optional[str] = None,
     ) -> sdk.Function:
         """Create a function."""
         return self.api.create_function(
             namespace_id=namespace_id,
-            runtime=runtime,
-            privacy=sdk.FunctionPrivacy(function.privacy),
-            http_option=sdk.FunctionHttpOption(function.http_option),
             name=function.name,
-            environment_variables=function.environment_variables,
-            min_scale=function.min_scale,
-            max_scale=function.max_scale,
-            memory_limit=function.memory_limit,
-            timeout=function.timeout,
-            handler=function.handler_path,
-            description=function.description,
-            secret_environment_variables=self._get_secrets_from_dict(
-                function.secret_environment_variables
-            ),
+            **self._get_function_payload(function, runtime, digest),
         )
 
     def update_function(
-        self, function_id: str, function: Function, runtime: sdk.FunctionRuntime
+        self,
+        function_id: str,
+        function: Function,
+        runtime: sdk.FunctionRuntime,
+        digest: Optional[str] = None,
+        redeploy: Optional[bool] = None,
     ) -> sdk.Function:
-        """Update a function."""
+        """Update a function.
+
+        :param redeploy: whether the function is deployed again with the changes
+        """
         return self.api.update_function(
             function_id=function_id,
-            runtime=runtime,
-            privacy=sdk.FunctionPrivacy(function.privacy),
-            http_option=sdk.FunctionHttpOption(function.http_option),
-            environment_variables=function.environment_variables,
-            min_scale=function.min_scale,
-            max_scale=function.max_scale,
-            memory_limit=function.memory_limit,
-            timeout=function.timeout,
-            handler=function.handler_path,
-            description=function.description,
-            secret_environment_variables=self._get_secrets_from_dict(
-                function.secret_environment_variables
-            ),
+            redeploy=redeploy,
+            **self._get_function_payload(function, runtime, digest),
         )
 
     def get_upload_url(self, function_id: str, zip_size: int) -> str:
@@ -123,12 +397,11 @@ class FunctionAPIWrapper:
             function_id=function_id, content_length=zip_size
         ).url
 
-    def deploy_function(self, function_id: str) -> sdk.Function:
+    def deploy_function(self, namespace_id: str, function_id: str) -> sdk.Function:
         """Deploy a function."""
         self.api.deploy_function(function_id=function_id)
-        return self.api.wait_for_function(
-            function_id=function_id,
-            options=WaitForOptions(timeout=DEPLOY_TIMEOUT),
+        return self.wait_for_function(
+            namespace_id=namespace_id, function_id=function_id
         )
 
     def create_cron_trigger(self, function_id: str, trigger: CronTrigger) -> sdk.Cron:
@@ -139,50 +412,68 @@ class FunctionAPIWrapper:
             name=trigger.name,
             args=trigger.args,
         )
-        return self.api.wait_for_cron(cron_id=cron.id)
+        return self.wait_for_cron(function_id=function_id, cron_id=cron.id)
 
-    def update_cron_trigger(self, function_id: str, trigger: CronTrigger) -> sdk.Cron:
-        """Update a Cron."""
-        cron = self.api.create_cron(
+    def update_cron_trigger(
+        self, function_id: str, cron_id: str, trigger: CronTrigger
+    ) -> sdk.Cron:
+        """Update a Cron in place."""
+        cron = self.api.update_cron(
+            cron_id=cron_id,
             function_id=function_id,
             schedule=trigger.schedule,
             name=trigger.name,
             args=trigger.args,
         )
-        return self.api.wait_for_cron(cron_id=cron.id)
+        return self.wait_for_cron(function_id=function_id, cron_id=cron.id)
 
-    def delete_all_functions_from_ns_except(
-        self, namespace_id: str, function_ids: list[str]
-    ) -> None:
-        """Delete all functions from a namespace expect function_ids."""
-        for function in self.api.list_functions_all(namespace_id=namespace_id):
-            if function.id in function_ids:
-                continue
+    def _delete(self, resource: Any, kind: str) -> bool:
+        """Delete a resource, returns False if it was already deleted."""
+        logging.info("Deleting %s %s...", kind, resource.name)
+        try:
+            if kind == "function":
+                self.api.delete_function(function_id=resource.id)
+            else:
+                self.api.delete_cron(cron_id=resource.id)
+        except ScalewayException as e:
+            if e.status_code == 404:
+                return False
+            raise e
+        return True
 
-            logging.info("Deleting function %s...", function.name)
+    def delete_all_from_ns_except(
+        self,
+        inventory: NamespaceInventory,
+        function_ids: Iterable[str],
+        cron_ids: Iterable[str],
+        max_workers: int = INVENTORY_MAX_WORKERS,
+    ) -> CleanupSummary:
+        """Delete all functions and crons from a namespace expect the given ones.
 
-            try:
-                self.api.delete_function(function_id=function.id)
-            except ScalewayException as e:
-                if e.status_code == 404:
-                    return
-                raise e
+        Resources are deleted concurrently, errors are raised once all were tried.
+        """
+        stale_functions, stale_crons = inventory.get_stale_resources(
+            function_ids, cron_ids
+        )
 
-    def delete_all_crons_from_ns_except(
-        self, namespace_id: str, cron_ids: list[str]
-    ) -> None:
-        """Delete all crons from a namespace expect cron_ids."""
-        for function in self.api.list_functions_all(namespace_id=namespace_id):
-            to_be_removed = [
-                cron
-                for cron in self.api.list_crons_all(function_id=function.id)
-                if cron.id not in cron_ids
-            ]
-            for cron in to_be_removed:
-                logging.info("Deleting cron %s...", cron.name)
+        summary = CleanupSummary()
+        errors: list[Exception] = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self._delete, resource, kind): (resource, kind)
+                for kind, resources in (
+                    ("function", stale_functions),
+                    ("cron", stale_crons),
+                )
+                for resource in resources
+            }
+            for future, (resource, kind) in futures.items():
                 try:
-                    self.api.delete_cron(cron_id=cron.id)
-                except ScalewayException as e:
-                    if e.status_code == 404:
-                        return
-                    raise e
+                    summary.add(resource.name, kind, deleted=future.result())
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logging.error("Could not delete %s %s: %s", kind, resource.name, e)
+                    summary.failed.append(resource.name)
+                    errors.append(e)
+        if errors:
+            raise errors[0]
+        return summary
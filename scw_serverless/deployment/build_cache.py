@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Callable, Iterable, Optional, cast
+from zipfile import ZIP_STORED
+
+from scw_serverless.utils.archive import (
+    COPY_BUFFER_SIZE,
+    ArchiveStream,
+    CompressionPolicy,
+    ZipEntry,
+    archive_digest,
+    archive_size,
+    compress_file,
+    list_archive_files,
+    normalize_mode,
+    write_archive,
+)
+
+INDEX_NAME = "index.json"
+OBJECTS_DIR = "objects"
+
+
+@dataclass
+class DeploymentArchive:
+    """Archive containing the code to deploy.
+
+    The archive is reproducible: the same files always produce the same digest.
+    If path is not set, the archive is streamed from its entries when opened.
+    """
+
+    path: Optional[str]
+    size: int
+    digest: str
+    entries: list[ZipEntry] = field(default_factory=list, repr=False)
+
+    @staticmethod
+    def from_entries(
+        entries: list[ZipEntry], path: Optional[str] = None
+    ) -> "DeploymentArchive":
+        """Describe the archive made of the entries."""
+        return DeploymentArchive(
+            path=path,
+            size=archive_size(entries),
+            digest=archive_digest(entries),
+            entries=entries,
+        )
+
+    def open(self) -> BinaryIO:
+        """Open the archive for reading."""
+        if self.path:
+            return open(self.path, mode="rb")
+        return cast(BinaryIO, ArchiveStream(self.entries))
+
+
+class BuildCache:
+    """Content-addressed cache of compressed archive members.
+
+    Files are indexed by their path, size and modification time so that
+    unchanged files are neither hashed nor compressed again.
+    Their compressed data is stored under the hash of their content
+    and copied as-is when assembling the archive.
+
+    :param policy: how the members are compressed
+    :param max_workers: number of threads compressing the members
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        policy: Optional[CompressionPolicy] = None,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.policy = policy or CompressionPolicy()
+        self.max_workers = max_workers
+        self.index: dict[str, dict[str, Any]] = self._load_index()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def index_path(self) -> str:
+        """Path to the index of the files that were already processed."""
+        return os.path.join(self.cache_dir, INDEX_NAME)
+
+    @property
+    def objects_path(self) -> str:
+        """Path to the directory containing the compressed members."""
+        return os.path.join(self.cache_dir, OBJECTS_DIR)
+
+    def _load_index(self) -> dict[str, dict[str, Any]]:
+        try:
+            with open(self.index_path, mode="r", encoding="utf-8") as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def _object_path(self, object_name: str) -> str:
+        return os.path.join(self.objects_path, object_name)
+
+    def save(self) -> None:
+        """Save the index and remove the objects which are no longer referenced."""
+        os.makedirs(self.objects_path, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as fp:
+            json.dump(self.index, fp)
+        os.replace(tmp_path, self.index_path)
+
+        referenced = {cached.get("object") for cached in self.index.values()}
+        for object_name in os.listdir(self.objects_path):
+            if object_name not in referenced:
+                os.remove(self._object_path(object_name))
+
+    def _get_compression(self, arcname: str) -> tuple[int, Optional[int]]:
+        """Get the compression method and level of a member."""
+        compress_type = self.policy.get_compress_type(arcname)
+        if compress_type == ZIP_STORED:
+            return compress_type, None
+        return compress_type, self.policy.level
+
+    def _is_cached(self, arcname: str, stat: os.stat_result) -> bool:
+        cached = self.index.get(arcname)
+        return bool(
+            cached
+            and cached.get("sha256")
+            and cached["size"] == stat.st_size
+            and cached["mtime_ns"] == stat.st_mtime_ns
+            and (cached["compress_type"], cached["level"])
+            == self._get_compression(arcname)
+            and os.path.exists(self._object_path(cached["object"]))
+        )
+
+    def _get_entry(self, arcname: str, stat: os.stat_result) -> ZipEntry:
+        cached = self.index[arcname]
+        return ZipEntry(
+            arcname=arcname,
+            crc32=cached["crc32"],
+            file_size=cached["size"],
+            compress_size=cached["compress_size"],
+            data_path=self._object_path(cached["object"]),
+            compress_type=cached["compress_type"],
+            sha256=cached["sha256"],
+            # The modification time is left out to keep the archive reproducible
+            mode=normalize_mode(stat.st_mode),
+        )
+
+    def _add_file(self, path: str, arcname: str, stat: os.stat_result) -> dict:
+        """Hash and compress a file. This is called from the worker threads."""
+        sha256 = hashlib.sha256()
+        crc = 0
+        with open(path, mode="rb") as fp:
+            while chunk := fp.read(COPY_BUFFER_SIZE):
+                sha256.update(chunk)
+                crc = zlib.crc32(chunk, crc)
+
+        digest = sha256.hexdigest()
+        compress_type, level = self._get_compression(arcname)
+        object_name = f"{digest}-{compress_type}-{level}"
+        object_path = self._object_path(object_name)
+        if not os.path.exists(object_path):
+            # Files with the same content share the same object
+            tmp_path = f"{object_path}.{os.getpid()}.{id(stat)}.tmp"
+            compress_file(path, tmp_path, compress_type, self.policy.level)
+            os.replace(tmp_path, object_path)
+
+        return {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest,
+            "object": object_name,
+            "crc32": crc,
+            "compress_type": compress_type,
+            "level": level,
+            "compress_size": os.path.getsize(object_path),
+        }
+
+    def list_entries(
+        self,
+        source: str,
+        exclude: Iterable[str] = (),
+        ignore: Optional[Callable[[str], bool]] = None,
+    ) -> list[ZipEntry]:
+        """List the compressed entries of all the files in source.
+
+        Entries are sorted by name so that archives are reproducible.
+        Files which are not in the cache are compressed in parallel.
+
+        :param ignore: whether a file is left out, given its name in the archive
+        """
+        return self.get_entries(
+            list_archive_files(source, exclude=exclude, ignore=ignore)
+        )
+
+    def get_entries(self, files: dict[str, str]) -> list[ZipEntry]:
+        """Get the compressed entries of files, given by their name in the archive.
+
+        Files which are not given are removed from the cache.
+        """
+        arcnames = sorted(files)
+        stats = {arcname: os.stat(files[arcname]) for arcname in arcnames}
+
+        misses = [
+            arcname
+            for arcname in arcnames
+            if not self._is_cached(arcname, stats[arcname])
+        ]
+        self.hits += len(arcnames) - len(misses)
+        self.misses += len(misses)
+        if misses:
+            os.makedirs(self.objects_path, exist_ok=True)
+            # zlib and hashlib release the GIL on large buffers
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                added = executor.map(
+                    lambda arcname: self._add_file(
+                        files[arcname], arcname, stats[arcname]
+                    ),
+                    misses,
+                )
+                self.index.update(zip(misses, added))
+
+        # Forget about the files that were removed from the project
+        for arcname in set(self.index) - set(arcnames):
+            del self.index[arcname]
+        return [self._get_entry(arcname, stats[arcname]) for arcname in arcnames]
+
+    def _log_stats(self) -> None:
+        logging.debug(
+            "Build cache: reused %d files, compressed %d files",
+            self.hits,
+            self.misses,
+        )
+
+    def write_archive(
+        self, zip_path: str, entries: list[ZipEntry]
+    ) -> DeploymentArchive:
+        """Write the entries to an archive at zip_path."""
+        tmp_path = zip_path + ".tmp"
+        with open(tmp_path, mode="wb") as fp:
+            size = write_archive(fp, entries)
+        os.replace(tmp_path, zip_path)
+        self.save()
+
+        self._log_stats()
+        return DeploymentArchive(
+            path=zip_path, size=size, digest=archive_digest(entries), entries=entries
+        )
+
+    def stream_archive(self, entries: list[ZipEntry]) -> DeploymentArchive:
+        """Describe the archive made of the entries without writing it.
+
+        The archive is assembled from the cached members each time it is opened.
+        """
+        self.save()
+        self._log_stats()
+        return DeploymentArchive.from_entries(entries)
+
+    def build_archive(
+        self, zip_path: str, source: str, exclude: Iterable[str] = ()
+    ) -> DeploymentArchive:
+        """Create an archive to zip_path from source, reusing cached members."""
+        return self.write_archive(zip_path, self.list_entries(source, exclude))
@@ -0,0 +1,8 @@
+# Defaults of the deployment settings. They are kept apart from the modules
+# using them, so that the CLI can show them without importing the Scaleway SDK.
+
+# Functions deployed at the same time
+DEFAULT_MAX_WORKERS = 10
+# Archives uploaded at the same time
+DEFAULT_MAX_UPLOADS = 4
+DEFAULT_REQUESTS_PER_SECOND = 20.0
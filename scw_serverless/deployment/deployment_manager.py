@@ -1,51 +1,137 @@
+import dataclasses
 import logging
-import multiprocessing
 import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Optional, cast
 
 import click
-import requests
 import scaleway.function.v1beta1 as sdk
 from scaleway import Client, ScalewayException
 
 from scw_serverless.app import Serverless
 from scw_serverless.config.function import Function
+from scw_serverless.config.route import GatewayRoute
 from scw_serverless.config.triggers import CronTrigger
-from scw_serverless.deployment.api_wrapper import FunctionAPIWrapper
-from scw_serverless.utils.files import create_zip_file
+from scw_serverless.dependencies_manager import PACKAGE_FOLDER
+from scw_serverless.deployment.api_client import SessionFunctionAPI, create_session
+from scw_serverless.deployment.api_wrapper import (
+    FunctionAPIWrapper,
+    NamespaceInventory,
+)
+from scw_serverless.deployment.build_cache import BuildCache, DeploymentArchive
+from scw_serverless.deployment.defaults import (
+    DEFAULT_MAX_UPLOADS,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_REQUESTS_PER_SECOND,
+)
+from scw_serverless.deployment.digest import DIGEST_ENV_VAR, digest_with_secrets
+from scw_serverless.deployment.layer import DependencyLayer
+from scw_serverless.deployment.package_optimizer import PackageOptimizer
+from scw_serverless.deployment.plan import (
+    Action,
+    Change,
+    DeploymentPlan,
+    ResourceKind,
+)
+from scw_serverless.deployment.state import (
+    DEFAULT_STATE_TTL,
+    STATE_FILE,
+    DeploymentState,
+    load_state,
+)
+from scw_serverless.deployment.upload import ArchiveUploader
+from scw_serverless.gateway.gateway_manager import Gateway
+from scw_serverless.gateway.route_diff import diff_routes
+from scw_serverless.import_graph import ImportGraph
+from scw_serverless.utils.archive import (
+    CompressionPolicy,
+    ZipEntry,
+    archive_size,
+    list_archive_files,
+)
 
 TEMP_DIR = "./.scw"
 DEPLOYMENT_ZIP = f"{TEMP_DIR}/deployment.zip"
-UPLOAD_TIMEOUT_SECONDS = 600
+BUILD_CACHE_DIR = f"{TEMP_DIR}/cache"
+LAYER_DIR = f"{TEMP_DIR}/layer"
 
 
 class DeploymentManager:
-    """Uses the API to deploy functions."""
+    """Uses the API to deploy functions.
 
+    Functions are deployed concurrently by max_workers threads
+    sharing the same connections to the API.
+
+    The ids of the deployed resources are recorded in state_file,
+    and used to look them up until the state is older than state_ttl.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
     def __init__(
         self,
         app_instance: Serverless,
         sdk_client: Client,
         single_source: bool,
         runtime: str,
+        per_function_archives: bool = False,
+        compression: Optional[CompressionPolicy] = None,
+        stream: bool = False,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_uploads: int = DEFAULT_MAX_UPLOADS,
+        max_upload_rate: Optional[float] = None,
+        max_requests_per_second: Optional[float] = DEFAULT_REQUESTS_PER_SECOND,
+        state_file: Optional[str] = STATE_FILE,
+        state_ttl: float = DEFAULT_STATE_TTL,
+        optimizer: Optional[PackageOptimizer] = None,
     ):
-        self.api = FunctionAPIWrapper(api=sdk.FunctionV1Beta1API(sdk_client))
+        self.session = create_session(pool_size=max(max_workers, max_uploads))
+        self.sdk_api = SessionFunctionAPI(
+            sdk_client,
+            session=self.session,
+            requests_per_second=max_requests_per_second,
+            pool_size=max_workers,
+        )
+        self.api = FunctionAPIWrapper(api=self.sdk_api)
         self.app_instance = app_instance
         self.sdk_client = sdk_client
         # Behavior configuration
         self.single_source = single_source
         self.runtime = sdk.FunctionRuntime(runtime)
+        self.per_function_archives = per_function_archives
+        self.compression = compression
+        self.stream = stream
+        self.max_workers = max_workers
+        self.state_file = state_file
+        self.state_ttl = state_ttl
+        self.optimizer = optimizer
+        self.uploader = ArchiveUploader(
+            max_uploads=max_uploads,
+            max_bytes_per_second=max_upload_rate,
+            session=self.session,
+        )
 
-    def _get_or_create_function(self, function: Function, namespace_id: str) -> str:
-        logging.info("Looking for an existing function %s...", function.name)
+    def _deploy_function(
+        self,
+        function: Function,
+        inventory: NamespaceInventory,
+        archive: DeploymentArchive,
+    ) -> sdk.Function:
         # Checking if a function already exists
-        deployed_function = self.api.find_deployed_function(
-            namespace_id=namespace_id, function=function
+        deployed_function = inventory.find_function(function.name)
+        digest = digest_with_secrets(
+            archive.digest, function.secret_environment_variables
         )
+        # The digest is only recorded once the code it covers is deployed,
+        # so that an interrupted deployment is not skipped by the next one
         if not deployed_function:
             logging.info("Creating a new function %s...", function.name)
             # Creating a new function with the provided args
             deployed_function = self.api.create_function(
-                namespace_id=namespace_id, function=function, runtime=self.runtime
+                namespace_id=inventory.namespace_id,
+                function=function,
+                runtime=self.runtime,
+                digest="",
             )
         else:
             # Updating the function with the provided args
@@ -53,18 +139,14 @@ class DeploymentManager:
                 function_id=deployed_function.id,
                 function=function,
                 runtime=self.runtime,
+                digest="",
             )
-        return deployed_function.id
-
-    def _deploy_function(
-        self, function: Function, namespace_id: str, zip_size: int
-    ) -> sdk.Function:
-        function_id = self._get_or_create_function(function, namespace_id)
+        function_id = deployed_function.id
 
         # Get an object storage pre-signed url
         try:
             upload_url = self.api.get_upload_url(
-                function_id=function_id, zip_size=zip_size
+                function_id=function_id, zip_size=archive.size
             )
         except ScalewayException as e:
             logging.error(
@@ -74,55 +156,234 @@ class DeploymentManager:
             raise e
 
         logging.info("Uploading function %s...", function.name)
-        self._upload_deployment_zip(upload_url, zip_size)
+        self._upload_deployment_zip(upload_url, archive)
 
         logging.info("Deploying function %s...", function.name)
         # Deploy the newly uploaded function
-        return self.api.deploy_function(function_id=function_id)
+        deployed_function = self.api.deploy_function(
+            namespace_id=inventory.namespace_id, function_id=function_id
+        )
+        if deployed_function.status is not sdk.FunctionStatus.ERROR:
+            recorded = self.api.update_function(
+                function_id=function_id,
+                function=function,
+                runtime=self.runtime,
+                digest=digest,
+                redeploy=False,
+            )
+            deployed_function.environment_variables = recorded.environment_variables
+        return deployed_function
 
-    def _deploy_cron_trigger(self, function_id: str, trigger: CronTrigger) -> sdk.Cron:
+    def _deploy_cron_trigger(
+        self, function_id: str, trigger: CronTrigger, inventory: NamespaceInventory
+    ) -> sdk.Cron:
         # Checking if a trigger already exists
-        deployed_trigger = self.api.find_deployed_cron_trigger(
-            function_id=function_id, trigger=trigger
-        )
+        deployed_trigger = inventory.find_cron(function_id, trigger.name)
         if not deployed_trigger:
-            deployed_trigger = self.api.create_cron_trigger(
+            return self.api.create_cron_trigger(
                 function_id=function_id, trigger=trigger
             )
-        else:
-            deployed_trigger = self.api.update_cron_trigger(
-                function_id=function_id, trigger=trigger
+        if self.api.is_cron_up_to_date(deployed_trigger, trigger):
+            return deployed_trigger
+        return self.api.update_cron_trigger(
+            function_id=function_id, cron_id=deployed_trigger.id, trigger=trigger
+        )
+
+    def _list_archive_entries(self) -> tuple[list[ZipEntry], BuildCache]:
+        """List the entries of the archive containing the entire project."""
+        if not os.path.exists(TEMP_DIR):
+            os.mkdir(TEMP_DIR)
+
+        ignore = None
+        if self.optimizer:
+            self.optimizer.prepare()
+            ignore = self.optimizer.is_pruned
+
+        # Unchanged files are copied from the cache without being recompressed
+        cache = BuildCache(BUILD_CACHE_DIR, policy=self.compression)
+        entries = self._list_layered_entries(cache, ignore)
+
+        if self.optimizer:
+            self._log_optimization(entries)
+        return entries, cache
+
+    def _list_layered_entries(
+        self, cache: BuildCache, ignore: Optional[Callable[[str], bool]]
+    ) -> list[ZipEntry]:
+        """List the entries of the application and of the dependency layer.
+
+        The members of the dependency layer are copied at once from its archive,
+        which is only rebuilt when the vendored dependencies change.
+        """
+        files = list_archive_files("./", exclude=[TEMP_DIR], ignore=ignore)
+        prefix = os.path.normpath(PACKAGE_FOLDER).replace(os.sep, "/") + "/"
+        package_files = {
+            arcname: path
+            for arcname, path in files.items()
+            if arcname.startswith(prefix)
+        }
+        app_files = {
+            arcname: path
+            for arcname, path in files.items()
+            if arcname not in package_files
+        }
+        entries = cache.get_entries(app_files)
+        if package_files:
+            layer = DependencyLayer(LAYER_DIR, policy=self.compression)
+            entries += layer.get_entries(package_files)
+            logging.info(
+                "%s the dependency layer of %d files",
+                "Rebuilt" if layer.rebuilt else "Reused",
+                len(package_files),
             )
-        return deployed_trigger
+        # Members are sorted so that the digest does not depend on the layers
+        return sorted(entries, key=lambda entry: entry.arcname)
+
+    def _log_optimization(self, entries: list[ZipEntry]) -> None:
+        """Report what the optimization of the dependencies saved."""
+        optimizer = cast(PackageOptimizer, self.optimizer)
+        logging.info(
+            "Pruned %d files (%.2f MB) from the dependencies, "
+            "%d modules are precompiled for Python %s.%s",
+            optimizer.pruned_files,
+            optimizer.pruned_bytes / 1e6,
+            optimizer.count_compiled([entry.arcname for entry in entries]),
+            *optimizer.python_version,
+        )
+        logging.info(
+            "Archive size: %.2f MB, estimated unpack time reduced by %.2fs",
+            archive_size(entries) / 1e6,
+            optimizer.unpack_seconds_saved,
+        )
 
-    def _create_deployment_zip(self) -> int:
+    def _create_deployment_zip(self) -> DeploymentArchive:
         """Create a ZIP archive containing the entire project."""
         logging.info("Creating a deployment archive...")
-        if not os.path.exists(TEMP_DIR):
-            os.mkdir(TEMP_DIR)
+        entries, cache = self._list_archive_entries()
+        if self.stream:
+            return cache.stream_archive(entries)
+        return cache.write_archive(DEPLOYMENT_ZIP, entries)
 
-        if os.path.exists(DEPLOYMENT_ZIP):
-            os.remove(DEPLOYMENT_ZIP)
+    def _create_function_archives(self) -> dict[str, DeploymentArchive]:
+        """Create a ZIP archive for each function with only the files it imports."""
+        logging.info("Creating a deployment archive for each function...")
+        entries, cache = self._list_archive_entries()
+        project_size = archive_size(entries)
+        graph = ImportGraph(Path("."), Path(PACKAGE_FOLDER))
 
-        create_zip_file(DEPLOYMENT_ZIP, "./")
-        return os.path.getsize(DEPLOYMENT_ZIP)
+        archives = {}
+        for function in self.app_instance.functions:
+            module, _ = function.handler_path.rsplit(".", 1)
+            required = graph.get_required_files(Path(module + ".py"))
+            function_entries = [entry for entry in entries if entry.arcname in required]
+            if self.stream:
+                archive = cache.stream_archive(function_entries)
+            else:
+                archive = cache.write_archive(
+                    f"{TEMP_DIR}/{function.name}.zip", function_entries
+                )
+            logging.info(
+                "Archive of function %s: %.2f MB (%.0f%% smaller than the project)",
+                function.name,
+                archive.size / 1e6,
+                100 * (1 - archive.size / project_size),
+            )
+            archives[function.name] = archive
+        return archives
 
-    def _upload_deployment_zip(self, upload_url: str, zip_size: int):
+    def _create_deployment_archives(self) -> dict[str, DeploymentArchive]:
+        """Create the archive of each function."""
+        if self.per_function_archives:
+            return self._create_function_archives()
+        # Create a zip containing the user's project
+        archive = self._create_deployment_zip()
+        return {function.name: archive for function in self.app_instance.functions}
+
+    def _upload_deployment_zip(self, upload_url: str, archive: DeploymentArchive):
         """Upload function zip to S3 presigned URL."""
-        with open(DEPLOYMENT_ZIP, mode="rb") as file:
-            req = requests.put(
-                upload_url,
-                data=file,
-                headers={
-                    "Content-Type": "application/octet-stream",
-                    "Content-Length": str(zip_size),
-                },
-                timeout=UPLOAD_TIMEOUT_SECONDS,
-            )
-            if req.status_code != 200:
-                raise RuntimeError("Unable to upload function code... Aborting...")
-
-    def _get_or_create_namespace(self) -> str:
+        self.uploader.upload(upload_url, archive)
+
+    def _load_state(self) -> Optional[DeploymentState]:
+        """Load the state of the last deployment, if it can be used."""
+        if not self.state_file:
+            return None
+        return load_state(
+            self.app_instance.service_name,
+            self.sdk_client,
+            path=self.state_file,
+            ttl=self.state_ttl,
+        )
+
+    def _find_namespace(
+        self, state: Optional[DeploymentState]
+    ) -> Optional[sdk.Namespace]:
+        return self.api.find_deployed_namespace(
+            app_instance=self.app_instance,
+            namespace_id=state.namespace_id if state else None,
+        )
+
+    def _list_inventory(
+        self, namespace_id: str, state: Optional[DeploymentState]
+    ) -> NamespaceInventory:
+        """List the deployed resources.
+
+        With a state, the recorded resources are fetched by id instead. They are
+        listed when the state is outdated, but only the crons of the functions
+        which had or have triggers are listed.
+        """
+        if not state:
+            return self.api.list_inventory(namespace_id)
+        inventory = self._get_recorded_inventory(namespace_id, state)
+        if inventory:
+            return inventory
+        logging.debug("The state is outdated, listing the deployed resources")
+        with_crons = {
+            function.name
+            for function in self.app_instance.functions
+            if function.triggers
+        } | {name for name, function in state.functions.items() if function.crons}
+        return self.api.list_inventory(namespace_id, with_crons=with_crons)
+
+    def _get_recorded_inventory(
+        self, namespace_id: str, state: DeploymentState
+    ) -> Optional[NamespaceInventory]:
+        """Get the resources recorded by the state, if it is up to date.
+
+        It is not when the app has new functions or triggers, when a resource
+        no longer exists, or when a function was deployed again since.
+        """
+        for function in self.app_instance.functions:
+            recorded = state.functions.get(function.name)
+            if not recorded or any(
+                trigger.name not in recorded.crons
+                for trigger in function.triggers or []
+            ):
+                return None
+        inventory = self.api.get_inventory(
+            namespace_id,
+            function_ids=[function.id for function in state.functions.values()],
+            cron_ids=[
+                cron_id
+                for function in state.functions.values()
+                for cron_id in function.crons.values()
+            ],
+        )
+        if not inventory:
+            return None
+        for name, recorded in state.functions.items():
+            deployed_function = inventory.find_function(name)
+            if not deployed_function:
+                return None
+            digest = (deployed_function.environment_variables or {}).get(
+                DIGEST_ENV_VAR, ""
+            )
+            if digest != recorded.digest:
+                return None
+        return inventory
+
+    def _get_or_create_namespace(
+        self, state: Optional[DeploymentState]
+    ) -> sdk.Namespace:
         namespace_name = self.app_instance.service_name
         project_id = self.sdk_client.default_project_id
         logging.debug(
@@ -130,9 +391,7 @@ class DeploymentManager:
             namespace_name,
             project_id,
         )
-        deployed_namespace = self.api.find_deployed_namespace(
-            app_instance=self.app_instance
-        )
+        deployed_namespace = self._find_namespace(state)
         if not deployed_namespace:
             logging.info(
                 "Creating a new namespace %s in %s...", namespace_name, project_id
@@ -140,6 +399,8 @@ class DeploymentManager:
             deployed_namespace = self.api.create_namespace(
                 app_instance=self.app_instance
             )
+        elif self.api.is_namespace_up_to_date(deployed_namespace, self.app_instance):
+            logging.debug("Namespace %s is up to date, skipping...", namespace_name)
         else:
             logging.debug("Updating namespace %s configuration...", namespace_name)
             deployed_namespace = self.api.update_namespace(
@@ -150,63 +411,262 @@ class DeploymentManager:
                 f"Namespace {deployed_namespace.name} is not ready: "
                 + (deployed_namespace.error_message or "")
             )
-        return deployed_namespace.id
+        return deployed_namespace
 
-    def deploy(self) -> None:
-        """Deploy all configured functions using the Scaleway API."""
-        namespace_id = self._get_or_create_namespace()
-        # Create a zip containing the user's project
-        file_size = self._create_deployment_zip()
+    def _diff_routes(
+        self,
+        inventory: NamespaceInventory,
+        current_routes: Optional[list[GatewayRoute]],
+        prune_routes: bool,
+    ) -> dict[str, Action]:
+        """Compare the routes of the functions with the routes of the gateway.
 
-        deploy_inputs = [
-            (function, namespace_id, file_size)
-            for function in self.app_instance.functions
-        ]
-        triggers_to_deploy = {
-            function.name: function.triggers
+        The routes are updated when the routes of the gateway are unknown.
+
+        :returns: the action on each route by relative url
+        """
+        routes = []
+        for function in self.app_instance.functions:
+            if not function.gateway_route:
+                continue
+            deployed_function = inventory.find_function(function.name)
+            target = (
+                f"https://{deployed_function.domain_name}"
+                if deployed_function and deployed_function.domain_name
+                else None
+            )
+            routes.append(dataclasses.replace(function.gateway_route, target=target))
+        if current_routes is None:
+            return {route.relative_url: Action.UPDATE for route in routes}
+
+        diff = diff_routes(current_routes, routes, prune=prune_routes)
+        actions = {route.relative_url: Action.CREATE for route in diff.to_add}
+        actions |= {route.relative_url: Action.UPDATE for route in diff.to_update}
+        actions |= {route.relative_url: Action.NO_OP for route in diff.unchanged}
+        actions |= {route.relative_url: Action.DELETE for route in diff.to_delete}
+        return actions
+
+    def _compute_plan(
+        self,
+        inventory: NamespaceInventory,
+        archives: dict[str, DeploymentArchive],
+        current_routes: Optional[list[GatewayRoute]] = None,
+        prune_routes: bool = False,
+    ) -> DeploymentPlan:
+        """Compare the functions and their triggers with the deployed ones.
+
+        :param current_routes: routes of the gateway, if they can be read
+        """
+        plan = DeploymentPlan()
+        route_actions = self._diff_routes(inventory, current_routes, prune_routes)
+        for function in self.app_instance.functions:
+            deployed_function = inventory.find_function(function.name)
+            digest = digest_with_secrets(
+                archives[function.name].digest, function.secret_environment_variables
+            )
+            if not deployed_function:
+                action = Action.CREATE
+            elif self.api.is_function_up_to_date(
+                deployed_function, function, runtime=self.runtime, digest=digest
+            ):
+                action = Action.NO_OP
+            else:
+                action = Action.UPDATE
+            plan.add(ResourceKind.FUNCTION, function.name, action)
+
+            for trigger in function.triggers or []:
+                deployed_cron = (
+                    inventory.find_cron(deployed_function.id, trigger.name)
+                    if deployed_function
+                    else None
+                )
+                if not deployed_cron:
+                    action = Action.CREATE
+                elif self.api.is_cron_up_to_date(deployed_cron, trigger):
+                    action = Action.NO_OP
+                else:
+                    action = Action.UPDATE
+                plan.add(ResourceKind.CRON, trigger.name, action, function.name)
+
+            if function.gateway_route:
+                url = function.gateway_route.relative_url
+                plan.add(
+                    ResourceKind.ROUTE,
+                    url,
+                    route_actions.pop(url, Action.UPDATE),
+                    function.name,
+                )
+
+        # The routes left are not configured by the functions
+        for url, action in route_actions.items():
+            plan.add(ResourceKind.ROUTE, url, action)
+        if self.single_source:
+            self._plan_deletions(plan, inventory)
+        return plan
+
+    def _plan_deletions(
+        self, plan: DeploymentPlan, inventory: NamespaceInventory
+    ) -> None:
+        """Plan the deletion of the resources no longer present in the code."""
+        triggers = {
+            function.name: {trigger.name for trigger in function.triggers or []}
             for function in self.app_instance.functions
-            if function.triggers
         }
-        function_ids: dict[str, str] = {}
+        for deployed_function in inventory.functions:
+            if deployed_function.name not in triggers:
+                plan.add(ResourceKind.FUNCTION, deployed_function.name, Action.DELETE)
+        for cron in inventory.crons:
+            function_name = inventory.functions_by_id[cron.function_id].name
+            if cron.name not in triggers.get(function_name, set()):
+                plan.add(ResourceKind.CRON, cron.name, Action.DELETE, function_name)
+
+    def plan(
+        self, gateway: Optional[Gateway] = None, prune_routes: bool = False
+    ) -> DeploymentPlan:
+        """Compute the changes a deployment would make without applying them.
+
+        :param gateway: gateway the routes would be applied to
+        :param prune_routes: whether the routes which are not configured are deleted
+        """
+        state = self._load_state()
+        deployed_namespace = self._find_namespace(state)
+        if deployed_namespace:
+            inventory = self._list_inventory(deployed_namespace.id, state)
+        else:
+            inventory = NamespaceInventory(namespace_id="")
+        archives = self._create_deployment_archives()
+
+        current_routes = gateway.list_routes() if gateway else None
+        plan = self._compute_plan(inventory, archives, current_routes, prune_routes)
+        if not deployed_namespace:
+            action = Action.CREATE
+        elif self.api.is_namespace_up_to_date(deployed_namespace, self.app_instance):
+            action = Action.NO_OP
+        else:
+            action = Action.UPDATE
+        plan.changes.insert(
+            0, Change(ResourceKind.NAMESPACE, self.app_instance.service_name, action)
+        )
+        return plan
+
+    # pylint: disable=too-many-locals
+    def _deploy_all(
+        self, executor: ThreadPoolExecutor, state: Optional[DeploymentState]
+    ) -> tuple[sdk.Namespace, NamespaceInventory, list[sdk.Function], list[sdk.Cron]]:
+        """Deploy the namespace, then each function followed by its triggers.
+
+        The triggers of a function are deployed as soon as it is ready,
+        without waiting for the other functions.
+        Resources which are up to date are left untouched.
+        """
+        # The archives are built while the namespace is being created
+        archives_future = executor.submit(self._create_deployment_archives)
+        namespace = self._get_or_create_namespace(state)
+        # Everything deployed in the namespace is listed once
+        inventory = self._list_inventory(namespace.id, state)
+        archives = archives_future.result()
+        plan = self._compute_plan(inventory, archives)
 
-        n_proc = min(len(self.app_instance.functions), 3 * (os.cpu_count() or 1))
-        with multiprocessing.Pool(processes=n_proc) as pool:
-            for function in pool.starmap(self._deploy_function, deploy_inputs):
-                if function.status is sdk.FunctionStatus.ERROR:
+        pending: set[Future] = set()
+        functions: dict[Future, Function] = {}
+        for function in self.app_instance.functions:
+            action = plan.get_action(ResourceKind.FUNCTION, function.name)
+            if action is Action.NO_OP:
+                logging.info("Function %s is up to date, skipping...", function.name)
+                future: Future = Future()
+                future.set_result(inventory.find_function(function.name))
+            else:
+                future = executor.submit(
+                    self._deploy_function,
+                    function,
+                    inventory,
+                    archives[function.name],
+                )
+            functions[future] = function
+            pending.add(future)
+
+        deployed_functions: list[sdk.Function] = []
+        deployed_triggers: list[sdk.Cron] = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if future not in functions:
+                    if result.status is sdk.CronStatus.ERROR:
+                        raise ValueError(f"Trigger {result.name} is in error state")
+                    deployed_triggers.append(result)
+                    continue
+
+                if result.status is sdk.FunctionStatus.ERROR:
                     raise ValueError(
-                        f"Function {function.name} is in error state: "
-                        + (function.error_message or "")
+                        f"Function {result.name} is in error state: "
+                        + (result.error_message or "")
                     )
                 click.secho(
-                    f"Function {function.name} deployed to: "
-                    + f"https://{function.domain_name}",
+                    f"Function {result.name} deployed to: "
+                    + f"https://{result.domain_name}",
                     fg="green",
                 )
-                function_ids[function.name] = function.id
+                deployed_functions.append(result)
 
-            if triggers_to_deploy:
-                logging.info("Deploying triggers...")
-
-            triggers_to_deploy = [
-                (function_ids[k], t)
-                for k, triggers in triggers_to_deploy.items()
-                for t in triggers
-            ]
+                function = functions.pop(future)
+                for trigger in function.triggers or []:
+                    action = plan.get_action(
+                        ResourceKind.CRON, trigger.name, function.name
+                    )
+                    if action is Action.NO_OP:
+                        deployed_cron = inventory.find_cron(result.id, trigger.name)
+                        deployed_triggers.append(deployed_cron)  # type: ignore
+                        continue
+                    pending.add(
+                        executor.submit(
+                            self._deploy_cron_trigger, result.id, trigger, inventory
+                        )
+                    )
+        return namespace, inventory, deployed_functions, deployed_triggers
 
-            deployed_triggers: set[str] = set()
-            for trigger in pool.starmap(self._deploy_cron_trigger, triggers_to_deploy):
-                if trigger.status is sdk.CronStatus.ERROR:
-                    raise ValueError(f"Trigger {trigger.name} is in error state")
-                deployed_triggers.add(trigger.id)
+    def deploy(self) -> None:
+        """Deploy all configured functions using the Scaleway API."""
+        state = self._load_state()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                try:
+                    (
+                        namespace,
+                        inventory,
+                        deployed_functions,
+                        deployed_triggers,
+                    ) = self._deploy_all(executor, state)
+                except BaseException:
+                    executor.shutdown(cancel_futures=True)
+                    raise
+        finally:
+            # Released once the running uploads are done
+            self.uploader.close()
+            stats = self.sdk_api.stats
+            logging.debug(
+                "Sent %d API requests, %d retries, %.1fs throttled",
+                stats.calls,
+                stats.retries,
+                stats.throttled_seconds,
+            )
 
         click.secho("Done! Functions have been successfully deployed!", fg="green")
 
         if self.single_source:
-            # Remove functions no longer present in the code
-            self.api.delete_all_functions_from_ns_except(
-                namespace_id=namespace_id, function_ids=list(function_ids.values())
-            )
-            # Remove triggers
-            self.api.delete_all_crons_from_ns_except(
-                namespace_id=namespace_id, cron_ids=list(deployed_triggers)
+            # Remove functions and triggers no longer present in the code
+            summary = self.api.delete_all_from_ns_except(
+                inventory=inventory,
+                function_ids=[function.id for function in deployed_functions],
+                cron_ids=[cron.id for cron in deployed_triggers],
+                max_workers=self.max_workers,
             )
+            logging.info("%s", summary)
+
+        if self.state_file:
+            DeploymentState.from_deployment(
+                namespace,
+                deployed_functions,
+                deployed_triggers,
+                self.sdk_client,
+            ).save(self.state_file)
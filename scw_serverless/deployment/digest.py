@@ -0,0 +1,44 @@
+import hashlib
+import hmac
+import json
+import secrets as secrets_module
+from typing import Optional
+
+# Environment variable recording what was deployed
+DIGEST_ENV_VAR = "SCW_SERVERLESS_DIGEST"
+# Namespace variables are inherited by the functions, so they use another name
+NAMESPACE_DIGEST_ENV_VAR = "SCW_SERVERLESS_NAMESPACE_DIGEST"
+# The digest is readable by anyone who can read the environment variables,
+# secrets are stretched to make guessing them from the digest impractical.
+SECRETS_HASH_ITERATIONS = 100_000
+
+
+def digest_with_secrets(salt: str, secrets: Optional[dict[str, str]]) -> str:
+    """Compute a digest of salt and secrets which can be stored alongside them.
+
+    The secrets are not returned by the API, so this is what is used
+    to tell if they changed since the last deployment.
+    """
+    payload = json.dumps(secrets or {}, sort_keys=True).encode("utf-8")
+    return hashlib.pbkdf2_hmac(
+        "sha256", payload, salt.encode("utf-8"), SECRETS_HASH_ITERATIONS
+    ).hex()
+
+
+def salted_secrets_digest(
+    secrets: Optional[dict[str, str]], salt: Optional[str] = None
+) -> str:
+    """Compute a digest of the secrets, prefixed by the salt used to compute it.
+
+    A random salt is used by default.
+    """
+    salt = salt or secrets_module.token_hex(16)
+    return f"{salt}:{digest_with_secrets(salt, secrets)}"
+
+
+def secrets_match_digest(secrets: Optional[dict[str, str]], digest: str) -> bool:
+    """Check if secrets match a digest from salted_secrets_digest."""
+    salt, sep, _ = digest.partition(":")
+    if not sep:
+        return False
+    return hmac.compare_digest(salted_secrets_digest(secrets, salt), digest)
@@ -0,0 +1,129 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Optional
+
+from scw_serverless.deployment.build_cache import BuildCache
+from scw_serverless.utils.archive import CompressionPolicy, ZipEntry, write_archive
+
+LAYER_ARCHIVE = "layer.zip"
+LAYER_INDEX = "layer.json"
+LAYER_CACHE_DIR = "cache"
+
+
+class DependencyLayer:
+    """Archive of the vendored dependencies, merged into the deployment archives.
+
+    The layer is only rebuilt when the dependencies change. Its members are
+    then copied as-is into the deployment archives, local headers included,
+    while only the members of the application are assembled on each deployment.
+
+    :param policy: how the members are compressed
+    :param max_workers: number of threads compressing the members
+    """
+
+    def __init__(
+        self,
+        layer_dir: str,
+        policy: Optional[CompressionPolicy] = None,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        self.layer_dir = layer_dir
+        self.policy = policy or CompressionPolicy()
+        # Compressed members are kept to rebuild the layer incrementally
+        self.cache = BuildCache(
+            os.path.join(layer_dir, LAYER_CACHE_DIR),
+            policy=self.policy,
+            max_workers=max_workers,
+        )
+        self.rebuilt = False
+
+    @property
+    def archive_path(self) -> str:
+        """Path to the archive of the layer."""
+        return os.path.join(self.layer_dir, LAYER_ARCHIVE)
+
+    @property
+    def index_path(self) -> str:
+        """Path to the file listing the members of the layer."""
+        return os.path.join(self.layer_dir, LAYER_INDEX)
+
+    def _fingerprint(self, files: dict[str, str]) -> str:
+        """Hash the compression policy and the names, sizes and times of the files."""
+        sha256 = hashlib.sha256(
+            f"{self.policy.level}:{sorted(self.policy.stored_extensions)}".encode()
+        )
+        for arcname in sorted(files):
+            stat = os.stat(files[arcname])
+            sha256.update(
+                f"{arcname}:{stat.st_size}:{stat.st_mtime_ns}:{stat.st_mode}".encode()
+            )
+        return sha256.hexdigest()
+
+    def _load_entries(self, fingerprint: str) -> Optional[list[ZipEntry]]:
+        """Load the entries of the layer, if it was built from the same files."""
+        if not os.path.exists(self.archive_path):
+            return None
+        try:
+            with open(self.index_path, mode="r", encoding="utf-8") as fp:
+                index: dict[str, Any] = json.load(fp)
+            if index.get("fingerprint") != fingerprint:
+                return None
+            return [
+                ZipEntry(**(entry | {"date_time": tuple(entry["date_time"])}))
+                for entry in index["entries"]
+            ]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def get_entries(self, files: dict[str, str]) -> list[ZipEntry]:
+        """Get the entries of the layer made of files, rebuilding it if needed.
+
+        :param files: paths of the files by their name in the archive
+        """
+        fingerprint = self._fingerprint(files)
+        entries = self._load_entries(fingerprint)
+        if entries is not None:
+            self.rebuilt = False
+            return entries
+
+        logging.info("Building the dependency layer...")
+        entries = self._write_layer(self.cache.get_entries(files))
+        self.cache.save()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as fp:
+            json.dump(
+                {
+                    "fingerprint": fingerprint,
+                    "entries": [dataclasses.asdict(entry) for entry in entries],
+                },
+                fp,
+            )
+        os.replace(tmp_path, self.index_path)
+        self.rebuilt = True
+        return entries
+
+    def _write_layer(self, entries: list[ZipEntry]) -> list[ZipEntry]:
+        """Write the layer archive and get the entries of its members."""
+        os.makedirs(self.layer_dir, exist_ok=True)
+        tmp_path = self.archive_path + ".tmp"
+        with open(tmp_path, mode="wb") as fp:
+            write_archive(fp, entries)
+        os.replace(tmp_path, self.archive_path)
+
+        layer_entries = []
+        offset = 0
+        for entry in entries:
+            offset += entry.local_header_size
+            layer_entries.append(
+                dataclasses.replace(
+                    entry,
+                    data_path=self.archive_path,
+                    data_offset=offset,
+                    in_archive=True,
+                )
+            )
+            offset += entry.compress_size
+        return layer_entries
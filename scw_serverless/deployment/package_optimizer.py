@@ -0,0 +1,189 @@
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Optional
+
+from scw_serverless.dependencies_manager import PACKAGE_FOLDER
+from scw_serverless.utils.files import list_files
+
+# Files installed with the dependencies which are not needed to run them
+DEFAULT_PRUNE_PATTERNS = (
+    "*/tests/*",
+    "*/test/*",
+    "*.dist-info/RECORD",
+    "*.dist-info/INSTALLER",
+    "*.dist-info/REQUESTED",
+    "*.dist-info/direct_url.json",
+    "*.pyi",
+    "*/py.typed",
+    "*.pyx",
+    "*.pxd",
+    "*.c",
+    "*.h",
+    "*.md",
+    "*.rst",
+    "bin/*",
+)
+COMPILED_STATE_FILE = ".scw/compiled.json"
+# Rough costs of unpacking an archive, used to estimate the time saved
+UNPACK_SECONDS_PER_FILE = 0.0002
+UNPACK_SECONDS_PER_BYTE = 1 / 200e6
+
+
+@dataclass(frozen=True)
+class PruneRules:
+    """Patterns of the files to leave out of the vendored dependencies.
+
+    Patterns are matched against the paths relative to the package folder.
+
+    :param keep: patterns of the files which are never pruned
+    """
+
+    patterns: tuple[str, ...] = DEFAULT_PRUNE_PATTERNS
+    keep: tuple[str, ...] = ()
+
+    def matches(self, path: str) -> bool:
+        """Check if a file should be pruned."""
+        if any(fnmatch.fnmatch(path, pattern) for pattern in self.keep):
+            return False
+        return any(fnmatch.fnmatch(path, pattern) for pattern in self.patterns)
+
+
+class PackageOptimizer:
+    """Prunes and precompiles the vendored dependencies for faster cold starts.
+
+    The bytecode is compiled for the runtime of the functions into hash-based
+    .pyc files, which do not depend on the modification time of the sources.
+    Compiled files for other interpreters are left out of the archive.
+
+    :param runtime: runtime of the functions, e.g. python311
+    :param rules: which files are left out of the archive
+    """
+
+    def __init__(
+        self,
+        runtime: str,
+        rules: PruneRules = PruneRules(),
+        package_path: str = PACKAGE_FOLDER,
+        state_path: str = COMPILED_STATE_FILE,
+    ) -> None:
+        match = re.fullmatch(r"python(\d)(\d+)", runtime)
+        if not match:
+            raise ValueError(f"Runtime {runtime} is not a Python runtime")
+        self.python_version = (int(match[1]), int(match[2]))
+        self.rules = rules
+        self.package_path = package_path
+        self.state_path = state_path
+        self.pruned_files = 0
+        self.pruned_bytes = 0
+        self.compiled_files = 0
+
+    @property
+    def bytecode_tag(self) -> str:
+        """Tag of the compiled files of the runtime, e.g. cpython-311."""
+        major, minor = self.python_version
+        return f"cpython-{major}{minor}"
+
+    def _find_interpreter(self) -> Optional[str]:
+        """Find a local interpreter with the Python version of the runtime."""
+        if sys.version_info[:2] == self.python_version:
+            return sys.executable
+        major, minor = self.python_version
+        return shutil.which(f"python{major}.{minor}")
+
+    def _fingerprint(self) -> str:
+        """Hash the names, sizes and modification times of the sources."""
+        digest = hashlib.sha256(self.bytecode_tag.encode())
+        for path in sorted(list_files(self.package_path)):
+            if path.endswith(".py"):
+                stat = os.stat(path)
+                digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+
+    def prepare(self) -> None:
+        """Compile the sources of the vendored dependencies for the runtime.
+
+        Nothing is compiled if the sources did not change since the last time.
+        """
+        self.pruned_files = self.pruned_bytes = self.compiled_files = 0
+        if not os.path.isdir(self.package_path):
+            return
+        interpreter = self._find_interpreter()
+        if not interpreter:
+            logging.warning(
+                "Python %s.%s was not found, dependencies will not be precompiled",
+                *self.python_version,
+            )
+            return
+
+        fingerprint = self._fingerprint()
+        try:
+            with open(self.state_path, mode="r", encoding="utf-8") as fp:
+                if json.load(fp).get("fingerprint") == fingerprint:
+                    return
+        except (OSError, ValueError, AttributeError):
+            pass
+
+        logging.info(
+            "Precompiling dependencies for Python %s.%s...", *self.python_version
+        )
+        command = [
+            interpreter,
+            "-m",
+            "compileall",
+            "-q",
+            "-j",
+            "0",
+            "--invalidation-mode",
+            "unchecked-hash",
+            self.package_path,
+        ]
+        try:
+            subprocess.run(command, check=True, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            # Some files may be for other Python versions, they are not compiled
+            logging.debug("Could not compile every file: %s", e.stdout, exc_info=True)
+
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(self.state_path, mode="w", encoding="utf-8") as fp:
+            json.dump({"fingerprint": self._fingerprint()}, fp)
+
+    def is_pruned(self, arcname: str) -> bool:
+        """Check if a file of the project should be left out of the archive."""
+        prefix = os.path.normpath(self.package_path).replace(os.sep, "/") + "/"
+        if not arcname.startswith(prefix):
+            return False
+        path = arcname[len(prefix) :]
+        source_dir, cache_dir, name = path.rpartition("__pycache__/")
+        if cache_dir and (not source_dir or source_dir.endswith("/")):
+            # The bytecode of the runtime is kept, unless its source is pruned
+            source = source_dir + name.split(".", 1)[0] + ".py"
+            is_runtime_bytecode = name.endswith(f".{self.bytecode_tag}.pyc")
+            pruned = not is_runtime_bytecode or self.rules.matches(source)
+        else:
+            pruned = self.rules.matches(path)
+        if pruned:
+            self.pruned_files += 1
+            self.pruned_bytes += os.path.getsize(arcname)
+        return pruned
+
+    def count_compiled(self, arcnames: list[str]) -> int:
+        """Count the compiled files of the runtime among the archived files."""
+        suffix = f".{self.bytecode_tag}.pyc"
+        self.compiled_files = sum(arcname.endswith(suffix) for arcname in arcnames)
+        return self.compiled_files
+
+    @property
+    def unpack_seconds_saved(self) -> float:
+        """Estimate the time saved unpacking the archive by pruning files."""
+        return (
+            self.pruned_files * UNPACK_SECONDS_PER_FILE
+            + self.pruned_bytes * UNPACK_SECONDS_PER_BYTE
+        )
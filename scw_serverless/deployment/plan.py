@@ -0,0 +1,101 @@
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Optional
+
+import click
+
+
+class Action(Enum):
+    """Operation to apply to a resource."""
+
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    NO_OP = "no-op"
+
+
+class ResourceKind(Enum):
+    """Kind of resource managed by a deployment."""
+
+    NAMESPACE = "namespace"
+    FUNCTION = "function"
+    CRON = "cron"
+    ROUTE = "route"
+
+
+ACTION_SYMBOLS = {
+    Action.CREATE: ("+", "green"),
+    Action.UPDATE: ("~", "yellow"),
+    Action.DELETE: ("-", "red"),
+    Action.NO_OP: ("=", None),
+}
+
+
+@dataclass
+class Change:
+    """Operation planned on a resource.
+
+    :param function: name of the function the resource belongs to, if any
+    """
+
+    kind: ResourceKind
+    name: Optional[str]
+    action: Action
+    function: Optional[str] = None
+
+    @property
+    def description(self) -> str:
+        """Human readable name of the resource."""
+        name = self.name or "<unnamed>"
+        if self.function:
+            name = f"{name} of {self.function}"
+        return f"{self.kind.value} {name}"
+
+
+@dataclass
+class DeploymentPlan:
+    """Changes a deployment makes to the deployed resources."""
+
+    changes: list[Change] = field(default_factory=list)
+
+    def add(
+        self,
+        kind: ResourceKind,
+        name: Optional[str],
+        action: Action,
+        function: Optional[str] = None,
+    ) -> None:
+        """Add a change to the plan."""
+        self.changes.append(Change(kind, name, action, function))
+
+    def get_action(
+        self, kind: ResourceKind, name: Optional[str], function: Optional[str] = None
+    ) -> Optional[Action]:
+        """Get the action planned on a resource."""
+        for change in self.changes:
+            if (change.kind, change.name, change.function) == (kind, name, function):
+                return change.action
+        return None
+
+    def count(self, action: Action) -> int:
+        """Count the changes with a given action."""
+        return sum(change.action is action for change in self.changes)
+
+    @property
+    def has_changes(self) -> bool:
+        """Whether applying the plan would change anything."""
+        return any(change.action is not Action.NO_OP for change in self.changes)
+
+    def echo(self) -> None:
+        """Print the plan."""
+        for change in self.changes:
+            symbol, color = ACTION_SYMBOLS[change.action]
+            click.secho(
+                f"  {symbol} {change.description} ({change.action.value})", fg=color
+            )
+        click.echo(
+            f"Plan: {self.count(Action.CREATE)} to create, "
+            + f"{self.count(Action.UPDATE)} to update, "
+            + f"{self.count(Action.DELETE)} to delete, "
+            + f"{self.count(Action.NO_OP)} unchanged."
+        )
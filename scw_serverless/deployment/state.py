@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+import scaleway.function.v1beta1 as sdk
+from scaleway import Client
+
+from scw_serverless.deployment.digest import DIGEST_ENV_VAR
+
+STATE_FILE = "./.scw/state.json"
+DEFAULT_STATE_TTL = 3600.0
+
+
+@dataclass
+class FunctionState:
+    """Function deployed by the last successful deployment.
+
+    :param digest: digest of the deployed code, which tells if the function
+        was deployed again since
+    :param crons: ids of the crons of the function by name
+    """
+
+    id: str  # pylint: disable=invalid-name
+    domain_name: str
+    digest: str = ""
+    crons: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class DeploymentState:
+    """Resources deployed by the last successful deployment.
+
+    The state is only valid for the namespace of the same app,
+    in the same project and region.
+    """
+
+    service_name: str
+    project_id: Optional[str]
+    region: Optional[str]
+    namespace_id: str
+    functions: dict[str, FunctionState] = field(default_factory=dict)
+    updated_at: float = field(default_factory=time.time)
+
+    @staticmethod
+    def from_deployment(
+        namespace: sdk.Namespace,
+        functions: list[sdk.Function],
+        crons: list[sdk.Cron],
+        sdk_client: Client,
+    ) -> "DeploymentState":
+        """Record the deployed resources."""
+        state = DeploymentState(
+            service_name=namespace.name,
+            project_id=sdk_client.default_project_id,
+            region=sdk_client.default_region,
+            namespace_id=namespace.id,
+        )
+        functions_by_id = {}
+        for function in functions:
+            function_state = FunctionState(
+                id=function.id,
+                domain_name=function.domain_name,
+                digest=(function.environment_variables or {}).get(DIGEST_ENV_VAR, ""),
+            )
+            state.functions[function.name] = functions_by_id[function.id] = (
+                function_state
+            )
+        for cron in crons:
+            if cron.function_id in functions_by_id:
+                functions_by_id[cron.function_id].crons[cron.name] = cron.id
+        return state
+
+    def matches(
+        self, service_name: str, project_id: Optional[str], region: Optional[str]
+    ) -> bool:
+        """Check if the state was recorded for the same namespace."""
+        return (self.service_name, self.project_id, self.region) == (
+            service_name,
+            project_id,
+            region,
+        )
+
+    def is_expired(self, ttl: float) -> bool:
+        """Check if the state is older than ttl seconds."""
+        return time.time() - self.updated_at > ttl
+
+    def save(self, path: str = STATE_FILE) -> None:
+        """Write the state to a file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as fp:
+            json.dump(asdict(self), fp, indent=2)
+        os.replace(tmp_path, path)
+
+
+def load_state(
+    service_name: str,
+    sdk_client: Client,
+    path: str = STATE_FILE,
+    ttl: float = DEFAULT_STATE_TTL,
+) -> Optional[DeploymentState]:
+    """Load the state of the last deployment.
+
+    Returns None if there is no usable state: it is missing, expired,
+    or was recorded for another namespace.
+    """
+    try:
+        with open(path, mode="r", encoding="utf-8") as fp:
+            data = json.load(fp)
+        functions = {
+            name: FunctionState(**function)
+            for name, function in data.pop("functions", {}).items()
+        }
+        state = DeploymentState(**data, functions=functions)
+    except (OSError, ValueError, TypeError):
+        return None
+    if not state.matches(
+        service_name, sdk_client.default_project_id, sdk_client.default_region
+    ):
+        logging.debug("Ignoring the state recorded for another namespace")
+        return None
+    if state.is_expired(ttl):
+        logging.debug("Ignoring the state older than %d seconds", ttl)
+        return None
+    return state
@@ -0,0 +1,108 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, Callable, Generic, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class PollingOptions:
+    """How often the statuses are polled.
+
+    The interval doubles after each poll where no resource became ready,
+    up to max_interval. It is reset once a resource is ready.
+    """
+
+    min_interval: float = 1.0
+    max_interval: float = 15.0
+    timeout: float = 600.0
+
+    def next_interval(self, interval: float) -> float:
+        """Get the interval following interval."""
+        return min(interval * 2, self.max_interval)
+
+
+class StatusPoller(Generic[T]):
+    """Waits for resources to be in a final state, polling their statuses in batches.
+
+    A single thread lists all the resources on each tick,
+    and wakes up the waiters whose resource reached a final state.
+    The thread stops when there is nothing left to wait for.
+
+    :param list_resources: lists the resources which can be waited for
+    :param is_final: whether a resource is in a final state
+    """
+
+    def __init__(
+        self,
+        list_resources: Callable[[], Iterable[T]],
+        is_final: Callable[[T], bool],
+        options: PollingOptions = PollingOptions(),
+    ) -> None:
+        self.list_resources = list_resources
+        self.is_final = is_final
+        self.options = options
+        self.polls = 0
+        self._lock = threading.Lock()
+        self._waiters: dict[str, Future] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def wait(self, resource_id: str) -> T:
+        """Wait for a resource to be in a final state."""
+        with self._lock:
+            future = self._waiters.get(resource_id)
+            if not future:
+                future = self._waiters[resource_id] = Future()
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        try:
+            return future.result(timeout=self.options.timeout)
+        except FutureTimeoutError as e:
+            with self._lock:
+                self._waiters.pop(resource_id, None)
+            raise TimeoutError(
+                f"Resource {resource_id} was not ready "
+                + f"after {self.options.timeout} seconds"
+            ) from e
+
+    def _poll(self) -> bool:
+        """List the resources and wake up the waiters, returns True if any was."""
+        self.polls += 1
+        try:
+            resources: list[Any] = list(self.list_resources())
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # The error is raised by all the waiters
+            with self._lock:
+                waiters, self._waiters = self._waiters, {}
+            for future in waiters.values():
+                future.set_exception(e)
+            return True
+
+        woken_up = False
+        with self._lock:
+            for resource in resources:
+                if resource.id in self._waiters and self.is_final(resource):
+                    self._waiters.pop(resource.id).set_result(resource)
+                    woken_up = True
+        return woken_up
+
+    def _run(self) -> None:
+        interval = self.options.min_interval
+        while True:
+            # Jitter keeps concurrent pollers from polling at the same time
+            time.sleep(random.uniform(interval / 2, interval))  # nosec # not crypto
+            if self._poll():
+                interval = self.options.min_interval
+            else:
+                interval = self.options.next_interval(interval)
+            with self._lock:
+                if not self._waiters:
+                    self._thread = None
+                    logging.debug("Status poller stopped after %d polls", self.polls)
+                    return
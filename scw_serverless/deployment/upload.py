@@ -0,0 +1,131 @@
+import mmap
+import threading
+from typing import BinaryIO, Optional
+
+import requests
+
+from scw_serverless.deployment.api_client import create_session
+from scw_serverless.deployment.build_cache import DeploymentArchive
+from scw_serverless.deployment.defaults import DEFAULT_MAX_UPLOADS
+from scw_serverless.utils.rate_limit import TokenBucket
+
+UPLOAD_TIMEOUT_SECONDS = 600
+
+
+class _UploadBody:
+    """Body of an upload request, read from a memory view or a file.
+
+    Each request reads from its own position, so a memory view of the archive
+    can be shared by concurrent uploads.
+    """
+
+    def __init__(
+        self,
+        source: memoryview | BinaryIO,
+        size: int,
+        bandwidth: Optional[TokenBucket],
+    ) -> None:
+        self.source = source
+        self.size = size
+        self.bandwidth = bandwidth
+        self.position = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def tell(self) -> int:
+        """Number of bytes already read."""
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        """Read at most size bytes, waiting for the bandwidth budget."""
+        if size < 0:
+            size = self.size - self.position
+        if isinstance(self.source, memoryview):
+            chunk = bytes(self.source[self.position : self.position + size])
+        else:
+            chunk = self.source.read(size)
+        if chunk and self.bandwidth:
+            self.bandwidth.acquire(len(chunk))
+        self.position += len(chunk)
+        return chunk
+
+
+class ArchiveUploader:  # pylint: disable=too-many-instance-attributes
+    """Uploads deployment archives to the pre-signed URLs of the functions.
+
+    Each function has its own pre-signed URL, so the same archive has to be
+    uploaded once per function. Uploads share a connection pool and
+    archives written to disk are mapped in memory once for all uploads.
+
+    :param max_uploads: maximum number of concurrent uploads
+    :param max_bytes_per_second: bandwidth shared by all the uploads
+    :param session: session to send the uploads with, one is created by default
+    """
+
+    def __init__(
+        self,
+        max_uploads: int = DEFAULT_MAX_UPLOADS,
+        max_bytes_per_second: Optional[float] = None,
+        session: Optional[requests.Session] = None,
+    ) -> None:
+        self.max_uploads = max_uploads
+        self.max_bytes_per_second = max_bytes_per_second
+        self._slots = threading.BoundedSemaphore(self.max_uploads)
+        self._lock = threading.Lock()
+        self._maps: dict[str, mmap.mmap] = {}
+        self._bandwidth = (
+            TokenBucket(self.max_bytes_per_second)
+            if self.max_bytes_per_second
+            else None
+        )
+        self._owns_session = session is None
+        self._session = session or create_session(pool_size=max_uploads)
+
+    def _get_map(self, path: str) -> mmap.mmap:
+        with self._lock:
+            if path not in self._maps:
+                with open(path, mode="rb") as file:
+                    self._maps[path] = mmap.mmap(
+                        file.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+            return self._maps[path]
+
+    def upload(self, upload_url: str, archive: DeploymentArchive) -> None:
+        """Upload an archive to a pre-signed URL."""
+        with self._slots:
+            if archive.path:
+                view = memoryview(self._get_map(archive.path))
+                try:
+                    self._put(
+                        upload_url, _UploadBody(view, archive.size, self._bandwidth)
+                    )
+                finally:
+                    view.release()
+            else:
+                with archive.open() as stream:
+                    self._put(
+                        upload_url, _UploadBody(stream, archive.size, self._bandwidth)
+                    )
+
+    def _put(self, upload_url: str, body: _UploadBody) -> None:
+        req = self._session.put(
+            upload_url,
+            data=body,
+            headers={
+                "Content-Type": "application/octet-stream",
+                "Content-Length": str(len(body)),
+            },
+            timeout=UPLOAD_TIMEOUT_SECONDS,
+        )
+        if req.status_code != 200:
+            raise RuntimeError("Unable to upload function code... Aborting...")
+
+    def close(self) -> None:
+        """Release the connections and the memory maps."""
+        with self._lock:
+            for archive_map in self._maps.values():
+                archive_map.close()
+            self._maps.clear()
+        if self._owns_session:
+            self._session.close()
@@ -0,0 +1,286 @@
+import ast
+import logging
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, Union
+
+from scw_serverless.app import Serverless
+from scw_serverless.config.route import HTTPMethod
+from scw_serverless.config.triggers import CronTrigger
+from scw_serverless.dependencies_manager import PACKAGE_FOLDER
+from scw_serverless.import_graph import ImportGraph
+
+SERVERLESS_NAMES = {"scw_serverless.Serverless", "scw_serverless.app.Serverless"}
+CRON_TRIGGER_NAMES = {"scw_serverless.config.triggers.CronTrigger"}
+HTTP_METHOD_NAMES = {"scw_serverless.config.route.HTTPMethod"}
+# Methods of the app which register a handler
+DECORATORS = {"func", "schedule", "get", "post", "put", "delete", "patch"}
+# Attributes of the app which can be read without changing the functions
+READ_ONLY_ATTRIBUTES = {"service_name"}
+
+FunctionNode = Union[ast.FunctionDef, ast.AsyncFunctionDef]
+
+
+class NotStaticError(Exception):
+    """The app cannot be discovered without running the module."""
+
+
+def _iter_module_level(tree: ast.Module) -> Iterator[ast.AST]:
+    """Iterate over the nodes run when the module is imported.
+
+    The bodies of functions and classes are skipped.
+    """
+    to_visit: list[ast.AST] = list(tree.body)
+    while to_visit:
+        node = to_visit.pop()
+        yield node
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            to_visit.extend(node.decorator_list)
+        elif not isinstance(node, ast.Lambda):
+            to_visit.extend(ast.iter_child_nodes(node))
+
+
+class _ModuleAnalyzer:
+    """Evaluates the literal values of a module from its syntax tree."""
+
+    def __init__(self, tree: ast.Module) -> None:
+        self.tree = tree
+        self.imports: dict[str, str] = {}
+        self.assignments: dict[str, list[ast.AST]] = {}
+        for node in _iter_module_level(tree):
+            if isinstance(node, ast.ImportFrom):
+                for alias in node.names:
+                    if alias.name == "*":
+                        # Names bound by a star import are unknown
+                        raise NotStaticError(f"star import from {node.module}")
+                    name = alias.asname or alias.name
+                    # Relative imports are never resolved
+                    if not node.level:
+                        self.imports[name] = f"{node.module}.{alias.name}"
+                    self._bind(name, node)
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    # Without an alias, import a.b binds a
+                    top_level = alias.name.split(".", 1)[0]
+                    name = alias.asname or top_level
+                    self.imports[name] = alias.name if alias.asname else top_level
+                    self._bind(name, node)
+            elif isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            ):
+                self._bind(node.name, node)
+            elif isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+                self._bind(node.id, node)
+        # Names declared global may be assigned by any function
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Global):
+                for name in node.names:
+                    self._bind(name, node)
+
+    def _bind(self, name: str, node: ast.AST) -> None:
+        self.assignments.setdefault(name, []).append(node)
+
+    def qualified_name(self, node: ast.AST) -> Optional[str]:
+        """Resolve a name or an attribute to the name of what was imported."""
+        if isinstance(node, ast.Name):
+            if len(self.assignments.get(node.id, [])) != 1:
+                return None
+            return self.imports.get(node.id)
+        if isinstance(node, ast.Attribute):
+            base = self.qualified_name(node.value)
+            return f"{base}.{node.attr}" if base else None
+        return None
+
+    def constant(self, name: str) -> Any:
+        """Get the value of a name assigned once to a literal."""
+        bindings = self.assignments.get(name, [])
+        if len(bindings) == 1:
+            for node in self.tree.body:
+                if (
+                    isinstance(node, ast.Assign)
+                    and len(node.targets) == 1
+                    and isinstance(node.targets[0], ast.Name)
+                    and node.targets[0].id == name
+                ):
+                    return self.evaluate(node.value)
+        raise NotStaticError(f"{name} is not a constant")
+
+    def evaluate(self, node: ast.AST) -> Any:
+        """Evaluate a literal expression."""
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            if any(isinstance(elt, ast.Starred) for elt in node.elts):
+                raise NotStaticError("unpacked iterable")
+            values = [self.evaluate(elt) for elt in node.elts]
+            return {ast.List: list, ast.Tuple: tuple, ast.Set: set}[type(node)](values)
+        if isinstance(node, ast.Dict):
+            if any(key is None for key in node.keys):
+                raise NotStaticError("unpacked mapping")
+            return {
+                self.evaluate(key): self.evaluate(value)  # type: ignore
+                for key, value in zip(node.keys, node.values)
+            }
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            value = self.evaluate(node.operand)
+            if isinstance(value, (int, float)):
+                return -value
+        if isinstance(node, ast.Name) and node.id not in self.imports:
+            return self.constant(node.id)
+        return self._evaluate_framework_object(node)
+
+    def _evaluate_framework_object(self, node: ast.AST) -> Any:
+        """Evaluate the HTTP methods and the cron triggers of the framework."""
+        qualified_name = self.qualified_name(node)
+        if isinstance(node, ast.Attribute) and qualified_name:
+            enum, _, member = qualified_name.rpartition(".")
+            if enum in HTTP_METHOD_NAMES and member in HTTPMethod.__members__:
+                return HTTPMethod[member]
+        elif isinstance(node, ast.Call):
+            if self.qualified_name(node.func) in CRON_TRIGGER_NAMES:
+                return self.call(CronTrigger, node)
+            if (
+                isinstance(node.func, ast.Attribute)
+                and node.func.attr == "from_parts"
+                and self.qualified_name(node.func.value) in CRON_TRIGGER_NAMES
+            ):
+                return self.call(CronTrigger.from_parts, node)
+        raise NotStaticError(
+            f"non-literal expression at line {getattr(node, 'lineno', '?')}"
+        )
+
+    def call(self, function: Callable, node: ast.Call) -> Any:
+        """Call a function with the literal arguments of a call."""
+        if any(keyword.arg is None for keyword in node.keywords) or any(
+            isinstance(arg, ast.Starred) for arg in node.args
+        ):
+            raise NotStaticError(f"unpacked arguments at line {node.lineno}")
+        args = [self.evaluate(arg) for arg in node.args]
+        kwargs = {
+            keyword.arg: self.evaluate(keyword.value) for keyword in node.keywords
+        }
+        try:
+            return function(*args, **kwargs)
+        except TypeError as e:
+            # The error is raised again when the module is executed
+            raise NotStaticError(f"invalid arguments at line {node.lineno}") from e
+
+
+def _find_app(analyzer: _ModuleAnalyzer) -> tuple[str, ast.Call]:
+    """Find the Serverless instance created by the module."""
+    instances = []
+    for node in analyzer.tree.body:
+        if (
+            isinstance(node, ast.Assign)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+            and isinstance(node.value, ast.Call)
+            and analyzer.qualified_name(node.value.func) in SERVERLESS_NAMES
+        ):
+            instances.append((node.targets[0].id, node.value))
+    if len(instances) != 1:
+        raise NotStaticError(f"found {len(instances)} Serverless instances")
+    app_name, _ = instances[0]
+    if len(analyzer.assignments[app_name]) != 1:
+        raise NotStaticError(f"{app_name} is assigned multiple times")
+    return instances[0]
+
+
+def _handler_stub(node: FunctionNode, module_name: str) -> Callable:
+    """Create a function standing for a handler, to be passed to the decorators."""
+
+    def handler(*_args: Any) -> None:
+        raise RuntimeError(
+            f"{module_name}.{node.name} was discovered from the source of the app "
+            + "without running it, it cannot be called"
+        )
+
+    handler.__name__ = node.name
+    handler.__qualname__ = node.name
+    handler.__module__ = module_name
+    handler.__doc__ = ast.get_docstring(node, clean=False)
+    return handler
+
+
+def _check_local_modules(file: Path, module_name: str) -> None:
+    """Check that the handlers are not registered by other modules of the project."""
+    graph = ImportGraph(Path("."), Path(PACKAGE_FOLDER))
+    module_file = file.resolve()
+    for local_module in graph.get_local_modules(module_file) - {module_file}:
+        tree = ast.parse(local_module.read_bytes(), filename=str(local_module))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                names = [node.module or ""]
+            else:
+                continue
+            if any(
+                name == module_name or name.startswith(module_name + ".")
+                for name in names
+            ):
+                raise NotStaticError(f"{local_module} imports {module_name}")
+
+
+def discover_app_instance(file: Path, module_name: str) -> Serverless:
+    """Create the app instance of a module from its syntax tree.
+
+    The module is not executed. The arguments of the Serverless instance
+    and of the decorators of its handlers must be literals or constants.
+
+    :raises NotStaticError: if the module must be executed to find the app
+    """
+    try:
+        tree = ast.parse(file.read_bytes(), filename=str(file))
+    except (SyntaxError, ValueError) as e:
+        raise NotStaticError(f"could not parse {file}") from e
+
+    analyzer = _ModuleAnalyzer(tree)
+    app_name, app_call = _find_app(analyzer)
+    app_instance = analyzer.call(Serverless, app_call)
+
+    # Uses of the app which do not change its functions
+    handled: set[int] = set()
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        decorators = []
+        for decorator in node.decorator_list:
+            if (
+                isinstance(decorator, ast.Call)
+                and isinstance(decorator.func, ast.Attribute)
+                and isinstance(decorator.func.value, ast.Name)
+                and decorator.func.value.id == app_name
+            ):
+                if decorator.func.attr not in DECORATORS:
+                    raise NotStaticError(f"unknown decorator {decorator.func.attr}")
+                decorators.append(decorator)
+                handled.add(id(decorator.func.value))
+        handler = _handler_stub(node, module_name)
+        # Decorators are applied from the bottom up
+        for decorator in reversed(decorators):
+            method = getattr(app_instance, decorator.func.attr)  # type: ignore
+            analyzer.call(method, decorator)(handler)
+
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Attribute)
+            and node.attr in READ_ONLY_ATTRIBUTES
+            and isinstance(node.ctx, ast.Load)
+        ):
+            handled.add(id(node.value))
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Name)
+            and node.id == app_name
+            and isinstance(node.ctx, ast.Load)
+            and id(node) not in handled
+        ):
+            raise NotStaticError(f"{app_name} is used at line {node.lineno}")
+
+    _check_local_modules(file, module_name)
+    logging.debug(
+        "Found %d functions without running module %s",
+        len(app_instance.functions),
+        module_name,
+    )
+    return app_instance
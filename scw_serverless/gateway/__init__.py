@@ -1,2 +1,3 @@
 from .gateway_manager import GatewayManager as GatewayManager
+from .kong_gateway import KongGateway as KongGateway
 from .serverless_gateway import ServerlessGateway as ServerlessGateway
@@ -1,31 +1,56 @@
-from typing import Protocol
+import logging
+from typing import Optional, Protocol
 
 import scaleway.function.v1beta1 as sdk
 from scaleway import Client
 
 from scw_serverless.app import Serverless
 from scw_serverless.config.route import GatewayRoute
+from scw_serverless.deployment.state import DEFAULT_STATE_TTL, STATE_FILE, load_state
+from scw_serverless.gateway.route_diff import RouteDiff, diff_routes
 
 
 class Gateway(Protocol):
-    """Generic Gateway Implementation."""
+    """Generic Gateway Implementation.
 
-    def add_route(self, route: GatewayRoute) -> None:
-        """Add a route to the Gateway."""
+    Routes are identified by their relative url.
+    """
+
+    def list_routes(self) -> Optional[list[GatewayRoute]]:
+        """Get the routes of the Gateway, with their targets.
+
+        :returns: None if the routes of the Gateway cannot be read
+        """
+
+    def apply_routes(self, diff: RouteDiff) -> None:
+        """Add, update and delete the routes of the Gateway."""
 
 
 class GatewayManager:
-    """Apply the configured routes to an existing API Gateway."""
+    """Apply the configured routes to an existing API Gateway.
+
+    The routes of the Gateway are fetched once and only the routes
+    which are missing or changed are applied.
 
+    The domain names of the functions are read from the state
+    of the last deployment when it is recent enough.
+    """
+
+    # pylint: disable=too-many-arguments
     def __init__(
         self,
         app_instance: Serverless,
         gateway: Gateway,
         sdk_client: Client,
+        state_file: Optional[str] = STATE_FILE,
+        state_ttl: float = DEFAULT_STATE_TTL,
     ):
         self.app_instance = app_instance
         self.api = sdk.FunctionV1Beta1API(sdk_client)
+        self.sdk_client = sdk_client
         self.gateway = gateway
+        self.state_file = state_file
+        self.state_ttl = state_ttl
 
     def _list_created_functions(self) -> dict[str, sdk.Function]:
         """Get the list of created functions."""
@@ -47,24 +72,74 @@ class GatewayManager:
             for function in self.api.list_functions_all(namespace_id=namespace_id)
         }
 
-    def update_routes(self) -> None:
-        """Update the Gateway routes configured by the functions."""
-        created_functions = self._list_created_functions()
+    def _get_domain_names(self, function_names: list[str]) -> dict[str, str]:
+        """Get the domain names of the created functions."""
+        state = (
+            load_state(
+                self.app_instance.service_name,
+                self.sdk_client,
+                path=self.state_file,
+                ttl=self.state_ttl,
+            )
+            if self.state_file
+            else None
+        )
+        if state and all(name in state.functions for name in function_names):
+            return {
+                name: function.domain_name for name, function in state.functions.items()
+            }
+        return {
+            name: function.domain_name
+            for name, function in self._list_created_functions().items()
+        }
+
+    def update_routes(self, prune: bool = False) -> RouteDiff:
+        """Update the Gateway routes configured by the functions.
+
+        Routes which are already up to date are not applied again.
+
+        :param prune: delete the routes of the Gateway which are not configured,
+            so that the routes of the Gateway exactly match the routes of the app
+        :raises RuntimeError: if pruning when the routes cannot be read
+        """
+        current_routes = self.gateway.list_routes()
+        if current_routes is None:
+            if prune:
+                raise RuntimeError(
+                    "The routes of the Gateway cannot be listed, so they cannot "
+                    + "be pruned. Pruning requires the admin API of the Gateway."
+                )
+            # Every route is applied
+            current_routes = []
+
         routed_functions = [
             function
             for function in self.app_instance.functions
             if function.gateway_route
         ]
+        domain_names = self._get_domain_names(
+            [function.name for function in routed_functions]
+        )
 
         for function in routed_functions:
-            if function.name not in created_functions:
+            if function.name not in domain_names:
                 raise RuntimeError(
                     f"Could not update route to function {function.name} "
                     + "because it was not deployed"
                 )
 
-            target = "https://" + created_functions[function.name].domain_name
+            target = "https://" + domain_names[function.name]
             function.gateway_route.target = target  # type: ignore
 
-        for function in routed_functions:
-            self.gateway.add_route(function.gateway_route)  # type: ignore
+        routes = [function.gateway_route for function in routed_functions]
+        diff = diff_routes(current_routes, routes, prune=prune)  # type: ignore
+        if diff.has_changes:
+            self.gateway.apply_routes(diff)
+        logging.info(
+            "Gateway routes: %d added, %d updated, %d deleted, %d unchanged",
+            len(diff.to_add),
+            len(diff.to_update),
+            len(diff.to_delete),
+            len(diff.unchanged),
+        )
+        return diff
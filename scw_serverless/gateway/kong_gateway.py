@@ -0,0 +1,141 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, Optional
+
+import requests
+import yaml
+
+from scw_serverless.config.route import GatewayRoute, HTTPMethod
+from scw_serverless.deployment.api_client import DEFAULT_POOL_SIZE, create_session
+from scw_serverless.gateway.route_diff import RouteDiff
+
+# Written by scwgw when the gateway is deployed
+GATEWAY_CONFIG_FILE = os.path.join(
+    os.path.expanduser("~"), ".config", "scw", "gateway.yml"
+)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def route_name(route: GatewayRoute) -> str:
+    """Name of the route and of its service, as given by scwgw."""
+    return route.relative_url.replace("/", "_")
+
+
+class KongGateway:
+    """Manage routes on a Kong Gateway with its admin API.
+
+    Requests share the connections of a single session,
+    and the changes to the routes are applied by pool_size threads.
+
+    :param admin_url: url of the admin API, e.g. https://admin.example.com
+    :param token: token of the admin API, if it is protected
+    """
+
+    def __init__(
+        self,
+        admin_url: str,
+        token: Optional[str] = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+    ) -> None:
+        self.admin_url = admin_url.rstrip("/")
+        self.pool_size = pool_size
+        self.session = create_session(pool_size)
+        if token:
+            self.session.headers["X-Auth-Token"] = token
+
+    @staticmethod
+    def from_config(path: str = GATEWAY_CONFIG_FILE) -> "KongGateway":
+        """Connect to the gateway deployed by scwgw."""
+        if not os.path.exists(path):
+            raise RuntimeError(
+                f"Could not find the gateway configuration in {path}, "
+                + "have you deployed your gateway with: scwgw infra deploy?"
+            )
+        with open(path, mode="r", encoding="utf-8") as fp:
+            config = yaml.safe_load(fp)
+        admin_url = f"{config['protocol']}://{config['gw_admin_host']}"
+        if config.get("gw_admin_port"):
+            admin_url += f":{config['gw_admin_port']}"
+        return KongGateway(admin_url, token=config.get("gw_admin_token"))
+
+    def _request(self, method: str, path: str, **kwargs: Any) -> requests.Response:
+        response = self.session.request(method, self.admin_url + path, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def _list_all(self, path: str) -> Iterator[dict[str, Any]]:
+        """List every object of the admin API, following the pages."""
+        next_path: Optional[str] = path
+        while next_path:
+            page = self._request("GET", next_path).json()
+            yield from page.get("data") or []
+            next_path = page.get("next")
+
+    def list_routes(self) -> list[GatewayRoute]:
+        """Get the routes of the gateway with their targets."""
+        services = {service["id"]: service for service in self._list_all("/services")}
+        routes = []
+        for route in self._list_all("/routes"):
+            service = services.get((route.get("service") or {}).get("id"))
+            if not service or not route.get("paths"):
+                continue
+            target = f"{service['protocol']}://{service['host']}"
+            if service.get("port") != DEFAULT_PORTS.get(service["protocol"]):
+                target += f":{service['port']}"
+            target += service.get("path") or ""
+            methods = route.get("methods")
+            routes.append(
+                GatewayRoute(
+                    relative_url=route["paths"][0],
+                    http_methods=[HTTPMethod(m) for m in methods] if methods else None,
+                    target=target,
+                )
+            )
+        return routes
+
+    def add_route(self, route: GatewayRoute) -> None:
+        """Add a route to the gateway, or update the route with the same url."""
+        if not route.target:
+            raise RuntimeError(f"route {route.relative_url} is missing upstream target")
+
+        name = route_name(route)
+        self._request(
+            "PUT", f"/services/{name}", json={"name": name, "url": route.target}
+        )
+        methods = [method.value for method in route.http_methods or []]
+        self._request(
+            "PUT",
+            f"/routes/{name}",
+            json={
+                "name": name,
+                "paths": [route.relative_url],
+                "service": {"name": name},
+                "methods": methods or None,
+            },
+        )
+
+    def delete_route(self, route: GatewayRoute) -> None:
+        """Delete a route and its service from the gateway."""
+        name = route_name(route)
+        self._request("DELETE", f"/routes/{name}")
+        self._request("DELETE", f"/services/{name}")
+
+    def apply_routes(self, diff: RouteDiff) -> None:
+        """Apply the changes to the routes of the gateway concurrently."""
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            futures = [
+                executor.submit(self.add_route, route)
+                for route in diff.to_add + diff.to_update
+            ]
+            futures += [
+                executor.submit(self.delete_route, route) for route in diff.to_delete
+            ]
+            for future in futures:
+                future.result()
+        logging.debug(
+            "Gateway: added %d routes, updated %d routes, deleted %d routes",
+            len(diff.to_add),
+            len(diff.to_update),
+            len(diff.to_delete),
+        )
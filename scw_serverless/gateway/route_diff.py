@@ -0,0 +1,60 @@
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from scw_serverless.config.route import GatewayRoute
+
+
+def _route_key(route: GatewayRoute) -> tuple[Optional[str], tuple[str, ...]]:
+    """Get what the gateway does with a route: where and which methods."""
+    methods = tuple(sorted(method.value for method in route.http_methods or []))
+    return route.target, methods
+
+
+@dataclass
+class RouteDiff:
+    """Changes to apply to the routes of a gateway.
+
+    Routes are identified by their relative url.
+
+    :param to_delete: routes of the gateway which are not configured
+    """
+
+    to_add: list[GatewayRoute] = field(default_factory=list)
+    to_update: list[GatewayRoute] = field(default_factory=list)
+    to_delete: list[GatewayRoute] = field(default_factory=list)
+    unchanged: list[GatewayRoute] = field(default_factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        """Whether applying the diff would change anything."""
+        return bool(self.to_add or self.to_update or self.to_delete)
+
+
+def diff_routes(
+    current: Iterable[GatewayRoute],
+    desired: Iterable[GatewayRoute],
+    prune: bool = False,
+) -> RouteDiff:
+    """Compare the routes of a gateway with the configured routes.
+
+    :param prune: whether the routes which are not configured are deleted
+    """
+    current_by_url = {route.relative_url: route for route in current}
+    diff = RouteDiff()
+    seen = set()
+    for route in desired:
+        if route.relative_url in seen:
+            raise RuntimeError(
+                f"Route {route.relative_url} is configured by multiple functions"
+            )
+        seen.add(route.relative_url)
+        deployed = current_by_url.pop(route.relative_url, None)
+        if not deployed:
+            diff.to_add.append(route)
+        elif _route_key(deployed) != _route_key(route):
+            diff.to_update.append(route)
+        else:
+            diff.unchanged.append(route)
+    if prune:
+        diff.to_delete = list(current_by_url.values())
+    return diff
@@ -1,16 +1,22 @@
 import shutil
 import subprocess
+from typing import Optional
 
 import click
 
 from scw_serverless.config.route import GatewayRoute
+from scw_serverless.gateway.route_diff import RouteDiff
 
 GATEWAY_CLI = "scwgw"
 GATEWAY_PYPI = "scw-gateway"
 
 
 class ServerlessGateway:
-    """Manage routes on a Kong Gateway with scwgw."""
+    """Manage routes on a Kong Gateway with scwgw.
+
+    Each route is added by running scwgw, prefer KongGateway
+    which applies the routes with the admin API of the gateway.
+    """
 
     cli: str
 
@@ -50,3 +56,15 @@ class ServerlessGateway:
         cmd = self._invoke_cli(cli_args)
         for char in cmd.stdout:
             print(char, end="")
+
+    def list_routes(self) -> Optional[list[GatewayRoute]]:
+        """Routes cannot be read from scwgw, so they are always added.
+
+        As a consequence, routes cannot be pruned either.
+        """
+        return None
+
+    def apply_routes(self, diff: RouteDiff) -> None:
+        """Add the routes to the gateway with the CLI."""
+        for route in diff.to_add + diff.to_update:
+            self.add_route(route)
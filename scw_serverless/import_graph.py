@@ -0,0 +1,244 @@
+import ast
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+# See: https://peps.python.org/pep-0503/#normalized-names
+_NORMALIZE_PATTERN = re.compile(r"[-_.]+")
+_REQUIREMENT_NAME_PATTERN = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+def normalize_distribution_name(name: str) -> str:
+    """Normalize a distribution name as pip does."""
+    return _NORMALIZE_PATTERN.sub("-", name).lower()
+
+
+class Distribution:
+    """Distribution vendored in the package folder."""
+
+    def __init__(self, dist_info: Path) -> None:
+        self.dist_info = dist_info
+        self.name = dist_info.name.removesuffix(".dist-info").rsplit("-", 1)[0]
+        self.requires: list[str] = []
+
+        metadata = dist_info.joinpath("METADATA")
+        if metadata.exists():
+            for line in metadata.read_text(encoding="utf-8").splitlines():
+                if line.startswith("Name:"):
+                    self.name = line.removeprefix("Name:").strip()
+                elif line.startswith("Requires-Dist:"):
+                    requirement = line.removeprefix("Requires-Dist:")
+                    # Optional dependencies are not installed by default
+                    if "extra ==" in requirement.replace('"', "").replace("'", ""):
+                        continue
+                    if match := _REQUIREMENT_NAME_PATTERN.match(requirement):
+                        self.requires.append(normalize_distribution_name(match[1]))
+
+    @property
+    def files(self) -> list[str]:
+        """Files installed by the distribution, relative to the package folder."""
+        record = self.dist_info.joinpath("RECORD")
+        if not record.exists():
+            return []
+        files = []
+        for line in record.read_text(encoding="utf-8").splitlines():
+            path = line.rsplit(",", 2)[0]
+            # Scripts are installed outside of the package folder
+            if path and not path.startswith(".."):
+                files.append(path)
+        return files
+
+    @property
+    def top_level_names(self) -> set[str]:
+        """Names of the top level modules provided by the distribution."""
+        names = set()
+        for file in self.files:
+            top_level = file.split("/", 1)[0]
+            if (
+                top_level.endswith((".dist-info", ".data"))
+                or top_level == "__pycache__"
+            ):
+                continue
+            names.add(top_level.split(".", 1)[0])
+        return names
+
+
+class ImportGraph:
+    """Statically follows the imports of a handler.
+
+    Modules are never executed: imports are read from the syntax tree of each
+    module. Modules found in the project are followed recursively while modules
+    found in the package folder are resolved to their vendored distribution,
+    which is included as a whole along with its own dependencies.
+
+    Dynamic imports (e.g. with importlib) cannot be detected.
+    """
+
+    def __init__(self, project_dir: Path, package_dir: Path) -> None:
+        self.project_dir = project_dir.resolve()
+        self.package_dir = package_dir.resolve()
+        self._imports: dict[Path, set[str]] = {}
+        self._distributions: Optional[dict[str, Distribution]] = None
+        self._top_levels: dict[str, Distribution] = {}
+
+    @property
+    def distributions(self) -> dict[str, Distribution]:
+        """Distributions vendored in the package folder by normalized name."""
+        if self._distributions is None:
+            self._distributions = {}
+            if self.package_dir.is_dir():
+                for dist_info in self.package_dir.glob("*.dist-info"):
+                    dist = Distribution(dist_info)
+                    self._distributions[normalize_distribution_name(dist.name)] = dist
+                    for name in dist.top_level_names:
+                        self._top_levels[name] = dist
+        return self._distributions
+
+    def _get_distribution(self, module_name: str) -> Optional[Distribution]:
+        if self._distributions is None:
+            _ = self.distributions
+        return self._top_levels.get(module_name.split(".", 1)[0])
+
+    def _get_imports(self, module_file: Path) -> set[str]:
+        """Get the absolute names of the modules imported by a module."""
+        if module_file in self._imports:
+            return self._imports[module_file]
+
+        try:
+            tree = ast.parse(module_file.read_bytes(), filename=str(module_file))
+        except (SyntaxError, ValueError):
+            logging.warning("Could not parse %s, its imports are ignored", module_file)
+            tree = ast.Module(body=[], type_ignores=[])
+
+        package_parts = list(module_file.relative_to(self.project_dir).parent.parts)
+        imports = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                imports.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ""
+                if node.level:
+                    parent = package_parts[: len(package_parts) - node.level + 1]
+                    base = ".".join(parent + ([base] if base else []))
+                if base:
+                    imports.add(base)
+                for alias in node.names:
+                    # The imported name may either be an attribute or a submodule
+                    if alias.name != "*":
+                        imports.add(f"{base}.{alias.name}" if base else alias.name)
+
+        self._imports[module_file] = imports
+        return imports
+
+    def _find_local_module(self, name: str, roots: list[Path]) -> list[Path]:
+        """Find the files to import a module from the project.
+
+        :returns: the module file preceded by the __init__ of its parents
+        """
+        parts = name.split(".")
+        for root in roots:
+            if (
+                not root.joinpath(parts[0]).exists()
+                and not root.joinpath(parts[0] + ".py").exists()
+            ):
+                continue
+            files = []
+            directory = root
+            for part in parts[:-1]:
+                directory = directory.joinpath(part)
+                if directory.joinpath("__init__.py").is_file():
+                    files.append(directory.joinpath("__init__.py"))
+            module = directory.joinpath(parts[-1])
+            if module.with_suffix(".py").is_file():
+                return files + [module.with_suffix(".py")]
+            if module.joinpath("__init__.py").is_file():
+                return files + [module.joinpath("__init__.py")]
+            return files
+        return []
+
+    def get_local_modules(self, module_file: Path) -> set[Path]:
+        """Get the project modules transitively imported by a module."""
+        module_file = module_file.resolve()
+        roots = [self.project_dir, module_file.parent]
+        seen: set[Path] = set()
+        to_visit = [module_file]
+        while to_visit:
+            current = to_visit.pop()
+            if current in seen or not current.is_relative_to(self.project_dir):
+                continue
+            # The package folder is resolved with distributions
+            if current.is_relative_to(self.package_dir):
+                continue
+            seen.add(current)
+            for name in self._get_imports(current):
+                to_visit.extend(self._find_local_module(name, roots))
+        return seen
+
+    def get_distributions(self, local_modules: set[Path]) -> set[str]:
+        """Get the vendored distributions required by a set of modules."""
+        required = set()
+        for module in local_modules:
+            for name in self._get_imports(module):
+                if dist := self._get_distribution(name):
+                    required.add(normalize_distribution_name(dist.name))
+
+        # Add the dependencies of the distributions
+        to_visit = list(required)
+        while to_visit:
+            dist = self.distributions.get(to_visit.pop())
+            for dependency in dist.requires if dist else []:
+                if dependency in self.distributions and dependency not in required:
+                    required.add(dependency)
+                    to_visit.append(dependency)
+        return required
+
+    def get_required_files(self, module_file: Path) -> set[str]:
+        """Get the files required to import a module.
+
+        Files are relative to the project directory.
+        Non-Python files next to the project modules are included
+        as they may be read at runtime. The bytecode compiled next to the
+        Python files is included too, as it is not recorded by the distributions.
+        """
+        local_modules = self.get_local_modules(module_file)
+        files = set()
+        for directory in {module.parent for module in local_modules}:
+            for entry in os.scandir(directory):
+                if entry.is_file() and not entry.name.endswith((".py", ".pyc")):
+                    files.add(Path(entry.path))
+        files |= local_modules
+
+        required = {
+            file.relative_to(self.project_dir).as_posix()
+            for file in files
+            if not file.is_relative_to(self.package_dir)
+        }
+        package_prefix = self.package_dir.relative_to(self.project_dir).as_posix()
+        for name in self.get_distributions(local_modules):
+            dist = self.distributions[name]
+            required.update(f"{package_prefix}/{file}" for file in dist.files)
+        return required | self._get_bytecode(required)
+
+    def _get_bytecode(self, files: set[str]) -> set[str]:
+        """Get the files of __pycache__ compiled from the Python files."""
+        sources_by_dir: dict[str, set[str]] = {}
+        for file in files:
+            if file.endswith(".py"):
+                directory, _, name = file.rpartition("/")
+                sources_by_dir.setdefault(directory, set()).add(name)
+        bytecode = set()
+        for directory, sources in sources_by_dir.items():
+            cache_dir = self.project_dir.joinpath(directory, "__pycache__")
+            if not cache_dir.is_dir():
+                continue
+            for entry in os.scandir(cache_dir):
+                # e.g. __pycache__/module.cpython-311.pyc for module.py
+                if (
+                    entry.name.endswith(".pyc")
+                    and entry.name.split(".", 1)[0] + ".py" in sources
+                ):
+                    prefix = f"{directory}/" if directory else ""
+                    bytecode.add(f"{prefix}__pycache__/{entry.name}")
+        return bytecode
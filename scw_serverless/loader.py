@@ -3,8 +3,11 @@ import inspect
 import logging
 import sys
 from pathlib import Path
+from typing import Optional
 
 from scw_serverless.app import Serverless
+from scw_serverless.discovery import NotStaticError, discover_app_instance
+from scw_serverless.manifest import get_manifest_key, load_manifest, save_manifest
 
 
 def get_module_name(file: Path) -> str:
@@ -16,10 +19,42 @@ def get_module_name(file: Path) -> str:
     )
 
 
-def load_app_instance(file: Path) -> Serverless:
-    """Load the app instance from the client module."""
+def load_app_instance(
+    file: Path, static: bool = False, manifest_file: Optional[str] = None
+) -> Serverless:
+    """Load the app instance from the client module.
+
+    :param static: read the app from the syntax tree of the module when possible,
+        instead of executing it. The handlers of the functions are then not set.
+    :param manifest_file: where the app is recorded. The recorded app is used
+        instead of loading the module again when the module and the project modules
+        it imports did not change. The handlers of the functions are then not set.
+    """
 
     module_name = get_module_name(file)
+    key = None
+    if manifest_file:
+        key = get_manifest_key(file)
+        if app_instance := load_manifest(key, manifest_file):
+            logging.debug("Loaded the app from %s", manifest_file)
+            return app_instance
+
+    app_instance = None
+    if static:
+        try:
+            app_instance = discover_app_instance(file, module_name)
+        except NotStaticError as e:
+            logging.debug("Executing module %s to load the app: %s", module_name, e)
+    if not app_instance:
+        app_instance = _execute_module(file, module_name)
+
+    if manifest_file and key:
+        save_manifest(app_instance, key, manifest_file)
+    return app_instance
+
+
+def _execute_module(file: Path, module_name: str) -> Serverless:
+    """Find the app instance by executing the client module."""
     logging.debug("Loading the Serverless instance from module %s", module_name)
     parent_directory = str(file.parent.resolve())
 
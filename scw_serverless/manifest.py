@@ -0,0 +1,129 @@
+import ast
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+from enum import Enum
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Any, Optional
+
+from scw_serverless.app import Serverless
+from scw_serverless.config.function import Function
+from scw_serverless.config.route import GatewayRoute, HTTPMethod
+from scw_serverless.config.triggers import CronTrigger
+from scw_serverless.dependencies_manager import PACKAGE_FOLDER
+from scw_serverless.import_graph import ImportGraph
+
+MANIFEST_FILE = "./.scw/manifest.json"
+
+
+def _get_framework_version() -> str:
+    """Get a version of the framework, even when it is not installed."""
+    try:
+        return version("scw_serverless")
+    except PackageNotFoundError:
+        # Running from the sources: they are hashed instead
+        sha256 = hashlib.sha256()
+        for module in sorted(Path(__file__).parent.rglob("*.py")):
+            sha256.update(module.read_bytes())
+        return sha256.hexdigest()
+
+
+def _get_referenced_names(source: bytes) -> set[str]:
+    """Get the string literals of a module, which may name environment variables."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return set()
+    return {
+        node.value
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Constant) and isinstance(node.value, str)
+    }
+
+
+def get_manifest_key(file: Path) -> str:
+    """Hash what the functions of the app may depend on.
+
+    That is the content of the entry file and of the modules of the project
+    it imports, the environment variables they reference by name
+    and the version of the framework.
+    """
+    graph = ImportGraph(Path("."), Path(PACKAGE_FOLDER))
+    module_file = file.resolve()
+    sha256 = hashlib.sha256(f"{module_file}:{_get_framework_version()}".encode())
+    referenced: set[str] = set()
+    for module in sorted(graph.get_local_modules(module_file)):
+        source = module.read_bytes()
+        sha256.update(f"{module}:".encode())
+        sha256.update(hashlib.sha256(source).digest())
+        referenced |= _get_referenced_names(source)
+    environment = sorted(
+        (name, value) for name, value in os.environ.items() if name in referenced
+    )
+    sha256.update(json.dumps(environment).encode())
+    return sha256.hexdigest()
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Cannot serialize {value!r}")
+
+
+def _function_from_dict(data: dict[str, Any]) -> Function:
+    function = Function(**data)
+    if route := data["gateway_route"]:
+        methods = route["http_methods"]
+        function.gateway_route = GatewayRoute(
+            relative_url=route["relative_url"],
+            http_methods=[HTTPMethod(m) for m in methods] if methods else methods,
+            target=route["target"],
+        )
+    function.triggers = [CronTrigger(**trigger) for trigger in data["triggers"]]
+    return function
+
+
+def save_manifest(
+    app_instance: Serverless, key: str, path: str = MANIFEST_FILE
+) -> None:
+    """Record the app and its functions, discovered with the files hashed by key.
+
+    Apps with secrets are not recorded, so that secrets are never written to disk.
+    """
+    if app_instance.secret or any(
+        function.secret_environment_variables for function in app_instance.functions
+    ):
+        logging.debug("The app has secrets, it is not recorded in %s", path)
+        return
+    manifest = {
+        "key": key,
+        "service_name": app_instance.service_name,
+        "env": app_instance.env,
+        "functions": [
+            dataclasses.asdict(function) for function in app_instance.functions
+        ],
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode="w", encoding="utf-8") as fp:
+        json.dump(manifest, fp, default=_to_json)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(key: str, path: str = MANIFEST_FILE) -> Optional[Serverless]:
+    """Load the app recorded with the same key, if any."""
+    try:
+        with open(path, mode="r", encoding="utf-8") as fp:
+            manifest = json.load(fp)
+        if manifest.get("key") != key:
+            return None
+        app_instance = Serverless(manifest["service_name"], env=manifest["env"])
+        app_instance.functions = [
+            _function_from_dict(function) for function in manifest["functions"]
+        ]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return app_instance
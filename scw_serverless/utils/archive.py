@@ -0,0 +1,443 @@
+import hashlib
+import io
+import os
+import queue
+import shutil
+import stat
+import struct
+import threading
+import zlib
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+from zipfile import ZIP_DEFLATED, ZIP_STORED
+
+from scw_serverless.utils.files import list_files
+
+# See: https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT
+LOCAL_HEADER_SIGNATURE = 0x04034B50
+CENTRAL_HEADER_SIGNATURE = 0x02014B50
+END_OF_CENTRAL_DIR_SIGNATURE = 0x06054B50
+ZIP64_END_OF_CENTRAL_DIR_SIGNATURE = 0x06064B50
+ZIP64_END_OF_CENTRAL_DIR_LOCATOR_SIGNATURE = 0x07064B50
+
+LOCAL_HEADER_STRUCT = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER_STRUCT = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_OF_CENTRAL_DIR_STRUCT = struct.Struct("<IHHHHIIH")
+ZIP64_END_OF_CENTRAL_DIR_STRUCT = struct.Struct("<IQHHIIQQQQ")
+ZIP64_END_OF_CENTRAL_DIR_LOCATOR_STRUCT = struct.Struct("<IIQI")
+
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+# Upper byte of "version made by", tells readers to use the unix permissions
+UNIX_CREATOR = 3
+UTF8_FLAG = 0x800
+MAX_UINT16 = 0xFFFF
+MAX_UINT32 = 0xFFFFFFFF
+
+DEFAULT_FILE_MODE = 0o100644
+EXECUTABLE_FILE_MODE = 0o100755
+COPY_BUFFER_SIZE = 1024 * 1024
+
+DEFAULT_COMPRESSION_LEVEL = 6
+# Files which are already compressed, deflating them is mostly a waste of time
+DEFAULT_STORED_EXTENSIONS = frozenset(
+    {
+        ".so",
+        ".pyd",
+        ".whl",
+        ".zip",
+        ".gz",
+        ".tgz",
+        ".bz2",
+        ".xz",
+        ".zst",
+        ".jar",
+        ".png",
+        ".jpg",
+        ".jpeg",
+        ".gif",
+        ".webp",
+        ".mp3",
+        ".mp4",
+    }
+)
+
+
+@dataclass(frozen=True)
+class CompressionPolicy:
+    """How the members of an archive are compressed.
+
+    :param level: zlib compression level, from 0 (none) to 9 (best)
+    :param stored_extensions: extensions of the files which are not compressed
+    """
+
+    level: int = DEFAULT_COMPRESSION_LEVEL
+    stored_extensions: frozenset[str] = field(default=DEFAULT_STORED_EXTENSIONS)
+
+    def get_compress_type(self, arcname: str) -> int:
+        """Get the compression method to use for a member."""
+        extension = "." + arcname.rsplit(".", 1)[-1].lower() if "." in arcname else ""
+        if self.level == 0 or extension in self.stored_extensions:
+            return ZIP_STORED
+        return ZIP_DEFLATED
+
+
+def normalize_mode(mode: int) -> int:
+    """Normalize the permissions of a file, only keeping if it is executable."""
+    if mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+        return EXECUTABLE_FILE_MODE
+    return DEFAULT_FILE_MODE
+
+
+# pylint: disable=too-many-instance-attributes
+@dataclass
+class ZipEntry:
+    """Member of an archive whose compressed size is known in advance.
+
+    The data is read from data_path, starting at data_offset,
+    and copied verbatim into the archive.
+
+    :param sha256: hash of the uncompressed content
+    :param in_archive: whether data_path is an archive where the local header
+        of the member precedes its data. Consecutive members of the same
+        archive are then copied at once, headers included.
+    """
+
+    arcname: str
+    crc32: int
+    file_size: int
+    compress_size: int
+    data_path: str
+    data_offset: int = 0
+    compress_type: int = ZIP_DEFLATED
+    date_time: tuple[int, int, int, int, int, int] = (1980, 1, 1, 0, 0, 0)
+    mode: int = DEFAULT_FILE_MODE
+    sha256: Optional[str] = None
+    in_archive: bool = False
+
+    @property
+    def encoded_name(self) -> bytes:
+        """Name of the member as written in the archive."""
+        return self.arcname.encode("utf-8")
+
+    @property
+    def flags(self) -> int:
+        """General purpose bit flags of the member."""
+        return UTF8_FLAG if not self.arcname.isascii() else 0
+
+    @property
+    def dos_date_time(self) -> tuple[int, int]:
+        """Date and time of the member in the MS-DOS format."""
+        year, month, day, hours, minutes, seconds = self.date_time
+        dos_date = (max(year, 1980) - 1980) << 9 | month << 5 | day
+        dos_time = hours << 11 | minutes << 5 | seconds // 2
+        return dos_date, dos_time
+
+    @property
+    def local_header_size(self) -> int:
+        """Size of the local header preceding the data."""
+        return LOCAL_HEADER_STRUCT.size + len(self.encoded_name)
+
+    def local_header(self) -> bytes:
+        """Serialize the local header of the member."""
+        dos_date, dos_time = self.dos_date_time
+        return (
+            LOCAL_HEADER_STRUCT.pack(
+                LOCAL_HEADER_SIGNATURE,
+                ZIP_VERSION,
+                self.flags,
+                self.compress_type,
+                dos_time,
+                dos_date,
+                self.crc32,
+                self.compress_size,
+                self.file_size,
+                len(self.encoded_name),
+                0,
+            )
+            + self.encoded_name
+        )
+
+    def central_header(self, offset: int) -> bytes:
+        """Serialize the central directory header of the member."""
+        dos_date, dos_time = self.dos_date_time
+        return (
+            CENTRAL_HEADER_STRUCT.pack(
+                CENTRAL_HEADER_SIGNATURE,
+                UNIX_CREATOR << 8 | ZIP_VERSION,
+                ZIP_VERSION,
+                self.flags,
+                self.compress_type,
+                dos_time,
+                dos_date,
+                self.crc32,
+                self.compress_size,
+                self.file_size,
+                len(self.encoded_name),
+                0,
+                0,
+                0,
+                0,
+                self.mode << 16,
+                offset,
+            )
+            + self.encoded_name
+        )
+
+
+def compress_file(
+    source: str, destination: str, compress_type: int, level: int = -1
+) -> int:
+    """Compress source to destination with the given compression method.
+
+    :returns: the size of the compressed data
+    """
+    if compress_type == ZIP_STORED:
+        shutil.copyfile(source, destination)
+        return os.path.getsize(destination)
+    return deflate_file(source, destination, level)
+
+
+def deflate_file(source: str, destination: str, level: int = -1) -> int:
+    """Compress source to destination as a raw deflate stream.
+
+    :returns: the size of the compressed data
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compress_size = 0
+    with open(source, mode="rb") as src, open(destination, mode="wb") as dst:
+        while chunk := src.read(COPY_BUFFER_SIZE):
+            data = compressor.compress(chunk)
+            compress_size += len(data)
+            dst.write(data)
+        data = compressor.flush()
+        compress_size += len(data)
+        dst.write(data)
+    return compress_size
+
+
+def _end_of_central_directory(
+    n_entries: int, central_dir_size: int, central_dir_offset: int
+) -> bytes:
+    records = b""
+    if n_entries > MAX_UINT16:
+        zip64_offset = central_dir_offset + central_dir_size
+        records += ZIP64_END_OF_CENTRAL_DIR_STRUCT.pack(
+            ZIP64_END_OF_CENTRAL_DIR_SIGNATURE,
+            ZIP64_END_OF_CENTRAL_DIR_STRUCT.size - 12,
+            UNIX_CREATOR << 8 | ZIP64_VERSION,
+            ZIP64_VERSION,
+            0,
+            0,
+            n_entries,
+            n_entries,
+            central_dir_size,
+            central_dir_offset,
+        )
+        records += ZIP64_END_OF_CENTRAL_DIR_LOCATOR_STRUCT.pack(
+            ZIP64_END_OF_CENTRAL_DIR_LOCATOR_SIGNATURE, 0, zip64_offset, 1
+        )
+    return records + END_OF_CENTRAL_DIR_STRUCT.pack(
+        END_OF_CENTRAL_DIR_SIGNATURE,
+        0,
+        0,
+        min(n_entries, MAX_UINT16),
+        min(n_entries, MAX_UINT16),
+        central_dir_size,
+        central_dir_offset,
+        0,
+    )
+
+
+def iter_file_range(path: str, start: int, length: int) -> Iterator[bytes]:
+    """Iterate over length bytes of a file, starting at start."""
+    with open(path, mode="rb") as data:
+        data.seek(start)
+        while length > 0:
+            chunk = data.read(min(COPY_BUFFER_SIZE, length))
+            if not chunk:
+                raise ValueError(f"Unexpected end of file in {path}")
+            length -= len(chunk)
+            yield chunk
+
+
+def _group_members(entries: Iterable[ZipEntry]) -> Iterator[list[ZipEntry]]:
+    """Group the consecutive entries stored next to each other in an archive."""
+    group: list[ZipEntry] = []
+    for entry in entries:
+        if group and not (
+            entry.in_archive
+            and group[-1].in_archive
+            and entry.data_path == group[-1].data_path
+            and entry.data_offset - entry.local_header_size
+            == group[-1].data_offset + group[-1].compress_size
+        ):
+            yield group
+            group = []
+        group.append(entry)
+    if group:
+        yield group
+
+
+def iter_archive(entries: Iterable[ZipEntry]) -> Iterator[bytes]:
+    """Iterate over the bytes of a zip archive made of the entries.
+
+    Compressed data is copied without being recompressed.
+    """
+    central_dir = []
+    offset = 0
+    for group in _group_members(entries):
+        start = offset
+        for entry in group:
+            if offset > MAX_UINT32 or entry.compress_size > MAX_UINT32:
+                raise ValueError("Archives larger than 4 GiB are not supported")
+            central_dir.append(entry.central_header(offset))
+            offset += entry.local_header_size + entry.compress_size
+
+        first = group[0]
+        if first.in_archive:
+            # The members are copied as-is from the other archive
+            yield from iter_file_range(
+                first.data_path,
+                first.data_offset - first.local_header_size,
+                offset - start,
+            )
+        else:
+            yield first.local_header()
+            yield from iter_file_range(
+                first.data_path, first.data_offset, first.compress_size
+            )
+
+    central_dir_size = sum(len(header) for header in central_dir)
+    yield b"".join(central_dir)
+    yield _end_of_central_directory(len(central_dir), central_dir_size, offset)
+
+
+def write_archive(fp: BinaryIO, entries: Iterable[ZipEntry]) -> int:
+    """Write a zip archive made of the entries.
+
+    :returns: the size of the archive
+    """
+    size = 0
+    for chunk in iter_archive(entries):
+        fp.write(chunk)
+        size += len(chunk)
+    return size
+
+
+def archive_size(entries: Iterable[ZipEntry]) -> int:
+    """Compute the size of the archive that write_archive would write."""
+    offset = 0
+    central_dir_size = 0
+    n_entries = 0
+    for entry in entries:
+        offset += entry.local_header_size + entry.compress_size
+        central_dir_size += CENTRAL_HEADER_STRUCT.size + len(entry.encoded_name)
+        n_entries += 1
+    end_records = _end_of_central_directory(n_entries, central_dir_size, offset)
+    return offset + central_dir_size + len(end_records)
+
+
+def archive_digest(entries: Iterable[ZipEntry]) -> str:
+    """Compute a digest of the archive made of the entries.
+
+    The digest only depends on the metadata and the content of the members,
+    it can be computed without writing the archive.
+    """
+    sha256 = hashlib.sha256()
+    for entry in entries:
+        if not entry.sha256:
+            raise ValueError(f"Missing content hash for {entry.arcname}")
+        sha256.update(entry.central_header(0))
+        sha256.update(bytes.fromhex(entry.sha256))
+    return sha256.hexdigest()
+
+
+def list_archive_files(
+    source: str,
+    exclude: Iterable[str] = (),
+    ignore: Optional[Callable[[str], bool]] = None,
+) -> dict[str, str]:
+    """List the files in source by their name in the archive.
+
+    :param ignore: whether a file is left out, given its name in the archive
+    """
+    files = {
+        os.path.relpath(file, source).replace(os.sep, "/"): file
+        for file in list_files(source, exclude=exclude)
+    }
+    if ignore:
+        return {arcname: file for arcname, file in files.items() if not ignore(arcname)}
+    return files
+
+
+class ArchiveStream(io.RawIOBase):
+    """Readable stream of an archive, written while it is being read.
+
+    The archive is assembled from the compressed members of its entries
+    by a background thread into a bounded buffer, so that reading the members
+    and uploading them overlap.
+    The memory used does not depend on the size of the archive.
+
+    :param max_chunks: number of chunks the buffer can hold
+    """
+
+    def __init__(self, entries: list[ZipEntry], max_chunks: int = 8) -> None:
+        super().__init__()
+        self.size = archive_size(entries)
+        self.position = 0
+        self._chunks: queue.Queue = queue.Queue(maxsize=max_chunks)
+        self._pending = memoryview(b"")
+        self._stopped = threading.Event()
+        self._producer = threading.Thread(
+            target=self._produce, args=(entries,), daemon=True
+        )
+        self._producer.start()
+
+    def _put(self, item: object) -> bool:
+        while not self._stopped.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, entries: list[ZipEntry]) -> None:
+        try:
+            for chunk in iter_archive(entries):
+                if chunk and not self._put(chunk):
+                    return
+            self._put(None)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # Raised again in the reading thread
+            self._put(e)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def readinto(self, buffer) -> int:  # type: ignore
+        if not self._pending:
+            chunk = self._chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if chunk is None:
+                # Allows more reads to return EOF as well
+                self._chunks.put(None)
+                return 0
+            self._pending = memoryview(chunk)
+        n_bytes = min(len(buffer), len(self._pending))
+        buffer[:n_bytes] = self._pending[:n_bytes]
+        self._pending = self._pending[n_bytes:]
+        self.position += n_bytes
+        return n_bytes
+
+    def close(self) -> None:
+        self._stopped.set()
+        super().close()
@@ -1,24 +1,23 @@
 import os
-from zipfile import ZipFile
+from typing import Iterable
 
 
-def list_files(source: str) -> list[str]:
-    """Lists files contained in the source directory."""
+def list_files(source: str, exclude: Iterable[str] = ()) -> list[str]:
+    """Lists files contained in the source directory.
 
+    :param exclude: directories, relative to source, which will not be walked into
+    """
+
+    excluded = {os.path.normpath(path) for path in exclude}
     zip_files = []
 
-    for path, _subdirs, files in os.walk(source):
+    for path, subdirs, files in os.walk(source):
+        subdirs[:] = [
+            subdir
+            for subdir in subdirs
+            if os.path.relpath(os.path.join(path, subdir), source) not in excluded
+        ]
         for name in files:
             zip_files.append(os.path.join(path, name))
 
     return zip_files
-
-
-def create_zip_file(zip_path: str, source: str) -> None:
-    """Creates an archive to zip_path from source."""
-
-    files = list_files(source)
-
-    with ZipFile(zip_path, "w", strict_timestamps=False) as zip_file:
-        for file in files:
-            zip_file.write(file)
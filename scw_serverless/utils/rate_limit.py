@@ -0,0 +1,39 @@
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket which can be shared between threads.
+
+    Tokens can be taken before they are available, later callers
+    then wait for the debt to be paid back.
+
+    :param rate: number of tokens added per second
+    :param capacity: maximum number of tokens, defaults to one second of tokens
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError("The rate of a token bucket must be positive")
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> float:
+        """Take tokens from the bucket, waiting until they are available.
+
+        :returns: the time spent waiting, in seconds
+        """
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.updated_at
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,84 @@
+import subprocess
+import sys
+from typing import Optional
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from scw_serverless import loader
+from scw_serverless.cli import cli
+from scw_serverless.manifest import MANIFEST_FILE
+
+# Modules imported only by the subcommands which use them
+HEAVY_MODULES = {"scaleway", "scaleway_core", "requests", "flask", "yaml"}
+# Import time of the CLI, relative to the import time of click alone
+IMPORT_BUDGET_RATIO = 5
+HELP_ARGS = [["--help"], ["deploy", "--help"], ["plan", "--help"], ["dev", "--help"]]
+
+
+def get_import_times(code: str, *args: str) -> dict[str, float]:
+    """Run code with python -X importtime and parse the cumulative times."""
+    cmd = subprocess.run(
+        args=[sys.executable, "-X", "importtime", "-c", code, *args],
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+    # click exits with 0 after printing the help
+    assert cmd.returncode == 0, cmd.stderr
+    import_times = {}
+    for line in cmd.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.removeprefix("import time:").split("|")
+        import_times[module.strip()] = int(cumulative) / 1e6
+    return import_times
+
+
+def get_cli_import_times(*args: str) -> dict[str, float]:
+    return get_import_times("from scw_serverless.cli import cli; cli()", *args)
+
+
+@pytest.mark.parametrize("args", HELP_ARGS)
+def test_cli_cold_start(args: list[str]):
+    import_times = get_cli_import_times(*args)
+
+    top_level = {module.split(".", 1)[0] for module in import_times}
+    assert not top_level & HEAVY_MODULES
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("args", HELP_ARGS)
+def test_cli_import_time(args: list[str]):
+    # Best of a few runs, compared to the same interpreter importing click
+    baseline = min(get_import_times("import click")["click"] for _ in range(3))
+    import_time = min(
+        get_cli_import_times(*args)["scw_serverless.cli"] for _ in range(3)
+    )
+
+    assert import_time < IMPORT_BUDGET_RATIO * baseline
+
+
+@pytest.mark.parametrize(
+    ("flag", "static", "manifest_file"),
+    [([], True, MANIFEST_FILE), (["--no-static-discovery"], False, None)],
+)
+def test_static_discovery_opt_out(
+    monkeypatch: pytest.MonkeyPatch,
+    flag: list[str],
+    static: bool,
+    manifest_file: Optional[str],
+):
+    calls = []
+
+    def load_app_instance(_file, **kwargs):
+        calls.append(kwargs)
+        raise click.Abort()
+
+    monkeypatch.setattr(loader, "load_app_instance", load_app_instance)
+
+    result = CliRunner().invoke(cli, ["plan", __file__, *flag])
+
+    assert result.exit_code == 1
+    assert calls == [{"static": static, "manifest_file": manifest_file}]
@@ -1,12 +1,14 @@
+import errno
 import os
 import shutil
 import tempfile
 from pathlib import Path
 from typing import Iterable
+from unittest.mock import MagicMock
 
 import pytest
 
-from scw_serverless.dependencies_manager import DependenciesManager
+from scw_serverless.dependencies_manager import DependenciesManager, _merge_tree
 
 
 @pytest.fixture(name="pkg_folder")
@@ -44,3 +46,79 @@ def test_dependencies_manager_install_scw_from_local(pkg_folder: Path):
 
     assert "yaml" in installed
     assert "scw_serverless" in installed
+
+
+def test_dependencies_manager_reuses_package_folder(pkg_folder: Path):
+    req_path = pkg_folder.joinpath("requirements.txt")
+    with open(req_path, mode="w", encoding="utf-8") as fp:
+        fp.write("PyYAML==6.0.1")
+
+    manager = DependenciesManager(pkg_folder, pkg_folder)
+    manager.generate_package_folder()
+
+    # Nothing is installed when the requirements are unchanged
+    run_pip_install = manager._run_pip_install
+    manager._run_pip_install = MagicMock()  # type: ignore
+    manager.generate_package_folder()
+    manager._run_pip_install.assert_not_called()
+    manager._run_pip_install = run_pip_install  # type: ignore
+
+    # Only the distributions which changed are installed or uninstalled
+    with open(req_path, mode="w", encoding="utf-8") as fp:
+        fp.write("PyYAML==6.0.2")
+    unchanged_path = pkg_folder.joinpath("package", "flask", "__init__.py")
+    unchanged_mtime = unchanged_path.stat().st_mtime
+    manager.generate_package_folder()
+
+    installed = os.listdir(os.path.join(pkg_folder, "package"))
+    assert "PyYAML-6.0.2.dist-info" in installed
+    assert "PyYAML-6.0.1.dist-info" not in installed
+    assert "scw_serverless" in installed
+    assert unchanged_path.stat().st_mtime == unchanged_mtime
+
+
+def test_dependencies_manager_installs_wheels_for_runtime(pkg_folder: Path):
+    req_path = pkg_folder.joinpath("requirements.txt")
+    with open(req_path, mode="w", encoding="utf-8") as fp:
+        fp.write("PyYAML==6.0.1")
+
+    manager = DependenciesManager(pkg_folder, pkg_folder, runtime="python310")
+    manager.generate_package_folder()
+
+    # The native extension is built for the runtime, not the local interpreter
+    yaml_files = os.listdir(os.path.join(pkg_folder, "package", "yaml"))
+    assert "_yaml.cpython-310-x86_64-linux-gnu.so" in yaml_files
+    assert any(
+        wheel.name.startswith("PyYAML-6.0.1")
+        for wheel in manager.wheelhouse_path.iterdir()
+    )
+
+    # Native extensions are not kept when the runtime changes
+    manager = DependenciesManager(pkg_folder, pkg_folder, runtime="python311")
+    manager.generate_package_folder()
+
+    yaml_files = os.listdir(os.path.join(pkg_folder, "package", "yaml"))
+    assert "_yaml.cpython-311-x86_64-linux-gnu.so" in yaml_files
+    assert "_yaml.cpython-310-x86_64-linux-gnu.so" not in yaml_files
+
+
+def test_merge_tree_across_filesystems(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    staging = tmp_path.joinpath("staging")
+    staging.joinpath("lib").mkdir(parents=True)
+    staging.joinpath("lib", "core.py").write_text("VALUE = 2\n", encoding="utf-8")
+    package = tmp_path.joinpath("package")
+    package.joinpath("lib").mkdir(parents=True)
+    package.joinpath("lib", "core.py").write_text("VALUE = 1\n", encoding="utf-8")
+
+    def rename(src, dst):
+        raise OSError(errno.EXDEV, "Invalid cross-device link", src, None, dst)
+
+    # Files cannot be renamed from another filesystem
+    monkeypatch.setattr(os, "rename", rename)
+    monkeypatch.setattr(os, "replace", rename)
+    _merge_tree(staging, package)
+
+    assert package.joinpath("lib", "core.py").read_text(encoding="utf-8") == (
+        "VALUE = 2\n"
+    )
+    assert not staging.joinpath("lib", "core.py").exists()
@@ -0,0 +1,133 @@
+import inspect
+from unittest.mock import MagicMock
+
+import pytest
+import responses
+import scaleway.function.v1beta1 as sdk
+from scaleway import Client, ScalewayException
+from scaleway_core.api import API
+from urllib3 import HTTPResponse
+
+from scw_serverless.deployment.api_client import (
+    DEFAULT_RETRY,
+    APIStats,
+    SessionFunctionAPI,
+    create_session,
+)
+from tests import constants
+
+NAMESPACES_URL = constants.SCALEWAY_FNC_API_URL + "/namespaces"
+
+
+def get_test_client() -> Client:
+    return Client(
+        access_key="SCWXXXXXXXXXXXXXXXXX",
+        secret_key="498cce73-2a07-4e8c-b8ef-8f988e3c6929",  # nosec # fake data
+        default_region=constants.DEFAULT_REGION,
+    )
+
+
+def get_test_api(**kwargs) -> SessionFunctionAPI:
+    kwargs.setdefault("retry", DEFAULT_RETRY.new(backoff_factor=0.001))
+    return SessionFunctionAPI(get_test_client(), **kwargs)
+
+
+def test_session_function_api_uses_the_session():
+    session = create_session()
+    session.request = MagicMock(wraps=session.request)  # type: ignore
+    api = get_test_api(session=session)
+
+    with responses.RequestsMock() as rsps:
+        rsps.get(NAMESPACES_URL, json={"namespaces": [], "total_count": 0})
+        assert not api.list_namespaces(name="test-namespace").namespaces
+
+        session.request.assert_called_once()
+        request = rsps.calls[0].request
+        assert request.headers["x-auth-token"] == api.client.secret_key
+        assert request.params["name"] == "test-namespace"
+
+
+def test_session_function_api_sends_the_requests_of_the_sdk():
+    # The requests are built like the SDK does in the private API._request
+    assert inspect.signature(SessionFunctionAPI._request) == inspect.signature(
+        API._request
+    )
+    namespace = {"id": "namespace-id", "secret_environment_variables": []}
+
+    sent = []
+    for api in [sdk.FunctionV1Beta1API(get_test_client()), get_test_api()]:
+        with responses.RequestsMock() as rsps:
+            rsps.patch(NAMESPACES_URL + "/namespace-id", json=namespace)
+            api.update_namespace(namespace_id="namespace-id", description="test")
+            sent.append(rsps.calls[0].request)
+
+    sdk_request, request = sent[0], sent[1]
+    assert request.url == sdk_request.url
+    assert request.body == sdk_request.body
+    for header in ["accept", "x-auth-token", "user-agent", "content-type"]:
+        assert request.headers[header] == sdk_request.headers[header]
+
+
+def test_session_function_api_retries_idempotent_requests():
+    api = get_test_api()
+
+    with responses.RequestsMock() as rsps:
+        rsps.get(NAMESPACES_URL, status=503, json={"message": "unavailable"})
+        rsps.get(NAMESPACES_URL, json={"namespaces": [], "total_count": 0})
+        assert not api.list_namespaces().namespaces
+
+    assert (api.stats.calls, api.stats.retries) == (2, 1)
+
+
+def test_session_function_api_does_not_retry_non_idempotent_requests():
+    api = get_test_api()
+
+    with responses.RequestsMock() as rsps:
+        rsps.post(NAMESPACES_URL, status=503, json={"message": "unavailable"})
+        with pytest.raises(ScalewayException):
+            api.create_namespace(name="test-namespace")
+
+    assert (api.stats.calls, api.stats.retries) == (1, 0)
+
+
+def test_session_function_api_retries_throttled_requests():
+    api = get_test_api()
+    namespace = {"id": "namespace-id", "secret_environment_variables": []}
+
+    with responses.RequestsMock() as rsps:
+        rsps.post(
+            NAMESPACES_URL,
+            status=429,
+            headers={"Retry-After": "0"},
+            json={"message": "too many requests"},
+        )
+        rsps.post(NAMESPACES_URL, json=namespace)
+        assert api.create_namespace(name="test-namespace").id == "namespace-id"
+
+    assert (api.stats.calls, api.stats.retries) == (2, 1)
+
+
+def test_session_function_api_raises_once_retries_are_exhausted():
+    api = get_test_api(retry=DEFAULT_RETRY.new(total=1, backoff_factor=0))
+
+    with responses.RequestsMock() as rsps:
+        rsps.get(NAMESPACES_URL, status=503, json={"message": "unavailable"})
+        rsps.get(NAMESPACES_URL, status=503, json={"message": "unavailable"})
+        with pytest.raises(ScalewayException):
+            api.list_namespaces()
+
+    assert (api.stats.calls, api.stats.retries) == (2, 1)
+
+
+def test_retry_honors_retry_after(monkeypatch: pytest.MonkeyPatch):
+    sleeps = []
+    monkeypatch.setattr("time.sleep", sleeps.append)
+    stats = APIStats()
+    retry = DEFAULT_RETRY.new(stats=stats)
+
+    response = HTTPResponse(status=429, headers={"Retry-After": "2"})
+    retry = retry.increment("POST", NAMESPACES_URL, response=response)
+    retry.sleep(response)
+
+    assert sleeps == [2]
+    assert (stats.calls, stats.retries) == (1, 1)
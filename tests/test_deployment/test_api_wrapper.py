@@ -0,0 +1,114 @@
+from unittest.mock import MagicMock
+
+from scaleway import ScalewayException
+from scaleway.function.v1beta1.marshalling import unmarshal_Cron, unmarshal_Function
+
+from scw_serverless.config.triggers import CronTrigger
+from scw_serverless.deployment.api_wrapper import FunctionAPIWrapper, NamespaceInventory
+
+
+def test_delete_all_from_ns_except():
+    functions = [
+        unmarshal_Function(
+            {"id": f"{name}-id", "name": name, "secret_environment_variables": []}
+        )
+        for name in ("kept", "stale", "gone")
+    ]
+    crons = [
+        unmarshal_Cron({"id": f"{name}-id", "name": name, "function_id": function_id})
+        for name, function_id in (
+            ("kept-cron", "kept-id"),
+            ("stale-cron", "kept-id"),
+            ("deleted-with-function", "stale-id"),
+        )
+    ]
+    inventory = NamespaceInventory("namespace-id", functions=functions, crons=crons)
+
+    api = MagicMock()
+
+    def delete_function(function_id: str) -> None:
+        if function_id == "gone-id":
+            raise ScalewayException(MagicMock(status_code=404))
+
+    api.delete_function.side_effect = delete_function
+
+    summary = FunctionAPIWrapper(api).delete_all_from_ns_except(
+        inventory, function_ids=["kept-id"], cron_ids=["kept-cron-id"]
+    )
+
+    assert sorted(summary.functions) == ["stale"]
+    assert summary.crons == ["stale-cron"]
+    assert summary.already_deleted == ["gone"]
+    api.delete_cron.assert_called_once_with(cron_id="stale-cron-id")
+
+
+def test_is_cron_up_to_date_compares_canonical_args():
+    cron = unmarshal_Cron(
+        {
+            "id": "cron-id",
+            "name": "hourly",
+            "function_id": "function-id",
+            "schedule": "0 * * * *",
+            "args": {"b": [1, 2], "a": {"y": 1, "x": 2}},
+        }
+    )
+    api = FunctionAPIWrapper(MagicMock())
+
+    trigger = CronTrigger(
+        "0 * * * *", name="hourly", args={"a": {"x": 2, "y": 1}, "b": [1, 2]}
+    )
+    assert api.is_cron_up_to_date(cron, trigger)
+
+    trigger = CronTrigger(
+        "0 * * * *", name="hourly", args={"a": {"x": 2, "y": 1}, "b": [2, 1]}
+    )
+    assert not api.is_cron_up_to_date(cron, trigger)
+
+
+def test_update_cron_trigger():
+    api = MagicMock()
+    wrapper = FunctionAPIWrapper(api)
+    wrapper.wait_for_cron = MagicMock()  # type: ignore
+
+    trigger = CronTrigger("0 0 * * *", name="daily", args={"key": "value"})
+    wrapper.update_cron_trigger("function-id", "cron-id", trigger)
+
+    api.create_cron.assert_not_called()
+    api.update_cron.assert_called_once_with(
+        cron_id="cron-id",
+        function_id="function-id",
+        schedule="0 0 * * *",
+        name="daily",
+        args={"key": "value"},
+    )
+    wrapper.wait_for_cron.assert_called_once_with(
+        function_id="function-id", cron_id=api.update_cron.return_value.id
+    )
+
+
+def test_get_inventory_by_id():
+    function = unmarshal_Function(
+        {
+            "id": "function-id",
+            "name": "function",
+            "namespace_id": "namespace-id",
+            "secret_environment_variables": [],
+        }
+    )
+    cron = unmarshal_Cron(
+        {"id": "cron-id", "name": "cron", "function_id": "function-id"}
+    )
+    api = MagicMock()
+    api.get_function.return_value = function
+    api.get_cron.return_value = cron
+    wrapper = FunctionAPIWrapper(api)
+
+    inventory = wrapper.get_inventory("namespace-id", ["function-id"], ["cron-id"])
+    assert inventory
+    assert inventory.find_cron("function-id", "cron") == cron
+
+    # The resources are listed when one of them no longer exists
+    api.get_cron.side_effect = ScalewayException(MagicMock(status_code=404))
+    assert not wrapper.get_inventory("namespace-id", ["function-id"], ["cron-id"])
+    # or was moved to another namespace
+    assert not wrapper.get_inventory("other-namespace-id", ["function-id"], [])
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Iterable
+
+import pytest
+
+from scw_serverless.deployment.build_cache import BuildCache
+from scw_serverless.deployment.layer import DependencyLayer
+from scw_serverless.utils.archive import CompressionPolicy, archive_digest
+
+
+@pytest.fixture(name="project_dir")
+def clean_up_project_dir() -> Iterable[Path]:
+    folder = Path(tempfile.mkdtemp())
+    folder.joinpath("package", "dep").mkdir(parents=True)
+    folder.joinpath("handler.py").write_text(
+        "def handle(event, context): ...\n", encoding="utf-8"
+    )
+    folder.joinpath("package", "dep", "__init__.py").write_text(
+        "VALUE = 42\n" * 100, encoding="utf-8"
+    )
+    yield folder
+    shutil.rmtree(folder)
+
+
+def build(project_dir: Path) -> tuple[BuildCache, dict[str, bytes]]:
+    cache = BuildCache(str(project_dir / ".scw" / "cache"))
+    zip_path = str(project_dir / ".scw" / "deployment.zip")
+    archive = cache.build_archive(zip_path, str(project_dir), exclude=[".scw"])
+    assert archive.size == os.path.getsize(zip_path)
+    with zipfile.ZipFile(zip_path) as archive:
+        assert archive.testzip() is None
+        return cache, {name: archive.read(name) for name in archive.namelist()}
+
+
+def test_build_cache_reuses_unchanged_files(project_dir: Path):
+    cache, files = build(project_dir)
+    assert cache.misses == 2
+    assert files == {
+        "handler.py": b"def handle(event, context): ...\n",
+        "package/dep/__init__.py": b"VALUE = 42\n" * 100,
+    }
+
+    project_dir.joinpath("handler.py").write_text(
+        "def handle(event, context): 1\n", encoding="utf-8"
+    )
+    cache, files = build(project_dir)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert files["handler.py"] == b"def handle(event, context): 1\n"
+
+
+def test_build_cache_forgets_removed_files(project_dir: Path):
+    build(project_dir)
+    project_dir.joinpath("handler.py").unlink()
+
+    cache, files = build(project_dir)
+    assert list(files) == ["package/dep/__init__.py"]
+    assert list(cache.index) == ["package/dep/__init__.py"]
+    assert len(os.listdir(cache.objects_path)) == 1
+
+
+def test_build_cache_archive_is_reproducible(project_dir: Path):
+    cache = BuildCache(str(project_dir / ".scw" / "cache"))
+    zip_path = str(project_dir / ".scw" / "deployment.zip")
+    first = cache.build_archive(zip_path, str(project_dir), exclude=[".scw"])
+
+    os.utime(project_dir / "handler.py", (0, 0))
+    shutil.rmtree(cache.cache_dir)
+    cache = BuildCache(str(project_dir / ".scw" / "cache"))
+    second = cache.build_archive(zip_path, str(project_dir), exclude=[".scw"])
+
+    assert first.digest == second.digest
+
+
+def test_build_cache_compression_policy(project_dir: Path):
+    project_dir.joinpath("package", "dep", "native.so").write_bytes(b"\x7fELF" * 100)
+    os.chmod(project_dir / "handler.py", 0o775)
+
+    cache = BuildCache(
+        str(project_dir / ".scw" / "cache"),
+        policy=CompressionPolicy(level=9),
+        max_workers=2,
+    )
+    zip_path = str(project_dir / ".scw" / "deployment.zip")
+    cache.build_archive(zip_path, str(project_dir), exclude=[".scw"])
+
+    with zipfile.ZipFile(zip_path) as archive:
+        infos = {info.filename: info for info in archive.infolist()}
+    assert infos["package/dep/native.so"].compress_type == zipfile.ZIP_STORED
+    assert infos["package/dep/__init__.py"].compress_type == zipfile.ZIP_DEFLATED
+    assert infos["handler.py"].external_attr >> 16 == 0o100755
+    assert infos["package/dep/__init__.py"].external_attr >> 16 == 0o100644
+    assert all(info.date_time == (1980, 1, 1, 0, 0, 0) for info in infos.values())
+
+    # Changing the policy invalidates the cached members
+    cache = BuildCache(str(project_dir / ".scw" / "cache"))
+    cache.build_archive(zip_path, str(project_dir), exclude=[".scw"])
+    assert cache.hits == 1  # The stored file is not affected by the level
+
+
+def test_dependency_layer_is_merged_without_recompression(project_dir: Path):
+    project_dir.joinpath("package", "dep", "core.py").write_text(
+        "CORE = 1\n", encoding="utf-8"
+    )
+    files = {
+        path.relative_to(project_dir).as_posix(): str(path)
+        for path in project_dir.rglob("*")
+        if path.is_file()
+    }
+    package_files = {k: v for k, v in files.items() if k.startswith("package/")}
+    app_files = {k: v for k, v in files.items() if k not in package_files}
+
+    cache = BuildCache(str(project_dir / ".scw" / "cache"))
+    expected = cache.get_entries(files)
+
+    layer = DependencyLayer(str(project_dir / ".scw" / "layer"))
+    layer_entries = layer.get_entries(package_files)
+    assert layer.rebuilt
+    assert all(entry.in_archive for entry in layer_entries)
+    entries = sorted(
+        cache.get_entries(app_files) + layer_entries, key=lambda e: e.arcname
+    )
+    zip_path = str(project_dir / ".scw" / "deployment.zip")
+    archive = cache.write_archive(zip_path, entries)
+
+    # The archive is the same as the one built without layers
+    assert archive.digest == archive_digest(expected)
+    with zipfile.ZipFile(zip_path) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.read("package/dep/core.py") == b"CORE = 1\n"
+
+    layer = DependencyLayer(str(project_dir / ".scw" / "layer"))
+    assert layer.get_entries(package_files) == layer_entries
+    assert not layer.rebuilt
@@ -1,4 +1,4 @@
-from typing import Any
+import threading
 from unittest.mock import MagicMock
 
 import pytest
@@ -6,14 +6,29 @@ import responses
 import scaleway.function.v1beta1 as sdk
 from responses import matchers
 from scaleway import Client
+from scaleway.function.v1beta1.marshalling import unmarshal_Cron, unmarshal_Function
 
 from scw_serverless.app import Serverless
 from scw_serverless.config import Function
+from scw_serverless.config.route import GatewayRoute, HTTPMethod
 from scw_serverless.config.triggers import CronTrigger
 from scw_serverless.deployment import DeploymentManager
+from scw_serverless.deployment.api_wrapper import NamespaceInventory
+from scw_serverless.deployment.build_cache import DeploymentArchive
+from scw_serverless.deployment.digest import (
+    DIGEST_ENV_VAR,
+    NAMESPACE_DIGEST_ENV_VAR,
+    digest_with_secrets,
+    salted_secrets_digest,
+)
+from scw_serverless.deployment.plan import Action, ResourceKind
+from scw_serverless.deployment.state import DeploymentState, FunctionState, load_state
+from scw_serverless.deployment.status_poller import PollingOptions
 from tests import constants
+from tests.test_gateway.memory_gateway import InMemoryGateway
 
 RUNTIME = sdk.FunctionRuntime.PYTHON311
+ARCHIVE = DeploymentArchive(path="deployment.zip", size=300, digest="archive-digest")
 
 
 # pylint: disable=redefined-outer-name # fixture
@@ -23,15 +38,6 @@ def mocked_responses():
         yield rsps
 
 
-@pytest.fixture(autouse=True)
-def mocked_pool_starmap(monkeypatch: Any):
-    """Provides a simple starmap implementation which does not rely on pickling."""
-    monkeypatch.setattr(
-        "multiprocessing.pool.Pool.starmap",
-        lambda self, func, args: [func(*arg) for arg in args],
-    )
-
-
 def get_test_backend() -> DeploymentManager:
     app = Serverless("test-namespace")
     client = Client(
@@ -40,16 +46,48 @@ def get_test_backend() -> DeploymentManager:
         secret_key="498cce73-2a07-4e8c-b8ef-8f988e3c6929",  # nosec # fake data
         default_region=constants.DEFAULT_REGION,
     )
-    backend = DeploymentManager(app, client, False, runtime=RUNTIME)
+    backend = DeploymentManager(app, client, False, runtime=RUNTIME, state_file=None)
+    backend.api.polling = PollingOptions(min_interval=0.01, max_interval=0.1, timeout=5)
     # This would otherwise create some side effects
     create_zip = MagicMock()
-    create_zip.return_value = 300
+    create_zip.return_value = ARCHIVE
     backend._create_deployment_zip = create_zip
     # This is mocked because it reads the zip
     backend._upload_deployment_zip = MagicMock()
     return backend
 
 
+def mock_functions_listing(
+    mocked_responses: responses.RequestsMock, namespace_id: str, functions: list
+) -> None:
+    """Mock a listing of the functions of a namespace."""
+    for page, page_functions in ((1, functions), (2, [])):
+        mocked_responses.get(
+            constants.SCALEWAY_FNC_API_URL + "/functions",
+            match=[
+                matchers.query_param_matcher(
+                    {"namespace_id": namespace_id, "page": page}
+                ),
+            ],
+            json={"functions": page_functions},
+        )
+
+
+def mock_digest_update(mocked_responses: responses.RequestsMock, function: dict):
+    """Mock the update recording the digest once the function is deployed."""
+    digest = digest_with_secrets(ARCHIVE.digest, None)
+    mocked_responses.patch(
+        f'{constants.SCALEWAY_FNC_API_URL}/functions/{function["id"]}',
+        match=[
+            matchers.json_params_matcher(
+                {"redeploy": False, "environment_variables": {DIGEST_ENV_VAR: digest}},
+                strict_match=False,
+            )
+        ],
+        json=function | {"environment_variables": {DIGEST_ENV_VAR: digest}},
+    )
+
+
 def test_scaleway_api_backend_deploy_function(mocked_responses: responses.RequestsMock):
     function = Function(
         name="test-function",
@@ -77,13 +115,11 @@ def test_scaleway_api_backend_deploy_function(mocked_responses: responses.Reques
         f'{ constants.SCALEWAY_FNC_API_URL}/namespaces/{namespace["id"]}',
         json=namespace | {"status": sdk.NamespaceStatus.READY},
     )
-    # Looking for existing function
+    # Listing the deployed functions
     mocked_responses.get(
         constants.SCALEWAY_FNC_API_URL + "/functions",
         match=[
-            matchers.query_param_matcher(
-                {"namespace_id": namespace["id"], "page": 1, "name": function.name}
-            ),
+            matchers.query_param_matcher({"namespace_id": namespace["id"], "page": 1}),
         ],
         json={"functions": []},
     )
@@ -119,15 +155,12 @@ def test_scaleway_api_backend_deploy_function(mocked_responses: responses.Reques
         test_fn_api_url + "/deploy",
         json=mocked_fn,
     )
-    # Poll the status
-    mocked_responses.get(
-        test_fn_api_url,
-        json=mocked_fn | {"status": sdk.FunctionStatus.PENDING},
-    )
-    mocked_responses.get(
-        test_fn_api_url,
-        json=mocked_fn | {"status": sdk.FunctionStatus.READY},
-    )
+    # Poll the status by listing the functions of the namespace
+    for status in (sdk.FunctionStatus.PENDING, sdk.FunctionStatus.READY):
+        mock_functions_listing(
+            mocked_responses, namespace["id"], [mocked_fn | {"status": status}]
+        )
+    mock_digest_update(mocked_responses, mocked_fn)
     backend.deploy()
 
 
@@ -163,13 +196,11 @@ def test_scaleway_api_backend_deploy_function_with_trigger(
         f'{ constants.SCALEWAY_FNC_API_URL}/namespaces/{namespace["id"]}',
         json=namespace | {"status": sdk.NamespaceStatus.READY},
     )
-    # Looking for existing function
+    # Listing the deployed functions
     mocked_responses.get(
         constants.SCALEWAY_FNC_API_URL + "/functions",
         match=[
-            matchers.query_param_matcher(
-                {"namespace_id": namespace["id"], "page": 1, "name": function.name}
-            ),
+            matchers.query_param_matcher({"namespace_id": namespace["id"], "page": 1}),
         ],
         json={"functions": []},
     )
@@ -205,20 +236,14 @@ def test_scaleway_api_backend_deploy_function_with_trigger(
         test_fn_api_url + "/deploy",
         json=mocked_fn,
     )
-    # Poll the status
-    mocked_responses.get(
-        test_fn_api_url,
-        json=mocked_fn | {"status": sdk.FunctionStatus.READY},
+    # Poll the status by listing the functions of the namespace
+    mock_functions_listing(
+        mocked_responses,
+        namespace["id"],
+        [mocked_fn | {"status": sdk.FunctionStatus.READY}],
     )
-    # Looking for existing cron
-    mocked_responses.get(
-        constants.SCALEWAY_FNC_API_URL + "/crons",
-        match=[
-            matchers.query_param_matcher({"function_id": mocked_fn["id"], "page": 1})
-        ],
-        json={"crons": []},
-    )
-    cron = {"id": "cron-id"}
+    mock_digest_update(mocked_responses, mocked_fn)
+    cron = {"id": "cron-id", "function_id": mocked_fn["id"]}
     mocked_responses.post(
         constants.SCALEWAY_FNC_API_URL + "/crons",
         match=[
@@ -233,9 +258,335 @@ def test_scaleway_api_backend_deploy_function_with_trigger(
         ],
         json=cron,
     )
-    # Poll the status
+    # Poll the status by listing the crons of the function
+    mocked_responses.get(
+        constants.SCALEWAY_FNC_API_URL + "/crons",
+        match=[
+            matchers.query_param_matcher({"function_id": mocked_fn["id"], "page": 1})
+        ],
+        json={"crons": [cron | {"status": sdk.CronStatus.READY}]},
+    )
+    mocked_responses.get(
+        constants.SCALEWAY_FNC_API_URL + "/crons",
+        match=[
+            matchers.query_param_matcher({"function_id": mocked_fn["id"], "page": 2})
+        ],
+        json={"crons": []},
+    )
+    backend.deploy()
+
+
+def test_scaleway_api_backend_skips_up_to_date_function(
+    mocked_responses: responses.RequestsMock,
+):
+    function = Function(
+        name="test-function",
+        handler_path="handler",
+        secret_environment_variables={"token": "secret"},
+    )
+    backend = get_test_backend()
+    backend.app_instance.functions = [function]
+
+    namespace = {
+        "id": "namespace-id",
+        "name": backend.app_instance.service_name,
+        "secret_environment_variables": [],  # Otherwise breaks the marshalling
+        "status": sdk.NamespaceStatus.READY,
+        "environment_variables": {
+            NAMESPACE_DIGEST_ENV_VAR: salted_secrets_digest(None)
+        },
+    }
+    mocked_responses.get(
+        constants.SCALEWAY_FNC_API_URL + "/namespaces",
+        json={"namespaces": [namespace]},
+    )
+    # Stop gap, otherwise list_namespaces_all() will keep making API calls
+    mocked_responses.get(
+        constants.SCALEWAY_FNC_API_URL + "/namespaces",
+        json={"namespaces": []},
+    )
+    # The namespace is up to date, it is neither updated nor polled
+    digest = digest_with_secrets(ARCHIVE.digest, {"token": "secret"})
+    deployed_fn = {
+        "id": "function-id",
+        "name": function.name,
+        "status": sdk.FunctionStatus.READY,
+        "runtime": RUNTIME,
+        "privacy": sdk.FunctionPrivacy.PUBLIC,
+        "http_option": sdk.FunctionHttpOption.REDIRECTED,
+        "handler": "handler",
+        "environment_variables": {DIGEST_ENV_VAR: digest},
+        "secret_environment_variables": [{"key": "token", "hashed_value": "hash"}],
+    }
+    mocked_responses.get(
+        constants.SCALEWAY_FNC_API_URL + "/functions",
+        match=[
+            matchers.query_param_matcher({"namespace_id": namespace["id"], "page": 1}),
+        ],
+        json={"functions": [deployed_fn]},
+    )
     mocked_responses.get(
-        f'{ constants.SCALEWAY_FNC_API_URL}/crons/{cron["id"]}',
-        json=mocked_fn | {"status": sdk.CronStatus.READY},
+        constants.SCALEWAY_FNC_API_URL + "/functions",
+        match=[
+            matchers.query_param_matcher({"namespace_id": namespace["id"], "page": 2}),
+        ],
+        json={"functions": []},
+    )
+    mocked_responses.get(
+        constants.SCALEWAY_FNC_API_URL + "/crons",
+        match=[
+            matchers.query_param_matcher({"function_id": deployed_fn["id"], "page": 1})
+        ],
+        json={"crons": []},
     )
+    # No upload nor deployment is expected
     backend.deploy()
+    backend._upload_deployment_zip.assert_not_called()  # type: ignore
+
+
+@pytest.mark.parametrize("up_to_date", [True, False])
+def test_deploy_uses_the_state(
+    tmp_path, mocked_responses: responses.RequestsMock, up_to_date: bool
+):
+    digest = digest_with_secrets(ARCHIVE.digest, None)
+    function = Function(name="test-function", handler_path="handler")
+    backend = get_test_backend()
+    backend.app_instance.functions = [function]
+    backend.state_file = str(tmp_path / "state.json")
+    project_id, region = backend.sdk_client.default_project_id, constants.DEFAULT_REGION
+    DeploymentState(
+        service_name=backend.app_instance.service_name,
+        project_id=project_id,
+        region=region,
+        namespace_id="namespace-id",
+        functions={
+            "test-function": FunctionState(
+                "function-id",
+                "old-domain",
+                # The function was deployed again since the state was recorded
+                digest if up_to_date else "outdated-digest",
+            )
+        },
+    ).save(backend.state_file)
+
+    namespace = {
+        "id": "namespace-id",
+        "name": backend.app_instance.service_name,
+        "secret_environment_variables": [],  # Otherwise breaks the marshalling
+        "status": sdk.NamespaceStatus.READY,
+        "environment_variables": {
+            NAMESPACE_DIGEST_ENV_VAR: salted_secrets_digest(None)
+        },
+    }
+    # The namespace is fetched by id instead of being listed
+    mocked_responses.get(
+        f'{constants.SCALEWAY_FNC_API_URL}/namespaces/{namespace["id"]}',
+        json=namespace,
+    )
+    deployed_fn = {
+        "id": "function-id",
+        "name": function.name,
+        "status": sdk.FunctionStatus.READY,
+        "runtime": RUNTIME,
+        "privacy": sdk.FunctionPrivacy.PUBLIC,
+        "http_option": sdk.FunctionHttpOption.REDIRECTED,
+        "handler": "handler",
+        "domain_name": "domain",
+        "environment_variables": {DIGEST_ENV_VAR: digest},
+        "secret_environment_variables": [],
+        "namespace_id": namespace["id"],
+    }
+    # The recorded function is fetched by id
+    mocked_responses.get(
+        f'{constants.SCALEWAY_FNC_API_URL}/functions/{deployed_fn["id"]}',
+        json=deployed_fn,
+    )
+    if not up_to_date:
+        # Listed as other resources may have been deployed as well
+        mock_functions_listing(mocked_responses, namespace["id"], [deployed_fn])
+    # The function had no crons and has no triggers, its crons are not listed
+    backend.deploy()
+
+    state = load_state(
+        backend.app_instance.service_name, backend.sdk_client, backend.state_file
+    )
+    assert state
+    assert state.functions == {
+        "test-function": FunctionState(
+            "function-id",
+            "domain",
+            deployed_fn["environment_variables"][DIGEST_ENV_VAR],
+        )
+    }
+
+
+def test_deploy_function_records_digest_once_deployed():
+    function = Function(name="test-function", handler_path="handler")
+    backend = get_test_backend()
+    backend.api = MagicMock()
+    backend.api.create_function.return_value = MagicMock(id="function-id")
+    backend._upload_deployment_zip.side_effect = KeyboardInterrupt  # type: ignore
+    inventory = NamespaceInventory(namespace_id="namespace-id")
+
+    # The digest must not match code which was not deployed
+    with pytest.raises(KeyboardInterrupt):
+        backend._deploy_function(function, inventory, ARCHIVE)
+    assert backend.api.create_function.call_args.kwargs["digest"] == ""
+    backend.api.update_function.assert_not_called()
+
+    backend._upload_deployment_zip.side_effect = None  # type: ignore
+    backend._deploy_function(function, inventory, ARCHIVE)
+    backend.api.update_function.assert_called_once()
+    assert backend.api.update_function.call_args.kwargs == {
+        "function_id": "function-id",
+        "function": function,
+        "runtime": RUNTIME,
+        "digest": digest_with_secrets(ARCHIVE.digest, None),
+        "redeploy": False,
+    }
+
+
+def test_deploy_triggers_without_waiting_for_other_functions():
+    trigger = CronTrigger(schedule="* * * * * *", name="test-cron")
+    fast = Function(name="fast", handler_path="handler", triggers=[trigger])
+    slow = Function(name="slow", handler_path="handler")
+    backend = get_test_backend()
+    backend.app_instance.functions = [slow, fast]
+    backend._get_or_create_namespace = MagicMock(  # type: ignore
+        return_value=MagicMock(id="namespace-id")
+    )
+    backend.api.list_inventory = MagicMock(  # type: ignore
+        return_value=NamespaceInventory(namespace_id="namespace-id")
+    )
+
+    trigger_deployed = threading.Event()
+
+    def deploy_function(function: Function, *_) -> sdk.Function:
+        if function is slow:
+            # Only returns once the trigger of the other function is deployed
+            assert trigger_deployed.wait(timeout=10)
+        return MagicMock(id=f"{function.name}-id", status=sdk.FunctionStatus.READY)
+
+    def deploy_cron_trigger(function_id: str, *_) -> sdk.Cron:
+        assert function_id == "fast-id"
+        trigger_deployed.set()
+        return MagicMock(id="cron-id", status=sdk.CronStatus.READY)
+
+    backend._deploy_function = deploy_function  # type: ignore
+    backend._deploy_cron_trigger = deploy_cron_trigger  # type: ignore
+    backend.deploy()
+
+    assert trigger_deployed.is_set()
+
+
+def test_plan_compares_with_the_inventory():
+    trigger = CronTrigger(schedule="* * * * * *", name="test-cron", args={"a": 1})
+    function = Function(
+        name="test-function", handler_path="handler", triggers=[trigger]
+    )
+    new_function = Function(name="new-function", handler_path="handler")
+    backend = get_test_backend()
+    backend.single_source = True
+    backend.app_instance.functions = [function, new_function]
+
+    digest = digest_with_secrets(ARCHIVE.digest, None)
+    deployed_fn = unmarshal_Function(
+        {
+            "id": "function-id",
+            "name": function.name,
+            "status": sdk.FunctionStatus.READY,
+            "runtime": RUNTIME,
+            "privacy": sdk.FunctionPrivacy.PUBLIC,
+            "http_option": sdk.FunctionHttpOption.REDIRECTED,
+            "handler": "handler",
+            "environment_variables": {DIGEST_ENV_VAR: digest},
+            "secret_environment_variables": [],
+        }
+    )
+    stale_fn = unmarshal_Function(
+        {"id": "stale-id", "name": "stale", "secret_environment_variables": []}
+    )
+    crons = [
+        unmarshal_Cron(
+            {
+                "id": "cron-id",
+                "function_id": "function-id",
+                "name": trigger.name,
+                "schedule": "0 * * * * *",
+                "args": {"a": 1},
+            }
+        ),
+        unmarshal_Cron(
+            {"id": "old-cron-id", "function_id": "function-id", "name": "old"}
+        ),
+    ]
+    backend.api.find_deployed_namespace = MagicMock()  # type: ignore
+    backend.api.list_inventory = MagicMock(  # type: ignore
+        return_value=NamespaceInventory(
+            namespace_id="namespace-id",
+            functions=[deployed_fn, stale_fn],
+            crons=crons,
+        )
+    )
+
+    plan = backend.plan()
+
+    assert [(change.kind, change.name, change.action) for change in plan.changes] == [
+        (ResourceKind.NAMESPACE, "test-namespace", Action.UPDATE),
+        (ResourceKind.FUNCTION, function.name, Action.NO_OP),
+        (ResourceKind.CRON, trigger.name, Action.UPDATE),
+        (ResourceKind.FUNCTION, new_function.name, Action.CREATE),
+        (ResourceKind.FUNCTION, "stale", Action.DELETE),
+        (ResourceKind.CRON, "old", Action.DELETE),
+    ]
+
+
+def test_plan_compares_with_the_gateway_routes():
+    functions = [
+        Function(
+            name=name,
+            handler_path="handler",
+            gateway_route=GatewayRoute(f"/{name}", [HTTPMethod.GET]),
+        )
+        for name in ["hello", "update", "new"]
+    ]
+    backend = get_test_backend()
+    backend.app_instance.functions = functions
+    deployed = [
+        unmarshal_Function(
+            {
+                "id": f"{name}-id",
+                "name": name,
+                "domain_name": f"{name}.test",
+                "secret_environment_variables": [],
+            }
+        )
+        for name in ["hello", "update"]
+    ]
+    backend.api.find_deployed_namespace = MagicMock()  # type: ignore
+    backend.api.list_inventory = MagicMock(  # type: ignore
+        return_value=NamespaceInventory(namespace_id="namespace-id", functions=deployed)
+    )
+    gateway = InMemoryGateway(
+        [
+            GatewayRoute("/hello", [HTTPMethod.GET], "https://hello.test"),
+            GatewayRoute("/update", [HTTPMethod.POST], "https://update.test"),
+            GatewayRoute("/orphan", None, "https://orphan.test"),
+        ]
+    )
+
+    plan = backend.plan(gateway=gateway, prune_routes=True)
+
+    routes = [
+        (change.name, change.action)
+        for change in plan.changes
+        if change.kind is ResourceKind.ROUTE
+    ]
+    assert routes == [
+        ("/hello", Action.NO_OP),
+        ("/update", Action.UPDATE),
+        ("/new", Action.CREATE),
+        ("/orphan", Action.DELETE),
+    ]
+    # The plan does not change the gateway
+    assert not gateway.applied
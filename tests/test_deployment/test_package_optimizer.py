@@ -0,0 +1,123 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from scw_serverless.deployment.package_optimizer import PackageOptimizer, PruneRules
+from scw_serverless.import_graph import ImportGraph
+from scw_serverless.utils.archive import list_archive_files
+
+RUNTIME = f"python{sys.version_info[0]}{sys.version_info[1]}"
+TAG = f"cpython-{sys.version_info[0]}{sys.version_info[1]}"
+
+
+def write_files(root: Path, files: list[str]) -> None:
+    for file in files:
+        path = root.joinpath(file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("VALUE = 1\n", encoding="utf-8")
+
+
+def test_package_optimizer_prunes_and_precompiles(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.chdir(tmp_path)
+    write_files(
+        tmp_path,
+        [
+            "handler.py",
+            "package/lib/__init__.py",
+            "package/lib/core.py",
+            "package/lib/core.pyi",
+            "package/lib/tests/test_core.py",
+            "package/lib/__pycache__/core.cpython-36.pyc",
+            "package/lib-1.0.dist-info/METADATA",
+            "package/lib-1.0.dist-info/RECORD",
+            "package/lib/README.md",
+            "package/lib/CHANGES.md",
+        ],
+    )
+    optimizer = PackageOptimizer(
+        RUNTIME, rules=PruneRules(patterns=("*.md",), keep=("*/README.md",))
+    )
+    optimizer.prepare()
+    archived = set(
+        list_archive_files(".", exclude=[".scw"], ignore=optimizer.is_pruned)
+    )
+
+    assert {
+        "handler.py",
+        "package/lib/__init__.py",
+        "package/lib/core.py",
+        "package/lib/core.pyi",
+        "package/lib/README.md",
+        "package/lib-1.0.dist-info/METADATA",
+        "package/lib-1.0.dist-info/RECORD",
+        f"package/lib/__pycache__/core.{TAG}.pyc",
+        # Only the bytecode of the runtime is kept
+        f"package/lib/__pycache__/__init__.{TAG}.pyc",
+        f"package/lib/tests/__pycache__/test_core.{TAG}.pyc",
+        "package/lib/tests/test_core.py",
+    } == archived
+    assert optimizer.pruned_files == 2
+    assert optimizer.count_compiled(list(archived)) == 3
+
+
+def test_package_optimizer_default_rules(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.chdir(tmp_path)
+    write_files(
+        tmp_path,
+        [
+            "package/lib/core.py",
+            "package/lib/tests/test_core.py",
+            "package/lib-1.0.dist-info/METADATA",
+            "package/lib-1.0.dist-info/RECORD",
+            "package/bin/lib",
+        ],
+    )
+    optimizer = PackageOptimizer(RUNTIME)
+    optimizer.prepare()
+    archived = set(
+        list_archive_files(".", exclude=[".scw"], ignore=optimizer.is_pruned)
+    )
+
+    assert archived == {
+        "package/lib/core.py",
+        f"package/lib/__pycache__/core.{TAG}.pyc",
+        "package/lib-1.0.dist-info/METADATA",
+    }
+    assert optimizer.unpack_seconds_saved > 0
+
+    # The sources are not compiled again when they did not change
+    pyc = tmp_path.joinpath(f"package/lib/__pycache__/core.{TAG}.pyc")
+    mtime = pyc.stat().st_mtime_ns
+    PackageOptimizer(RUNTIME).prepare()
+    assert pyc.stat().st_mtime_ns == mtime
+
+
+def test_package_optimizer_with_function_archives(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.chdir(tmp_path)
+    write_files(
+        tmp_path, ["package/lib/__init__.py", "package/lib-1.0.dist-info/METADATA"]
+    )
+    tmp_path.joinpath("handler.py").write_text("import lib\n", encoding="utf-8")
+    tmp_path.joinpath("package/lib-1.0.dist-info/RECORD").write_text(
+        "lib/__init__.py,,\nlib-1.0.dist-info/METADATA,,\n", encoding="utf-8"
+    )
+    optimizer = PackageOptimizer(RUNTIME)
+    optimizer.prepare()
+    archived = list_archive_files(".", exclude=[".scw"], ignore=optimizer.is_pruned)
+
+    # The archive of a function keeps the bytecode, which is not recorded
+    graph = ImportGraph(tmp_path, tmp_path.joinpath("package"))
+    required = graph.get_required_files(tmp_path.joinpath("handler.py"))
+    assert {file for file in archived if file in required} == {
+        "handler.py",
+        "package/lib/__init__.py",
+        f"package/lib/__pycache__/__init__.{TAG}.pyc",
+        "package/lib-1.0.dist-info/METADATA",
+    }
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import pytest
+
+from scw_serverless.deployment.status_poller import PollingOptions, StatusPoller
+
+OPTIONS = PollingOptions(min_interval=0.01, max_interval=0.05, timeout=5)
+
+
+@dataclass
+class Resource:
+    id: str  # pylint: disable=invalid-name
+    status: str
+
+
+def test_status_poller_batches_waiters():
+    # Each resource becomes ready after a number of polls
+    ready_after = {"a": 1, "b": 3, "c": 5}
+    poller: StatusPoller[Resource] = StatusPoller(
+        lambda: [
+            Resource(resource_id, "ready" if poller.polls >= polls else "pending")
+            for resource_id, polls in ready_after.items()
+        ],
+        lambda resource: resource.status != "pending",
+        OPTIONS,
+    )
+
+    with ThreadPoolExecutor() as executor:
+        resources = list(executor.map(poller.wait, ready_after))
+
+    assert [resource.id for resource in resources] == ["a", "b", "c"]
+    assert all(resource.status == "ready" for resource in resources)
+    # All the waiters share the same polls
+    assert poller.polls == 5
+
+
+def test_status_poller_raises_errors_to_waiters():
+    def list_resources() -> list[Resource]:
+        raise RuntimeError("unavailable")
+
+    poller = StatusPoller(list_resources, lambda _: True, OPTIONS)
+    with pytest.raises(RuntimeError, match="unavailable"):
+        poller.wait("a")
+
+
+def test_status_poller_times_out():
+    poller = StatusPoller(
+        lambda: [Resource("a", "pending")],
+        lambda resource: resource.status != "pending",
+        PollingOptions(min_interval=0.01, max_interval=0.05, timeout=0.2),
+    )
+    with pytest.raises(TimeoutError):
+        poller.wait("a")
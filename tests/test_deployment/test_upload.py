@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterable
+
+import pytest
+
+from scw_serverless.deployment.build_cache import DeploymentArchive
+from scw_serverless.deployment.upload import ArchiveUploader
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    received: dict[str, bytes] = {}
+    lock = threading.Lock()
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with self.lock:
+            self.received[self.path] = body
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture(name="server_url")
+def start_upload_server() -> Iterable[str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UploadHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    UploadHandler.received.clear()
+
+
+def test_uploader_shares_the_archive(server_url: str, tmp_path: Path):
+    content = bytes(range(256)) * 4096
+    zip_path = tmp_path / "deployment.zip"
+    zip_path.write_bytes(content)
+    archive = DeploymentArchive(path=str(zip_path), size=len(content), digest="")
+
+    uploader = ArchiveUploader(max_uploads=2)
+    urls = [f"{server_url}/function-{i}" for i in range(5)]
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        list(executor.map(lambda url: uploader.upload(url, archive), urls))
+
+    assert len(uploader._maps) == 1  # pylint: disable=protected-access
+    uploader.close()
+    assert UploadHandler.received == {f"/function-{i}": content for i in range(5)}
@@ -0,0 +1,121 @@
+import ast
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from scw_serverless import loader
+from scw_serverless.config.route import HTTPMethod
+from scw_serverless.discovery import (
+    NotStaticError,
+    _handler_stub,
+    discover_app_instance,
+)
+
+FIXTURES = Path(__file__).parent.joinpath("app_fixtures")
+
+
+@pytest.mark.parametrize(
+    "fixture", ["app.py", "cron_app.py", "multiple_functions.py", "routed_functions.py"]
+)
+def test_discover_app_instance_without_running_module(fixture: str):
+    file = FIXTURES.joinpath(fixture).relative_to(Path.cwd())
+    module_name = loader.get_module_name(file)
+
+    discovered = discover_app_instance(file, module_name)
+    loaded = loader.load_app_instance(file)
+
+    assert discovered.service_name == loaded.service_name
+    assert discovered.functions == loaded.functions
+
+
+def write_app(tmp_path: Path, source: str) -> Path:
+    file = tmp_path.joinpath("handler.py")
+    file.write_text(textwrap.dedent(source))
+    return file
+
+
+def test_discover_app_instance_with_constants(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.chdir(tmp_path)
+    file = write_app(
+        tmp_path,
+        """
+        import scw_serverless
+        from scw_serverless.config import triggers
+
+        NAME = "constants"
+        MEMORY = 512
+
+        app = scw_serverless.Serverless(NAME, env={"KEY": "value"})
+        raise RuntimeError("The module is not executed")
+
+        @app.schedule(triggers.CronTrigger.from_parts("0", "9", "*", "*", "1-5"))
+        def remind(event, context):
+            ...
+
+        @app.patch("/items", memory_limit=MEMORY)
+        async def update_items(event, context):
+            \"\"\"Update the items.\"\"\"
+        """,
+    )
+
+    app_instance = loader.load_app_instance(file, static=True)
+
+    assert app_instance.env == {"KEY": "value"}
+    remind, update = app_instance.functions
+    assert remind.triggers[0].schedule == "0 9 * * 1-5"
+    assert update.name == "update-items"
+    assert update.handler_path == "handler.update_items"
+    assert update.description == "Update the items."
+    assert update.memory_limit == 512
+    assert update.gateway_route
+    assert update.gateway_route.http_methods == [HTTPMethod.PATCH]
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        # Non-literal arguments
+        """
+        import os
+        from scw_serverless import Serverless
+        app = Serverless("app", secret={"KEY": os.environ["KEY"]})
+        """,
+        # The app is changed by the module
+        """
+        from scw_serverless import Serverless
+        app = Serverless("app")
+        app.service_name = "other"
+        """,
+        # Handlers are registered by a local module
+        """
+        from scw_serverless import Serverless
+        app = Serverless("app")
+        import routes
+        """,
+    ],
+)
+def test_discover_app_instance_falls_back(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, source: str
+):
+    monkeypatch.chdir(tmp_path)
+    tmp_path.joinpath("routes.py").write_text(
+        "from handler import app\n\n@app.get('/')\ndef index(e, c): ...\n"
+    )
+    file = write_app(tmp_path, source)
+
+    with pytest.raises(NotStaticError):
+        discover_app_instance(file, "handler")
+
+
+def test_discovered_handlers_cannot_be_called():
+    node = ast.parse("def handle(event, context): ...").body[0]
+    assert isinstance(node, ast.FunctionDef)
+
+    handler = _handler_stub(node, "handler")
+
+    assert handler.__module__ == "handler"
+    with pytest.raises(RuntimeError, match="handler.handle .* cannot be called"):
+        handler({}, {})
@@ -0,0 +1,25 @@
+import dataclasses
+
+from scw_serverless.config.route import GatewayRoute
+from scw_serverless.gateway.route_diff import RouteDiff
+
+
+class InMemoryGateway:
+    """Gateway keeping its routes in memory, for testing.
+
+    :param applied: diffs applied to the gateway
+    """
+
+    def __init__(self, routes: list[GatewayRoute]) -> None:
+        self.routes = {route.relative_url: route for route in routes}
+        self.applied: list[RouteDiff] = []
+
+    def list_routes(self) -> list[GatewayRoute]:
+        return [dataclasses.replace(route) for route in self.routes.values()]
+
+    def apply_routes(self, diff: RouteDiff) -> None:
+        self.applied.append(diff)
+        for route in diff.to_add + diff.to_update:
+            self.routes[route.relative_url] = dataclasses.replace(route)
+        for route in diff.to_delete:
+            del self.routes[route.relative_url]
@@ -8,8 +8,11 @@ from scaleway import Client
 from scw_serverless.app import Serverless
 from scw_serverless.config import Function
 from scw_serverless.config.route import GatewayRoute, HTTPMethod
+from scw_serverless.deployment.state import DeploymentState, FunctionState
 from scw_serverless.gateway.gateway_manager import GatewayManager
+from scw_serverless.gateway.route_diff import RouteDiff
 from tests import constants
+from tests.test_gateway.memory_gateway import InMemoryGateway
 
 HELLO_WORLD_MOCK_DOMAIN = (
     "helloworldfunctionnawns8i8vo-hello-world.functions.fnc.fr-par.scw.cloud"
@@ -32,7 +35,11 @@ def app_gateway_manager() -> GatewayManager:
         secret_key="498cce73-2a07-4e8c-b8ef-8f988e3c6929",  # nosec # false positive
         default_region=constants.DEFAULT_REGION,
     )
-    return GatewayManager(app_instance=app, gateway=MagicMock(), sdk_client=client)
+    gateway = MagicMock()
+    gateway.list_routes.return_value = []
+    return GatewayManager(
+        app_instance=app, gateway=gateway, sdk_client=client, state_file=None
+    )
 
 
 def test_gateway_manager_update_routes(
@@ -88,6 +95,164 @@ def test_gateway_manager_update_routes(
     gateway_route.target = HELLO_WORLD_MOCK_DOMAIN
 
     gateway_mock = app_gateway_manager.gateway
-    gateway_mock.add_route.assert_called_once_with(
-        gateway_route,
+    gateway_mock.apply_routes.assert_called_once_with(
+        RouteDiff(to_add=[gateway_route]),
+    )
+
+
+def test_gateway_manager_update_routes_from_state(
+    tmp_path, app_gateway_manager: GatewayManager
+):
+    gateway_route = GatewayRoute(relative_url="/hello", http_methods=[HTTPMethod.GET])
+    function = Function(
+        name="test-function",
+        handler_path="handler",
+        gateway_route=gateway_route,
     )
+    app_gateway_manager.app_instance.functions = [function]
+    app_gateway_manager.state_file = str(tmp_path / "state.json")
+    DeploymentState(
+        service_name=app_gateway_manager.app_instance.service_name,
+        project_id=app_gateway_manager.sdk_client.default_project_id,
+        region=constants.DEFAULT_REGION,
+        namespace_id="namespace-id",
+        functions={
+            function.name: FunctionState("function-id", HELLO_WORLD_MOCK_DOMAIN)
+        },
+    ).save(app_gateway_manager.state_file)
+
+    # No API call is made
+    with responses.RequestsMock():
+        app_gateway_manager.update_routes()
+
+    assert gateway_route.target == "https://" + HELLO_WORLD_MOCK_DOMAIN
+    app_gateway_manager.gateway.apply_routes.assert_called_once_with(
+        RouteDiff(to_add=[gateway_route])
+    )
+
+
+def save_state(
+    manager: GatewayManager, functions: list[Function], state_file: str
+) -> None:
+    manager.app_instance.functions = functions
+    manager.state_file = state_file
+    DeploymentState(
+        service_name=manager.app_instance.service_name,
+        project_id=manager.sdk_client.default_project_id,
+        region=constants.DEFAULT_REGION,
+        namespace_id="namespace-id",
+        functions={
+            function.name: FunctionState(function.name, f"{function.name}.test")
+            for function in functions
+        },
+    ).save(state_file)
+
+
+def test_gateway_manager_reconciles_routes(
+    tmp_path, app_gateway_manager: GatewayManager
+):
+    functions = [
+        Function(
+            name=name,
+            handler_path="handler",
+            gateway_route=GatewayRoute(relative_url=url, http_methods=[method]),
+        )
+        for name, url, method in [
+            ("hello", "/hello", HTTPMethod.GET),
+            ("update", "/update", HTTPMethod.POST),
+            ("new", "/new", HTTPMethod.GET),
+        ]
+    ]
+    save_state(app_gateway_manager, functions, str(tmp_path / "state.json"))
+    gateway = InMemoryGateway(
+        [
+            GatewayRoute("/hello", [HTTPMethod.GET], "https://hello.test"),
+            GatewayRoute("/update", [HTTPMethod.GET], "https://update.test"),
+            GatewayRoute("/orphan", None, "https://orphan.test"),
+        ]
+    )
+    app_gateway_manager.gateway = gateway
+
+    with responses.RequestsMock():
+        diff = app_gateway_manager.update_routes(prune=True)
+
+    assert [route.relative_url for route in diff.to_add] == ["/new"]
+    assert [route.relative_url for route in diff.to_update] == ["/update"]
+    assert [route.relative_url for route in diff.to_delete] == ["/orphan"]
+    assert [route.relative_url for route in diff.unchanged] == ["/hello"]
+    # The routes of the gateway exactly match the routes of the app
+    assert sorted(gateway.list_routes(), key=lambda r: r.relative_url) == [
+        GatewayRoute("/hello", [HTTPMethod.GET], "https://hello.test"),
+        GatewayRoute("/new", [HTTPMethod.GET], "https://new.test"),
+        GatewayRoute("/update", [HTTPMethod.POST], "https://update.test"),
+    ]
+
+    # Nothing is applied when the routes are up to date
+    with responses.RequestsMock():
+        diff = app_gateway_manager.update_routes(prune=True)
+    assert not diff.has_changes
+    assert len(gateway.applied) == 1
+
+
+def test_gateway_manager_keeps_routes_without_pruning(
+    tmp_path, app_gateway_manager: GatewayManager
+):
+    function = Function(
+        name="hello",
+        handler_path="handler",
+        gateway_route=GatewayRoute(relative_url="/hello"),
+    )
+    save_state(app_gateway_manager, [function], str(tmp_path / "state.json"))
+    gateway = InMemoryGateway([GatewayRoute("/other", None, "https://other.test")])
+    app_gateway_manager.gateway = gateway
+
+    with responses.RequestsMock():
+        diff = app_gateway_manager.update_routes()
+
+    assert not diff.to_delete
+    assert sorted(route.relative_url for route in gateway.list_routes()) == [
+        "/hello",
+        "/other",
+    ]
+
+
+def test_gateway_manager_rejects_duplicate_routes(
+    tmp_path, app_gateway_manager: GatewayManager
+):
+    functions = [
+        Function(
+            name=name,
+            handler_path="handler",
+            gateway_route=GatewayRoute(relative_url="/hello"),
+        )
+        for name in ["hello", "hello-again"]
+    ]
+    save_state(app_gateway_manager, functions, str(tmp_path / "state.json"))
+    app_gateway_manager.gateway = InMemoryGateway([])
+
+    with pytest.raises(RuntimeError, match="multiple functions"):
+        app_gateway_manager.update_routes()
+
+
+def test_gateway_manager_cannot_prune_unlisted_routes(
+    tmp_path, app_gateway_manager: GatewayManager
+):
+    function = Function(
+        name="hello",
+        handler_path="handler",
+        gateway_route=GatewayRoute(relative_url="/hello"),
+    )
+    save_state(app_gateway_manager, [function], str(tmp_path / "state.json"))
+    # Like scwgw, the gateway cannot list its routes
+    gateway = MagicMock()
+    gateway.list_routes.return_value = None
+    app_gateway_manager.gateway = gateway
+
+    with pytest.raises(RuntimeError, match="cannot be pruned"):
+        app_gateway_manager.update_routes(prune=True)
+    gateway.apply_routes.assert_not_called()
+
+    # Without pruning, every route is applied
+    with responses.RequestsMock():
+        diff = app_gateway_manager.update_routes()
+    assert [route.relative_url for route in diff.to_add] == ["/hello"]
@@ -0,0 +1,99 @@
+import pytest
+import responses
+from responses.matchers import json_params_matcher
+
+from scw_serverless.config.route import GatewayRoute, HTTPMethod
+from scw_serverless.gateway.kong_gateway import KongGateway
+from scw_serverless.gateway.route_diff import diff_routes
+
+ADMIN_URL = "https://admin.gateway.test"
+HELLO_DOMAIN = "hello.functions.fnc.fr-par.scw.cloud"
+BYE_DOMAIN = "bye.functions.fnc.fr-par.scw.cloud"
+
+
+# pylint: disable=redefined-outer-name # fixture
+@pytest.fixture
+def mocked_responses():
+    with responses.RequestsMock() as rsps:
+        yield rsps
+
+
+def mock_list_routes(mocked_responses: responses.RequestsMock) -> None:
+    mocked_responses.get(
+        ADMIN_URL + "/services",
+        json={
+            "data": [
+                {"id": "s1", "protocol": "https", "host": HELLO_DOMAIN, "port": 443},
+                {"id": "s2", "protocol": "https", "host": BYE_DOMAIN, "port": 443},
+            ],
+            "next": None,
+        },
+    )
+    # Routes are listed on two pages
+    mocked_responses.get(
+        ADMIN_URL + "/routes",
+        json={
+            "data": [
+                {"paths": ["/hello"], "methods": ["GET"], "service": {"id": "s1"}}
+            ],
+            "next": "/routes?offset=abc",
+        },
+    )
+    mocked_responses.get(
+        ADMIN_URL + "/routes?offset=abc",
+        json={
+            "data": [{"paths": ["/bye"], "methods": None, "service": {"id": "s2"}}],
+            "next": None,
+        },
+    )
+
+
+def test_kong_gateway_list_routes(mocked_responses: responses.RequestsMock):
+    mock_list_routes(mocked_responses)
+
+    routes = KongGateway(ADMIN_URL, token="token").list_routes()
+
+    assert routes == [
+        GatewayRoute("/hello", [HTTPMethod.GET], "https://" + HELLO_DOMAIN),
+        GatewayRoute("/bye", None, "https://" + BYE_DOMAIN),
+    ]
+    assert mocked_responses.calls[0].request.headers["X-Auth-Token"] == "token"
+
+
+def test_kong_gateway_applies_only_changed_routes(
+    mocked_responses: responses.RequestsMock,
+):
+    mock_list_routes(mocked_responses)
+    gateway = KongGateway(ADMIN_URL)
+    desired = [
+        GatewayRoute("/hello", [HTTPMethod.GET], "https://" + HELLO_DOMAIN),
+        GatewayRoute("/bye", [HTTPMethod.POST], "https://" + BYE_DOMAIN),
+        GatewayRoute("/new", None, "https://" + HELLO_DOMAIN),
+    ]
+    diff = diff_routes(gateway.list_routes(), desired)
+    assert diff.unchanged == desired[:1]
+
+    for name, target, methods in [
+        ("_bye", "https://" + BYE_DOMAIN, ["POST"]),
+        ("_new", "https://" + HELLO_DOMAIN, None),
+    ]:
+        mocked_responses.put(
+            f"{ADMIN_URL}/services/{name}",
+            match=[json_params_matcher({"name": name, "url": target})],
+        )
+        mocked_responses.put(
+            f"{ADMIN_URL}/routes/{name}",
+            match=[
+                json_params_matcher(
+                    {
+                        "name": name,
+                        "paths": [name.replace("_", "/")],
+                        "service": {"name": name},
+                        "methods": methods,
+                    }
+                )
+            ],
+        )
+
+    # The unchanged route is not sent again
+    gateway.apply_routes(diff)
@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Iterable
+
+import pytest
+
+from scw_serverless.import_graph import ImportGraph
+
+
+def add_distribution(package_dir: Path, name: str, requires: list[str]) -> None:
+    module_dir = package_dir.joinpath(name)
+    module_dir.mkdir()
+    module_dir.joinpath("__init__.py").write_text("", encoding="utf-8")
+    dist_info = package_dir.joinpath(f"{name}-1.0.0.dist-info")
+    dist_info.mkdir()
+    dist_info.joinpath("METADATA").write_text(
+        f"Name: {name}\n"
+        + "".join(f"Requires-Dist: {requirement}\n" for requirement in requires),
+        encoding="utf-8",
+    )
+    dist_info.joinpath("RECORD").write_text(
+        f"{name}/__init__.py,,\n"
+        + f"{name}-1.0.0.dist-info/METADATA,,\n"
+        + f"{name}-1.0.0.dist-info/RECORD,,\n"
+        + f"../../bin/{name},,\n",
+        encoding="utf-8",
+    )
+
+
+@pytest.fixture(name="project_dir")
+def clean_up_project_dir() -> Iterable[Path]:
+    folder = Path(tempfile.mkdtemp())
+    package_dir = folder.joinpath("package")
+    package_dir.mkdir()
+    add_distribution(
+        package_dir, "requests", ["urllib3 (<3)", "pytest ; extra == 'test'"]
+    )
+    add_distribution(package_dir, "urllib3", [])
+    add_distribution(package_dir, "boto3", [])
+
+    folder.joinpath("handlers").mkdir()
+    folder.joinpath("handlers", "__init__.py").write_text("", encoding="utf-8")
+    folder.joinpath("handlers", "query.py").write_text(
+        "import os\nfrom . import utils\ndef handle(event, context): ...\n",
+        encoding="utf-8",
+    )
+    folder.joinpath("handlers", "utils.py").write_text(
+        "import requests\n", encoding="utf-8"
+    )
+    folder.joinpath("handlers", "template.html").write_text(
+        "<html></html>", encoding="utf-8"
+    )
+    folder.joinpath("handlers", "upload.py").write_text(
+        "import boto3\n", encoding="utf-8"
+    )
+    yield folder
+    shutil.rmtree(folder)
+
+
+def test_import_graph_get_required_files(project_dir: Path):
+    graph = ImportGraph(project_dir, project_dir.joinpath("package"))
+
+    required = graph.get_required_files(project_dir.joinpath("handlers", "query.py"))
+
+    assert required == {
+        "handlers/__init__.py",
+        "handlers/query.py",
+        "handlers/utils.py",
+        "handlers/template.html",
+        "package/requests/__init__.py",
+        "package/requests-1.0.0.dist-info/METADATA",
+        "package/requests-1.0.0.dist-info/RECORD",
+        "package/urllib3/__init__.py",
+        "package/urllib3-1.0.0.dist-info/METADATA",
+        "package/urllib3-1.0.0.dist-info/RECORD",
+    }
+
+
+def test_import_graph_get_required_files_with_bytecode(project_dir: Path):
+    # Written by the optimizer, the bytecode is not recorded by the distribution
+    cache_dir = project_dir.joinpath("package", "requests", "__pycache__")
+    cache_dir.mkdir()
+    cache_dir.joinpath("__init__.cpython-311.pyc").write_bytes(b"")
+    cache_dir.joinpath("adapters.cpython-311.pyc").write_bytes(b"")
+    boto3_cache_dir = project_dir.joinpath("package", "boto3", "__pycache__")
+    boto3_cache_dir.mkdir()
+    boto3_cache_dir.joinpath("__init__.cpython-311.pyc").write_bytes(b"")
+    graph = ImportGraph(project_dir, project_dir.joinpath("package"))
+
+    required = graph.get_required_files(project_dir.joinpath("handlers", "query.py"))
+
+    assert "package/requests/__pycache__/__init__.cpython-311.pyc" in required
+    # Only the bytecode of the required files is included
+    assert "package/requests/__pycache__/adapters.cpython-311.pyc" not in required
+    assert "package/boto3/__pycache__/__init__.cpython-311.pyc" not in required
@@ -0,0 +1,110 @@
+import sys
+import textwrap
+from importlib.metadata import PackageNotFoundError
+from pathlib import Path
+
+import pytest
+
+from scw_serverless import loader, manifest
+from scw_serverless.config.route import HTTPMethod
+
+HANDLER = """
+import constants
+from scw_serverless import Serverless
+
+# Counts the executions of the module
+with open("executions.txt", "a") as executions:
+    executions.write(".")
+
+app = Serverless("manifest", env={"VALUE": constants.VALUE})
+
+@app.get("/hello", memory_limit=constants.MEMORY)
+def hello(event, context):
+    return "Hello"
+
+@app.schedule("0 9 * * *", inputs={"name": "cron"})
+def remind(event, context):
+    return "Reminder"
+"""
+
+
+@pytest.fixture(name="project_dir")
+def create_project_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.chdir(tmp_path)
+    # The loader adds the folder of the app to the path
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    tmp_path.joinpath("handler.py").write_text(textwrap.dedent(HANDLER))
+    tmp_path.joinpath("constants.py").write_text(
+        'import os\nVALUE = "1"\nMEMORY = 256\nREGION = os.getenv("REGION")\n'
+    )
+    return tmp_path
+
+
+def load(project_dir: Path):
+    # Each invocation of the CLI imports the modules of the project again
+    sys.modules.pop("constants", None)
+    manifest_file = str(project_dir / ".scw" / "manifest.json")
+    return loader.load_app_instance(
+        project_dir / "handler.py", static=True, manifest_file=manifest_file
+    )
+
+
+def count_executions(project_dir: Path) -> int:
+    return len(project_dir.joinpath("executions.txt").read_text())
+
+
+def test_load_app_instance_from_manifest(project_dir: Path):
+    app_instance = load(project_dir)
+    assert count_executions(project_dir) == 1
+
+    recorded = load(project_dir)
+    # The module is not executed again
+    assert count_executions(project_dir) == 1
+    assert recorded.service_name == app_instance.service_name
+    assert recorded.env == {"VALUE": "1"}
+    assert recorded.functions == app_instance.functions
+    assert recorded.functions[0].gateway_route
+    assert recorded.functions[0].gateway_route.http_methods == [HTTPMethod.GET]
+
+
+def test_manifest_is_invalidated(project_dir: Path, monkeypatch: pytest.MonkeyPatch):
+    load(project_dir)
+
+    # A module imported by the app changed
+    constants = project_dir.joinpath("constants.py")
+    constants.write_text(constants.read_text().replace('"1"', '"2"'))
+    assert load(project_dir).env == {"VALUE": "2"}
+    assert count_executions(project_dir) == 2
+
+    # The environment variables not referenced by the app are left out
+    monkeypatch.setenv("SCW_SERVERLESS_TEST", "1")
+    load(project_dir)
+    assert count_executions(project_dir) == 2
+
+    monkeypatch.setenv("REGION", "fr-par")
+    load(project_dir)
+    assert count_executions(project_dir) == 3
+
+
+def test_manifest_key_without_installed_framework(
+    project_dir: Path, monkeypatch: pytest.MonkeyPatch
+):
+    key = manifest.get_manifest_key(project_dir / "handler.py")
+
+    def version(name: str) -> str:
+        raise PackageNotFoundError(name)
+
+    monkeypatch.setattr(manifest, "version", version)
+    fallback_key = manifest.get_manifest_key(project_dir / "handler.py")
+    assert fallback_key != key
+    assert manifest.get_manifest_key(project_dir / "handler.py") == fallback_key
+
+
+def test_manifest_does_not_record_secrets(project_dir: Path):
+    handler = project_dir.joinpath("handler.py")
+    handler.write_text(handler.read_text().replace("env=", "secret="))
+    load(project_dir)
+    load(project_dir)
+
+    assert count_executions(project_dir) == 2
+    assert not project_dir.joinpath(".scw", "manifest.json").exists()
@@ -0,0 +1,75 @@
+import io
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Iterable
+
+import pytest
+
+from scw_serverless.deployment.build_cache import BuildCache
+from scw_serverless.utils.archive import (
+    ArchiveStream,
+    archive_digest,
+    archive_size,
+    write_archive,
+)
+
+
+@pytest.fixture(name="project_dir")
+def clean_up_project_dir() -> Iterable[Path]:
+    folder = Path(tempfile.mkdtemp())
+    folder.joinpath("package").mkdir()
+    folder.joinpath("handler.py").write_text(
+        "def handle(event, context): ...\n", encoding="utf-8"
+    )
+    folder.joinpath("package", "lib.so").write_bytes(b"\x7fELF" * 1000)
+    folder.joinpath("package", "big.txt").write_bytes(b"0123456789" * 500_000)
+    yield folder
+    shutil.rmtree(folder)
+
+
+def test_archive_stream(project_dir: Path):
+    cache = BuildCache(str(project_dir / ".scw" / "cache"))
+    entries = cache.list_entries(str(project_dir), exclude=[".scw"])
+    expected = io.BytesIO()
+    size = write_archive(expected, entries)
+
+    stream = ArchiveStream(entries, max_chunks=2)
+    assert len(stream) == size == archive_size(entries)
+    streamed = b""
+    while chunk := stream.read(16384):
+        streamed += chunk
+    stream.close()
+
+    assert streamed == expected.getvalue()
+    with zipfile.ZipFile(io.BytesIO(streamed)) as archive:
+        assert archive.testzip() is None
+        assert archive.read("package/big.txt") == b"0123456789" * 500_000
+
+
+def test_archive_stream_reuses_the_cache(project_dir: Path):
+    cache = BuildCache(str(project_dir / ".scw" / "cache"))
+    entries = cache.list_entries(str(project_dir), exclude=[".scw"])
+    archive = cache.stream_archive(entries)
+
+    # Nothing is compressed again when the archive is streamed
+    cache = BuildCache(str(project_dir / ".scw" / "cache"))
+    assert cache.list_entries(str(project_dir), exclude=[".scw"]) == entries
+    assert (cache.hits, cache.misses) == (3, 0)
+    assert archive.path is None
+    assert archive.digest == archive_digest(entries)
+    with archive.open() as stream:
+        assert len(stream.read()) == archive.size
+
+
+def test_archive_stream_detects_truncated_members(project_dir: Path):
+    cache = BuildCache(str(project_dir / ".scw" / "cache"))
+    entries = cache.list_entries(str(project_dir), exclude=[".scw"])
+    big = next(entry for entry in entries if entry.arcname == "package/big.txt")
+    with open(big.data_path, mode="r+b") as fp:
+        fp.truncate(big.compress_size // 2)
+
+    with pytest.raises(ValueError, match="Unexpected end of file"):
+        with ArchiveStream(entries) as stream:
+            stream.read()